@@ -12,7 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.core.database import Base
 from app.core.config import settings
-from app.models import User, Folder, Document
+from app.models import User, Folder, Document, ConversationSession, ConversationTurn
 
 # this is the Alembic Config object
 config = context.config
@@ -0,0 +1,64 @@
+"""Add conversation sessions and turns
+
+Revision ID: 20261016_add_sessions
+Revises: 20251118_add_dedup
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261016_add_sessions'
+down_revision = '20251118_add_dedup'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'conversation_sessions',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('folder_id', sa.Integer(), sa.ForeignKey('folders.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('summary', sa.Text(), nullable=True),
+        sa.Column('summarized_turns', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('retrieved_chunks', sa.JSON(), nullable=True),
+        sa.Column('retrieval_contexts', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    )
+    op.create_index('ix_conversation_sessions_id', 'conversation_sessions', ['id'])
+    op.create_index('ix_conversation_sessions_user_id', 'conversation_sessions', ['user_id'])
+    op.create_index('ix_conversation_sessions_folder_id', 'conversation_sessions', ['folder_id'])
+
+    op.create_table(
+        'conversation_turns',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column(
+            'session_id',
+            sa.Integer(),
+            sa.ForeignKey('conversation_sessions.id', ondelete='CASCADE'),
+            nullable=False
+        ),
+        sa.Column('question', sa.Text(), nullable=False),
+        sa.Column('answer', sa.Text(), nullable=False),
+        sa.Column('sources', sa.JSON(), nullable=True),
+        sa.Column('reused_context', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index('ix_conversation_turns_id', 'conversation_turns', ['id'])
+    op.create_index('ix_conversation_turns_session_id', 'conversation_turns', ['session_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversation_turns_session_id', table_name='conversation_turns')
+    op.drop_index('ix_conversation_turns_id', table_name='conversation_turns')
+    op.drop_table('conversation_turns')
+
+    op.drop_index('ix_conversation_sessions_folder_id', table_name='conversation_sessions')
+    op.drop_index('ix_conversation_sessions_user_id', table_name='conversation_sessions')
+    op.drop_index('ix_conversation_sessions_id', table_name='conversation_sessions')
+    op.drop_table('conversation_sessions')
@@ -0,0 +1,26 @@
+"""Add generation counter to folders
+
+Revision ID: 20261016_add_folder_gen
+Revises: 20261016_add_sessions
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261016_add_folder_gen'
+down_revision = '20261016_add_sessions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Bumped whenever the folder's indexed documents change; folder-scoped
+    # caches in every worker compare against it
+    op.add_column('folders', sa.Column('generation', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('folders', 'generation')
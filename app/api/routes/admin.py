@@ -228,3 +228,48 @@ async def get_worker_health(db: AsyncSession = Depends(get_db)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to get worker health: {str(e)}"
         )
+
+
+@router.get("/cache-stats", response_model=Dict[str, Any])
+async def get_cache_stats():
+    """
+    Get hit/miss counters for the in-process caches and request coalescing.
+
+    Counters are per worker process and reset on restart.
+    """
+    from app.services.embedding_cache import embedding_cache
+    from app.services.answer_cache import answer_cache
+    from app.services.single_flight import single_flight
+    from app.services.key_value_lookup import key_value_lookup
+    from app.services.prefetch_cache import prefetch_cache
+    from app.services.local_index import local_retrieval_engine
+    from app.services.index_stats import index_stats_cache
+    from app.services.retrieval_cache import retrieval_cache
+
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "key_value_lookup": key_value_lookup.stats(),
+        "prefetch": prefetch_cache.stats(),
+        "local_index": local_retrieval_engine.stats(),
+        "index_stats": index_stats_cache.stats(),
+        "retrieval": retrieval_cache.stats()
+    }
+
+
+@router.get("/openai-scheduler", response_model=Dict[str, Any])
+async def get_openai_scheduler_stats():
+    """
+    Get quota utilization and queueing delay per Azure OpenAI deployment.
+
+    token_utilization is tokens admitted in the last minute over the
+    deployment's TPM quota; queue_wait_* is the time calls spent waiting for
+    quota. Counters are per worker process.
+    """
+    from app.services.openai_scheduler import openai_scheduler
+
+    return {
+        "enabled": openai_scheduler.enabled,
+        "deployments": openai_scheduler.stats()
+    }
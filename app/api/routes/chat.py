@@ -1,13 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from typing import List
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
+from app.core.config import settings
+from app.core.metrics import request_timer, timed_stage, chat_requests
 from app.models.user import User
 from app.models.folder import Folder
-from app.schemas.document import ChatRequest, ChatResponse
-from app.services.indexer_service import indexer_service
-from app.services.openai_service import openai_service
+from app.models.conversation import ConversationSession
+from app.schemas.document import ChatRequest, ChatResponse, BatchChatRequest, PrefetchResponse
+from app.schemas.conversation import (
+    SessionCreate,
+    SessionMessageRequest,
+    SessionResponse,
+    SessionDetailResponse,
+    SessionMessageResponse,
+)
+from app.services.rag_service import rag_service
+from app.services.conversation_service import conversation_service
+from app.services.key_value_lookup import key_value_lookup
+from app.services.prefetch_cache import prefetch_cache
+from app.services.folder_generations import folder_generations
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,9 +32,61 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+async def get_owned_folder(folder_id: int, current_user: User, db: AsyncSession) -> Folder:
+    """Verify that the folder belongs to the current user."""
+    result = await db.execute(
+        select(Folder).where(
+            Folder.id == folder_id,
+            Folder.user_id == current_user.id
+        )
+    )
+    folder = result.scalar_one_or_none()
+
+    if not folder:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Folder not found"
+        )
+
+    # Catch up with changes made through other workers before any cache is read
+    folder_generations.observe(folder.id, folder.generation)
+
+    return folder
+
+
+async def get_owned_session(session_id: int, current_user: User, db: AsyncSession) -> ConversationSession:
+    """Load a conversation session with its turns, verifying it belongs to the current user."""
+    result = await db.execute(
+        select(ConversationSession)
+        .options(selectinload(ConversationSession.turns))
+        .where(
+            ConversationSession.id == session_id,
+            ConversationSession.user_id == current_user.id
+        )
+    )
+    session = result.scalar_one_or_none()
+
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Session not found"
+        )
+
+    return session
+
+
+async def answer_key_value_lookup(query: str, folder_id: int, db: AsyncSession):
+    """Answer from extracted key-value pairs, or None when the question needs RAG."""
+    if not settings.KEY_VALUE_FAST_PATH_ENABLED:
+        return None
+    with timed_stage("key_value_lookup"):
+        return await key_value_lookup.answer(db, folder_id, query)
+
+
 @router.post("", response_model=ChatResponse)
 async def chat(
     chat_request: ChatRequest,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -26,70 +95,292 @@ async def chat(
     This implements the RAG (Retrieval Augmented Generation) pattern.
 
     Uses Azure AI Search Integrated Vectorization with folder isolation via filtering.
+    Exact lookups of an extracted field ("Invoice number?") are answered from
+    the folder's key-value pairs without an LLM call. Per-stage timings are
+    returned in the Server-Timing header.
     """
-    # Verify folder ownership
-    result = await db.execute(
-        select(Folder).where(
-            Folder.id == chat_request.folder_id,
-            Folder.user_id == current_user.id
-        )
+    with request_timer() as timer:
+        try:
+            with timed_stage("total"):
+                # Verify folder ownership
+                with timed_stage("folder_lookup"):
+                    folder = await get_owned_folder(chat_request.folder_id, current_user, db)
+
+                result = await answer_key_value_lookup(chat_request.query, folder.id, db)
+
+                # Identical questions already in flight for this folder share one answer
+                if result is None:
+                    result = await rag_service.answer_coalesced(chat_request.query, folder.id)
+
+        except HTTPException:
+            chat_requests.inc("chat", "rejected")
+            raise
+
+        except Exception as e:
+            chat_requests.inc("chat", "error")
+            logger.error(f"Error processing chat request: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to process chat request"
+            )
+
+    chat_requests.inc("chat", "ok")
+    response.headers["Server-Timing"] = timer.server_timing()
+    return ChatResponse(**result)
+
+
+@router.post("/stream")
+async def chat_stream(
+    chat_request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ask a question and stream the answer as newline-delimited JSON (NDJSON).
+
+    The first frame carries the retrieved sources, followed by one frame per
+    completion token, so time-to-first-token depends on retrieval rather than
+    answer length. The final frame has the same shape as ChatResponse:
+
+        {"type": "sources", "sources": [...]}
+        {"type": "token", "content": "..."}
+        {"type": "done", "answer": "...", "sources": [...], "metadata": {...}}
+
+    If generation fails mid-stream, an {"type": "error", "detail": "..."} frame
+    is sent instead of "done". Key-value lookups answered without an LLM call
+    arrive as a single token frame.
+    """
+    # Verify folder ownership before the response starts streaming
+    folder = await get_owned_folder(chat_request.folder_id, current_user, db)
+    lookup = await answer_key_value_lookup(chat_request.query, folder.id, db)
+
+    async def key_value_frames():
+        yield {"type": "sources", "sources": lookup["sources"]}
+        yield {"type": "token", "content": lookup["answer"]}
+        yield {"type": "done", **lookup}
+
+    async def frames():
+        try:
+            answer_frames = key_value_frames() if lookup else rag_service.stream_answer(chat_request.query, folder.id)
+            async for frame in answer_frames:
+                if frame["type"] == "done":
+                    chat_requests.inc("stream", "ok")
+                    frame = {"type": "done", **ChatResponse(
+                        answer=frame["answer"],
+                        sources=frame["sources"],
+                        metadata=frame.get("metadata")
+                    ).model_dump()}
+                yield json.dumps(frame) + "\n"
+
+        except Exception as e:
+            chat_requests.inc("stream", "error")
+            logger.error(f"Error streaming chat response: {str(e)}")
+            yield json.dumps({"type": "error", "detail": "Failed to process chat request"}) + "\n"
+
+    return StreamingResponse(
+        frames(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    folder = result.scalar_one_or_none()
 
-    if not folder:
+
+@router.post("/prefetch", response_model=PrefetchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def prefetch(
+    chat_request: ChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Warm retrieval for a query the user is still typing.
+
+    Call with the partial query after a short debounce. The query embedding
+    and candidate chunks are computed in the background and kept for a short
+    time, so a /chat (or /chat/stream) for the same or a nearly identical
+    query skips both calls. A new prefetch cancels the user's previous one.
+    Prefetches are rate-limited per user (429).
+    """
+    if not settings.PREFETCH_ENABLED:
+        return PrefetchResponse(status="disabled")
+    if len(chat_request.query.strip()) < settings.PREFETCH_MIN_QUERY_CHARS:
+        return PrefetchResponse(status="skipped")
+
+    folder = await get_owned_folder(chat_request.folder_id, current_user, db)
+
+    result = prefetch_cache.schedule(
+        current_user.id,
+        folder.id,
+        chat_request.query,
+        lambda: rag_service.prefetch(chat_request.query, folder.id)
+    )
+    if result == "rate_limited":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Folder not found"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many prefetch requests"
         )
 
-    try:
-        # Step 1: Generate embedding for the query
-        logger.info(f"Generating embedding for query: {chat_request.query}")
-        query_embedding = await openai_service.generate_embedding(chat_request.query)
-
-        # Step 2: Search with folder isolation
-        # The indexer service uses a single index with folder_id filtering
-        # This ensures users only see their own folder's documents
-        logger.info(f"Searching folder {folder.id} for relevant chunks")
-        search_results = await indexer_service.search_with_folder_filter(
-            query=chat_request.query,
-            query_vector=query_embedding,
-            folder_id=folder.id,
-            top=5
-        )
+    return PrefetchResponse(status=result)
 
-        if not search_results:
-            return ChatResponse(
-                answer="I couldn't find any relevant information in the documents to answer your question.",
-                sources=[]
-            )
 
-        # Step 3: Generate response using Azure OpenAI with retrieved context
-        logger.info("Generating response with Azure OpenAI")
-        answer = await openai_service.generate_response(
-            query=chat_request.query,
-            context=search_results
-        )
+@router.delete("/prefetch", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_prefetch(current_user: User = Depends(get_current_user)):
+    """
+    Cancel the current user's running prefetch (e.g. the input was cleared).
+    """
+    prefetch_cache.cancel(current_user.id)
+    return None
+
+
+@router.post("/batch")
+async def chat_batch(
+    batch_request: BatchChatRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Answer a checklist of questions against one folder.
+
+    Folder ownership is checked once, the query embeddings are generated in a
+    single batched call, and questions are answered with bounded concurrency.
+    Results stream back as newline-delimited JSON in completion order; use
+    "index" to map them back to the request:
+
+        {"type": "result", "index": 3, "question": "...", "answer": "...", "sources": [...]}
+        {"type": "error", "index": 7, "question": "...", "detail": "..."}
+        {"type": "done", "total": 40, "failed": 1}
+    """
+    # Verify folder ownership once for the whole batch
+    folder = await get_owned_folder(batch_request.folder_id, current_user, db)
 
-        # Format sources from chunks
-        sources = [
-            {
-                "filename": result.get("title"),
-                "relevance_score": result.get("score"),
-                "document_id": result.get("document_id"),
-                "page_number": result.get("page_number")
-            }
-            for result in search_results
-        ]
-
-        return ChatResponse(
-            answer=answer,
-            sources=sources
+    async def frames():
+        try:
+            async for frame in rag_service.answer_batch(
+                batch_request.questions,
+                folder.id,
+                concurrency=settings.CHAT_BATCH_CONCURRENCY
+            ):
+                if frame["type"] == "result":
+                    frame = {
+                        "type": "result",
+                        "index": frame["index"],
+                        "question": frame["question"],
+                        **ChatResponse(
+                            answer=frame["answer"],
+                            sources=frame["sources"],
+                            metadata=frame.get("metadata")
+                        ).model_dump()
+                    }
+                elif frame["type"] == "done":
+                    chat_requests.inc("batch", "ok")
+                yield json.dumps(frame) + "\n"
+
+        except Exception as e:
+            chat_requests.inc("batch", "error")
+            logger.error(f"Error processing batch chat request: {str(e)}")
+            yield json.dumps({"type": "error", "detail": "Failed to process batch request"}) + "\n"
+
+    return StreamingResponse(
+        frames(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/sessions", response_model=SessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_session(
+    session_data: SessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Start a multi-turn conversation about the documents in a folder.
+    """
+    folder = await get_owned_folder(session_data.folder_id, current_user, db)
+
+    session = ConversationSession(
+        user_id=current_user.id,
+        folder_id=folder.id,
+        title=session_data.title
+    )
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+
+    return session
+
+
+@router.get("/sessions", response_model=List[SessionResponse])
+async def list_sessions(
+    folder_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List the current user's conversation sessions for a folder, most recent first.
+    """
+    result = await db.execute(
+        select(ConversationSession)
+        .where(
+            ConversationSession.folder_id == folder_id,
+            ConversationSession.user_id == current_user.id
         )
+        .order_by(ConversationSession.id.desc())
+    )
+    return result.scalars().all()
+
+
+@router.get("/sessions/{session_id}", response_model=SessionDetailResponse)
+async def get_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get a conversation session with all of its turns.
+    """
+    return await get_owned_session(session_id, current_user, db)
+
+
+@router.post("/sessions/{session_id}/messages", response_model=SessionMessageResponse)
+async def send_session_message(
+    session_id: int,
+    message: SessionMessageRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Ask a follow-up question within a conversation session.
+
+    Earlier turns are sent to the model as history (older ones as a summary),
+    and chunks retrieved by earlier turns are reused when the new question is
+    close enough to one already asked. "reused_context" reports whether this
+    answer was generated without a new search.
+    """
+    session = await get_owned_session(session_id, current_user, db)
+
+    try:
+        result = await conversation_service.ask(db, session, message.query)
+        return SessionMessageResponse(session_id=session.id, **result)
 
     except Exception as e:
-        logger.error(f"Error processing chat request: {str(e)}")
+        logger.error(f"Error processing session message: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process chat request"
         )
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delete a conversation session and its turns.
+    """
+    session = await get_owned_session(session_id, current_user, db)
+
+    await db.delete(session)
+    await db.commit()
+
+    return None
@@ -10,6 +10,7 @@ from app.models.folder import Folder
 from app.models.document import Document, DocumentStatus
 from app.schemas.document import DocumentResponse, DocumentUploadResponse
 from app.services.azure_blob import blob_service
+from app.services.folder_generations import folder_generations
 import logging
 
 logger = logging.getLogger(__name__)
@@ -122,7 +123,11 @@ async def upload_document(
         # Update document with blob info
         new_document.filename = blob_name
         new_document.blob_url = blob_url
+
+        # Invalidate folder-scoped caches (answers computed without this document)
+        generation = await folder_generations.bump(db, folder_id)
         await db.commit()
+        folder_generations.observe(folder_id, generation)
         await db.refresh(new_document)
 
         # Publish document indexing event to Service Bus queue
@@ -283,7 +288,11 @@ async def delete_document(
         # Step 4: Delete from PostgreSQL database
         try:
             await db.delete(document)
+
+            # Invalidate folder-scoped caches that may cite the deleted document
+            generation = await folder_generations.bump(db, document.folder_id)
             await db.commit()
+            folder_generations.observe(document.folder_id, generation)
             logger.info(f"Deleted database record for document_id={document_id}")
         except Exception as db_error:
             await db.rollback()
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from typing import List
+from typing import List, Optional
 from app.core.database import get_db
 from app.core.dependencies import get_current_user
 from app.core.security import verify_password, get_password_hash
 from app.models.user import User
 from app.models.folder import Folder
 from app.models.document import Document
-from app.schemas.folder import FolderCreate, FolderResponse, FolderAccess
+from app.schemas.folder import FolderCreate, FolderResponse, FolderAccess, FolderSearchResponse, FolderStatsResponse
+from app.services.folder_generations import folder_generations
+from app.services.indexer_service import indexer_service
+from app.services.index_stats import index_stats_cache
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/folders", tags=["Folders"])
 
@@ -86,6 +92,57 @@ async def list_folders(
     return response
 
 
+# Declared before /{folder_id} so "stats" isn't parsed as a folder ID
+@router.get("/stats", response_model=FolderStatsResponse)
+async def get_folders_stats(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Index statistics for every folder the current user owns.
+
+    Chunk counts come from the search index (total, per document, per page
+    range) and are cached per folder until its documents change.
+    """
+    result = await db.execute(
+        select(
+            Folder,
+            func.count(Document.id).label("document_count")
+        )
+        .outerjoin(Document, Folder.id == Document.folder_id)
+        .where(Folder.user_id == current_user.id)
+        .group_by(Folder.id)
+    )
+    folders_with_counts = result.all()
+    for folder, _ in folders_with_counts:
+        folder_generations.observe(folder.id, folder.generation)
+
+    try:
+        stats = await index_stats_cache.folders_stats([folder.id for folder, _ in folders_with_counts])
+
+    except Exception as e:
+        logger.error(f"Error getting folder stats: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get folder statistics"
+        )
+
+    folders = [
+        {
+            "folder_id": folder.id,
+            "name": folder.folder_name,
+            "document_count": doc_count,
+            "total_chunks": stats[folder.id]["total_chunks"],
+            "chunks_per_document": stats[folder.id]["chunks_per_document"],
+            "chunks_per_page_range": stats[folder.id]["chunks_per_page_range"],
+            "cached": stats[folder.id]["cached"],
+            "computed_at": stats[folder.id]["computed_at"]
+        }
+        for folder, doc_count in folders_with_counts
+    ]
+    return {"folders": folders, "total_chunks": sum(folder["total_chunks"] for folder in folders)}
+
+
 @router.post("/{folder_id}/access")
 async def verify_folder_access(
     folder_id: int,
@@ -159,6 +216,52 @@ async def get_folder(
     }
 
 
+@router.get("/{folder_id}/search", response_model=FolderSearchResponse)
+async def search_folder(
+    folder_id: int,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Keyword search over a folder's chunks, one page at a time.
+
+    Pass the returned next_cursor as cursor (with the same q) to load the
+    next page. Only the requested page is fetched from the search index.
+    """
+    result = await db.execute(
+        select(Folder.generation).where(
+            Folder.id == folder_id,
+            Folder.user_id == current_user.id
+        )
+    )
+    generation = result.scalar_one_or_none()
+    if generation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Folder not found"
+        )
+    folder_generations.observe(folder_id, generation)
+
+    try:
+        return await indexer_service.search_page(q, folder_id, limit=limit, cursor=cursor)
+
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    except Exception as e:
+        logger.error(f"Error searching folder {folder_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search folder"
+        )
+
+
 @router.delete("/{folder_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_folder(
     folder_id: int,
@@ -186,4 +289,8 @@ async def delete_folder(
     await db.delete(folder)
     await db.commit()
 
+    # Drop this worker's folder-scoped cache entries; other workers can no
+    # longer reach the folder and age theirs out
+    folder_generations.discard(folder_id)
+
     return None
@@ -11,6 +11,7 @@ import base64
 from sqlalchemy import select
 from app.core.database import AsyncSessionLocal
 from app.models.document import Document, DocumentStatus
+from app.services.folder_generations import folder_generations
 from datetime import datetime
 
 router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
@@ -248,7 +249,11 @@ async def update_document_status_after_merge(document_id: int, merge_result: dic
                 document.updated_at = datetime.utcnow()
                 logger.warning(f"Metadata merge failed: {merge_result}")
 
+            # The folder's chunks changed (folder_id, document_id now set)
+            generation = await folder_generations.bump(session, document.folder_id)
+
             await session.commit()
+            folder_generations.observe(document.folder_id, generation)
 
             logger.info(f"Updated document {document_id} status: {old_status} → {document.status}")
 
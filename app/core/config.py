@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 
 
@@ -32,6 +32,8 @@ class Settings(BaseSettings):
     AZURE_SEARCH_ENDPOINT: str
     AZURE_SEARCH_KEY: str
     AZURE_SEARCH_INDEX_PREFIX: str = "rag-index"
+    AZURE_SEARCH_MAX_CONNECTIONS: int = 100
+    AZURE_SEARCH_KEEPALIVE_SECONDS: int = 30
 
     # Azure Service Bus
     SERVICE_BUS_CONNECTION_STRING: str
@@ -44,6 +46,116 @@ class Settings(BaseSettings):
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT: str = "text-embedding-3-small"
     AZURE_OPENAI_API_VERSION: str = "2024-02-15-preview"
 
+    # Azure OpenAI quota (per deployment). Calls are admitted client-side
+    # against these budgets, and 429 retry-after is honoured by pausing
+    # the deployment instead of blind SDK retries. Each API worker process
+    # admits 1/WEB_CONCURRENCY of the quota; WEB_CONCURRENCY is also the
+    # gunicorn worker count (startup.sh, Dockerfile), so keep them in sync.
+    WEB_CONCURRENCY: int = 4
+    OPENAI_SCHEDULER_ENABLED: bool = True
+    OPENAI_SCHEDULER_MAX_RETRIES: int = 5
+    OPENAI_SCHEDULER_TRANSIENT_RETRIES: int = 2  # Connection errors, timeouts, 408/409/5xx
+    OPENAI_SCHEDULER_TARGET_UTILIZATION: float = 0.9
+    AZURE_OPENAI_CHAT_TPM: int = 80000
+    AZURE_OPENAI_CHAT_RPM: int = 480
+    AZURE_OPENAI_EMBEDDING_TPM: int = 350000
+    AZURE_OPENAI_EMBEDDING_RPM: int = 2100
+
+    # Retrieval: "rrf" runs the keyword and vector legs in parallel and fuses them
+    # locally with reciprocal rank fusion; "service" sends one combined hybrid query
+    RETRIEVAL_MODE: str = "rrf"
+    RRF_K: int = 60
+    RRF_KEYWORD_WEIGHT: float = 1.0
+    RRF_VECTOR_WEIGHT: float = 1.0
+    RRF_LEG_DEPTH: int = 20
+
+    # MMR Re-ranking
+    RERANK_ENABLED: bool = True
+    RERANK_CANDIDATE_POOL: int = 30  # Chunks (with vectors) fetched before re-ranking down to top
+    RERANK_MMR_LAMBDA: float = 0.7  # 1.0 = relevance only, 0.0 = diversity only
+
+    # Adaptive retrieval depth: chunks sent to the model are chosen from the
+    # score distribution instead of a fixed top 5
+    ADAPTIVE_DEPTH_ENABLED: bool = True
+    ADAPTIVE_DEPTH_MIN: int = 2
+    ADAPTIVE_DEPTH_MAX: int = 12
+    ADAPTIVE_DEPTH_GAP_THRESHOLD: float = 0.25  # Drop in rescaled query cosine that ends the list
+    ADAPTIVE_DEPTH_MASS_FRACTION: float = 0.8  # Share of the relevance mass kept when there's no gap
+
+    # Batch chat (checklists): questions answered concurrently per request
+    CHAT_BATCH_CONCURRENCY: int = 8
+
+    # Prompt context packing (SplitSkill pageOverlapLength is 500 chars)
+    CONTEXT_TOKEN_BUDGET: int = 6000
+    CONTEXT_MAX_OVERLAP_CHARS: int = 600
+
+    # Batched embedding requests (per-request limits of the embedding deployment)
+    EMBEDDING_BATCH_MAX_ITEMS: int = 2048
+    EMBEDDING_BATCH_MAX_TOKENS: int = 300000
+    EMBEDDING_BATCH_CONCURRENCY: int = 4
+
+    # Query embedding cache (disk tier is disabled unless a path is set)
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 2048
+    EMBEDDING_CACHE_TTL_SECONDS: int = 86400
+    EMBEDDING_CACHE_DISK_PATH: Optional[str] = None
+
+    # Folder-scoped semantic answer cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.97
+    ANSWER_CACHE_MAX_ENTRIES_PER_FOLDER: int = 256
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+
+    # Single-flight: concurrent identical chat requests share one computation.
+    # "memory" coalesces within a worker; "redis" also across workers.
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_BACKEND: str = "memory"
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = 60
+    REDIS_URL: Optional[str] = None
+
+    # Key-value fast path: exact lookups ("Invoice number?") answered from
+    # Document Intelligence key-value pairs without search or an LLM call
+    KEY_VALUE_FAST_PATH_ENABLED: bool = True
+    KEY_VALUE_MIN_CONFIDENCE: float = 0.8  # Key/question term similarity x extraction confidence
+    KEY_VALUE_MAX_QUESTION_TERMS: int = 6
+    KEY_VALUE_INDEX_TTL_SECONDS: int = 300
+
+    # Prefetch: partial queries sent while the user types are embedded and
+    # searched in the background so /chat can skip both round trips
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_TTL_SECONDS: int = 60
+    PREFETCH_MAX_ENTRIES: int = 1000
+    PREFETCH_SIMILARITY_THRESHOLD: float = 0.8  # Word overlap for a submitted query to use a prefetch
+    PREFETCH_PER_USER_PER_MINUTE: int = 30
+    PREFETCH_BURST: int = 5
+    PREFETCH_MIN_QUERY_CHARS: int = 8
+
+    # Local retrieval engine: small folders that are searched are loaded into
+    # memory (NumPy vectors + BM25) and searched in-process
+    LOCAL_INDEX_ENABLED: bool = False
+    LOCAL_INDEX_MAX_CHUNKS: int = 2000
+    LOCAL_INDEX_MEMORY_MB: int = 256
+    LOCAL_INDEX_TTL_SECONDS: int = 600
+
+    # Folder chunk snapshots (python -m app.services.folder_snapshot)
+    SNAPSHOT_DIR: str = "snapshots"
+    SNAPSHOT_VECTOR_DTYPE: str = "float32"  # or "float16" to halve the size
+
+    # Index statistics (chunk counts per folder) cache
+    INDEX_STATS_TTL_SECONDS: int = 300
+
+    # Retrieval result cache: folder-scoped search results keyed on filter,
+    # query text and query-vector fingerprint, dropped on folder changes
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 300
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 2000
+    RETRIEVAL_CACHE_MAX_MB: int = 64
+
+    # Conversation Sessions
+    SESSION_HISTORY_TURNS: int = 4  # Turns sent verbatim, older turns are summarized
+    SESSION_SUMMARY_MAX_TOKENS: int = 400
+    SESSION_REUSE_SIMILARITY: float = 0.85  # Cosine similarity to reuse a previous turn's chunks
+    SESSION_MAX_RETRIEVAL_CONTEXTS: int = 5
+
     # CORS
     CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
 
@@ -0,0 +1,195 @@
+"""
+Request metrics and per-stage timing.
+
+Histograms and counters are kept in process and rendered in the Prometheus
+text format on GET /metrics. Each worker reports its own values; the scraper
+aggregates across workers, and p50/p99 come from the histogram buckets
+(histogram_quantile in PromQL).
+
+Stage timing uses monotonic clocks. A request opens a RequestTimer and code
+anywhere below it wraps work in `timed_stage("name")`. The duration goes
+into the stage histogram and into the request's Server-Timing header.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 12, 20, 30, 50)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        key = tuple(str(value) for value in label_values)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts, sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        key = tuple(str(label) for label in label_values)
+        series = self._series.get(key)
+        if series is None:
+            series = [[0] * len(self.buckets), 0.0, 0]
+            self._series[key] = series
+
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float], labels: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, help, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Register a callback returning extra exposition lines (e.g. cache gauges) at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, help: str, values: Dict[Tuple[Tuple[str, str], ...], float]) -> List[str]:
+    """Exposition lines for a gauge; keys are tuples of (label, value) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in values.items():
+        label_text = _format_labels([label for label, _ in labels], [value for _, value in labels])
+        lines.append(f"{name}{label_text} {_format_value(value or 0)}")
+    return lines
+
+
+# Singleton registry and the chat pipeline metrics
+metrics = MetricsRegistry()
+
+stage_latency = metrics.histogram(
+    "rag_chat_stage_seconds", "Latency of each chat pipeline stage", LATENCY_BUCKETS, labels=("stage",)
+)
+retrieved_chunks = metrics.histogram(
+    "rag_chat_retrieved_chunks", "Chunks used as context per chat answer", COUNT_BUCKETS
+)
+llm_tokens = metrics.histogram(
+    "rag_chat_tokens", "Prompt and completion tokens per chat answer", TOKEN_BUCKETS, labels=("kind",)
+)
+chat_requests = metrics.counter(
+    "rag_chat_requests_total", "Chat requests by endpoint and outcome", labels=("endpoint", "outcome")
+)
+
+
+class RequestTimer:
+    """Collects stage durations for one request, in the order they finished."""
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages)
+
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+@contextmanager
+def request_timer() -> Iterator[RequestTimer]:
+    """Collect the stages timed inside the block (and tasks it starts) into one RequestTimer."""
+    timer = RequestTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller (e.g. across yields of a generator)."""
+    stage_latency.observe(seconds, stage)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into the stage histogram and the current request's timer."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
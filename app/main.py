@@ -1,13 +1,17 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import logging
 import os
 
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.metrics import metrics, gauge_lines
 from app.api.routes import auth, folders, documents, chat, webhooks, admin
 from app.services.azure_blob import blob_service
+from app.services.indexer_service import indexer_service
+from app.services.single_flight import single_flight
 
 # Configure Application Insights if available
 appinsights_key = os.getenv("APPINSIGHTS_INSTRUMENTATIONKEY")
@@ -80,6 +84,13 @@ async def lifespan(app: FastAPI):
     # Start initialization in background without waiting
     asyncio.create_task(initialize_resources())
 
+    # Create the shared, connection-pooled Azure Search client
+    try:
+        await indexer_service.startup()
+        logger.info("✅ Search client initialized")
+    except Exception as e:
+        logger.error(f"⚠️ Failed to initialize search client: {e}")
+
     # Start document indexing worker
     worker_task = None
     try:
@@ -107,6 +118,18 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.error(f"Error stopping worker: {e}")
 
+    # Close pooled search connections
+    try:
+        await indexer_service.close()
+    except Exception as e:
+        logger.error(f"Error closing search client: {e}")
+
+    # Close the single-flight lock backend, if any
+    try:
+        await single_flight.close()
+    except Exception as e:
+        logger.error(f"Error closing single-flight backend: {e}")
+
 
 # Create FastAPI app
 app = FastAPI(
@@ -152,6 +175,49 @@ async def health_check():
     return {"status": "healthy"}
 
 
+def collect_service_metrics() -> list:
+    """
+    Cache, coalescing and OpenAI quota gauges, read at scrape time.
+
+    OpenAI queue wait is a histogram (rag_openai_queue_wait_seconds) recorded
+    by the scheduler as calls are admitted.
+    """
+    from app.services.embedding_cache import embedding_cache
+    from app.services.answer_cache import answer_cache
+    from app.services.openai_scheduler import openai_scheduler
+
+    embedding_stats = embedding_cache.stats()
+    answer_stats = answer_cache.stats()
+    lines = gauge_lines("rag_cache_hit_rate", "Hit rate since process start", {
+        (("cache", "embedding"),): embedding_stats["hit_rate"],
+        (("cache", "answer"),): answer_stats["hit_rate"],
+    })
+    lines += gauge_lines("rag_single_flight_in_flight", "Distinct chat requests currently in flight", {
+        (): single_flight.stats()["in_flight"]
+    })
+
+    scheduler_stats = openai_scheduler.stats()
+    lines += gauge_lines("rag_openai_token_utilization", "Tokens admitted in the last minute over TPM quota", {
+        (("deployment", name),): stats["token_utilization"] for name, stats in scheduler_stats.items()
+    })
+    lines += gauge_lines("rag_openai_queue_depth", "Calls waiting for OpenAI quota", {
+        (("deployment", name),): stats["queue_depth"] for name, stats in scheduler_stats.items()
+    })
+    return lines
+
+
+metrics.add_collector(collect_service_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus metrics for this worker: per-stage chat latency histograms,
+    retrieved chunk and token counts, request outcomes, cache and quota gauges.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -1,5 +1,6 @@
 from app.models.user import User
 from app.models.folder import Folder
 from app.models.document import Document
+from app.models.conversation import ConversationSession, ConversationTurn
 
-__all__ = ["User", "Folder", "Document"]
+__all__ = ["User", "Folder", "Document", "ConversationSession", "ConversationTurn"]
@@ -0,0 +1,43 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, JSON
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class ConversationSession(Base):
+    __tablename__ = "conversation_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    folder_id = Column(Integer, ForeignKey("folders.id", ondelete="CASCADE"), nullable=False, index=True)
+    title = Column(String, nullable=True)
+    summary = Column(Text, nullable=True)  # Compacted summary of turns older than the verbatim window
+    summarized_turns = Column(Integer, default=0, nullable=False)  # Number of oldest turns folded into summary
+    retrieved_chunks = Column(JSON, nullable=True)  # chunk_id -> chunk (content, title, score, ...) already retrieved
+    retrieval_contexts = Column(JSON, nullable=True)  # [{"query": ..., "query_embedding": [...], "chunk_ids": [...], "folder_generation": n}] for reuse
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    folder = relationship("Folder", back_populates="conversation_sessions")
+    turns = relationship(
+        "ConversationTurn",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="ConversationTurn.id"
+    )
+
+
+class ConversationTurn(Base):
+    __tablename__ = "conversation_turns"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("conversation_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    sources = Column(JSON, nullable=True)
+    reused_context = Column(Boolean, default=False, nullable=False)  # Answered from chunks retrieved by an earlier turn
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # Relationships
+    session = relationship("ConversationSession", back_populates="turns")
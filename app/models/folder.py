@@ -12,9 +12,11 @@ class Folder(Base):
     folder_name = Column(String, nullable=False)
     description = Column(String, nullable=True)  # Optional folder description
     hashed_password = Column(String, nullable=True)  # Folder-level password (now optional)
+    generation = Column(Integer, default=0, server_default="0", nullable=False)  # Bumped when the folder's indexed documents change
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     # Relationships
     user = relationship("User", back_populates="folders")
     documents = relationship("Document", back_populates="folder", cascade="all, delete-orphan")
+    conversation_sessions = relationship("ConversationSession", back_populates="folder", cascade="all, delete-orphan")
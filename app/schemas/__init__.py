@@ -1,6 +1,13 @@
 from app.schemas.user import UserCreate, UserLogin, UserResponse, Token
 from app.schemas.folder import FolderCreate, FolderResponse, FolderAccess
 from app.schemas.document import DocumentResponse, DocumentUploadResponse
+from app.schemas.conversation import (
+    SessionCreate,
+    SessionMessageRequest,
+    SessionResponse,
+    SessionDetailResponse,
+    SessionMessageResponse,
+)
 
 __all__ = [
     "UserCreate",
@@ -12,4 +19,9 @@ __all__ = [
     "FolderAccess",
     "DocumentResponse",
     "DocumentUploadResponse",
+    "SessionCreate",
+    "SessionMessageRequest",
+    "SessionResponse",
+    "SessionDetailResponse",
+    "SessionMessageResponse",
 ]
@@ -0,0 +1,47 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, List
+
+
+class SessionCreate(BaseModel):
+    folder_id: int
+    title: Optional[str] = Field(None, max_length=255)
+
+
+class SessionMessageRequest(BaseModel):
+    query: str
+
+
+class ConversationTurnResponse(BaseModel):
+    id: int
+    question: str
+    answer: str
+    sources: Optional[list] = []
+    reused_context: bool
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class SessionResponse(BaseModel):
+    id: int
+    folder_id: int
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SessionDetailResponse(SessionResponse):
+    turns: List[ConversationTurnResponse] = []
+
+
+class SessionMessageResponse(BaseModel):
+    session_id: int
+    answer: str
+    sources: Optional[list] = []
+    reused_context: bool
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from app.models.document import DocumentStatus
 
 
@@ -36,3 +36,13 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     answer: str
     sources: Optional[list] = []
+    metadata: Optional[Dict[str, Any]] = None  # Retrieval details, e.g. retrieval_depth and depth_reason
+
+
+class PrefetchResponse(BaseModel):
+    status: str  # started, in_flight, cached, skipped or disabled
+
+
+class BatchChatRequest(BaseModel):
+    folder_id: int
+    questions: List[str] = Field(..., min_length=1, max_length=100)
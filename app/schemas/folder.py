@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 
 class FolderCreate(BaseModel):
@@ -23,3 +23,24 @@ class FolderResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class FolderSearchResponse(BaseModel):
+    results: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # Pass back as cursor to load more; None on the last page
+
+
+class FolderIndexStats(BaseModel):
+    folder_id: int
+    name: str
+    document_count: int  # Documents in the database, indexed or not
+    total_chunks: int  # Chunks in the search index
+    chunks_per_document: Dict[str, int] = {}
+    chunks_per_page_range: List[Dict[str, int]] = []  # {"from", "to", "count"}
+    cached: bool
+    computed_at: float
+
+
+class FolderStatsResponse(BaseModel):
+    folders: List[FolderIndexStats]
+    total_chunks: int
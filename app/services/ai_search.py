@@ -8,7 +8,8 @@ from azure.search.documents.indexes.models import (
 )
 from azure.core.credentials import AzureKeyCredential
 from app.core.config import settings
-from typing import List, Dict, Any
+from itertools import islice
+from typing import Iterator, List, Dict, Any, Optional
 import logging
 
 logger = logging.getLogger(__name__)
@@ -134,52 +135,87 @@ class AISearchService:
             logger.error(f"Error deleting document from index: {str(e)}")
             return False
 
-    def search(
+    def iter_search(
         self,
         index_name: str,
         query: str,
-        top: int = 40,
-        select: List[str] = None
-    ) -> List[Dict[str, Any]]:
+        select: List[str] = None,
+        page_size: int = 50,
+        filter: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
         """
-        Search for documents in the index.
+        Yield search results lazily.
+
+        Results are requested from the service a page at a time as the caller
+        iterates, so a caller that stops after n results only pays for the
+        pages holding them.
 
         Args:
             index_name: The name of the index to search
             query: The search query
-            top: Number of results to return
             select: Fields to include in results
+            page_size: Results per request
+            filter: Optional OData filter
 
-        Returns:
-            List of search results
+        Yields:
+            Search results
         """
-        try:
-            search_client = SearchClient(
-                endpoint=self.endpoint,
-                index_name=index_name,
-                credential=self.credential
-            )
+        search_client = SearchClient(
+            endpoint=self.endpoint,
+            index_name=index_name,
+            credential=self.credential
+        )
 
-            if select is None:
-                select = ["id", "filename", "content"]
+        if select is None:
+            select = ["id", "filename", "content"]
 
-            results = search_client.search(
+        skip = 0
+        while True:
+            page = search_client.search(
                 search_text=query,
-                top=top,
-                select=select
+                top=page_size,
+                skip=skip,
+                select=select,
+                filter=filter
             )
 
-            # Convert results to list of dictionaries
-            search_results = []
-            for result in results:
-                search_results.append({
+            count = 0
+            for result in page:
+                count += 1
+                yield {
                     "score": result.get("@search.score"),
                     "id": result.get("id"),
                     "filename": result.get("filename"),
                     "content": result.get("content"),
                     "table_content": result.get("table_content"),
                     "page_count": result.get("page_count")
-                })
+                }
+
+            if count < page_size:
+                return
+            skip += count
+
+    def search(
+        self,
+        index_name: str,
+        query: str,
+        top: int = 40,
+        select: List[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for documents in the index.
+
+        Args:
+            index_name: The name of the index to search
+            query: The search query
+            top: Number of results to return
+            select: Fields to include in results
+
+        Returns:
+            List of search results
+        """
+        try:
+            search_results = list(islice(self.iter_search(index_name, query, select, page_size=top), top))
 
             logger.info(f"Search completed: {len(search_results)} results found")
             return search_results
@@ -0,0 +1,186 @@
+"""
+Folder-Scoped Semantic Answer Cache
+
+Stores complete chat answers per folder and serves them again for new
+queries whose embedding is close enough to a cached query. Entries are
+tagged with the folder generation they were computed at and are dropped
+as soon as the folder's documents change.
+
+Each folder's query embeddings are kept as rows of one normalized matrix,
+so a lookup is a single matrix-vector product.
+"""
+
+from app.core.config import settings
+from app.services.folder_generations import folder_generations
+from app.services.reranker import normalize_rows
+from typing import List, Dict, Any, Optional
+import numpy as np
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    return normalize_rows(np.asarray([vector], dtype=np.float32))[0]
+
+
+class _FolderBucket:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.entries: List[Dict[str, Any]] = []
+        self.embeddings: Optional[np.ndarray] = None  # Row i is entries[i]'s unit query embedding
+
+    def keep(self, mask: np.ndarray) -> None:
+        """Keep only the entries selected by a boolean mask."""
+        self.entries = [entry for entry, kept in zip(self.entries, mask) if kept]
+        self.embeddings = self.embeddings[mask]
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        similarity_threshold: float = 0.97,
+        max_entries_per_folder: int = 256,
+        ttl_seconds: int = 3600
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_folder = max_entries_per_folder
+        self.ttl_seconds = ttl_seconds
+
+        self._buckets: Dict[int, _FolderBucket] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.invalidations = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    def lookup(self, folder_id: int, query_embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a semantically equivalent query.
+
+        Args:
+            folder_id: Folder the query is scoped to
+            query_embedding: Embedding of the new query
+
+        Returns:
+            Cached response dictionary ("answer", "sources"), or None on a miss
+        """
+        bucket = self._current_bucket(folder_id)
+        if bucket is None or not bucket.entries:
+            self.misses += 1
+            return None
+
+        if self.ttl_seconds > 0:
+            now = time.time()
+            live = np.fromiter(
+                (now - entry["created_at"] <= self.ttl_seconds for entry in bucket.entries),
+                dtype=bool,
+                count=len(bucket.entries)
+            )
+            if not live.all():
+                bucket.keep(live)
+            if not bucket.entries:
+                self.misses += 1
+                return None
+
+        similarities = bucket.embeddings @ _unit(query_embedding)
+        best = int(np.argmax(similarities))
+        best_similarity = float(similarities[best])
+
+        if best_similarity < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        best_entry = bucket.entries[best]
+
+        self.hits += 1
+        self.saved_tokens += best_entry["tokens"]
+        logger.info(
+            f"Answer cache hit for folder {folder_id} "
+            f"(similarity {best_similarity:.3f} to '{best_entry['query']}')"
+        )
+
+        return {
+            "answer": best_entry["response"]["answer"],
+            "sources": [dict(source) for source in best_entry["response"]["sources"]]
+        }
+
+    def store(
+        self,
+        folder_id: int,
+        query: str,
+        query_embedding: List[float],
+        response: Dict[str, Any],
+        generation: int,
+        tokens: int = 0
+    ) -> None:
+        """
+        Cache an answer for a folder.
+
+        Args:
+            folder_id: Folder the answer was computed for
+            query: Original query text (for logging)
+            query_embedding: Embedding of the query
+            response: Response dictionary ("answer", "sources")
+            generation: Folder generation read before retrieval started;
+                the entry is discarded if the folder changed since then
+            tokens: Prompt + completion tokens the answer cost
+        """
+        if generation != folder_generations.get(folder_id):
+            logger.info(f"Not caching answer for folder {folder_id}: folder changed during request")
+            return
+
+        bucket = self._buckets.get(folder_id)
+        if bucket is None or bucket.generation != generation:
+            bucket = _FolderBucket(generation)
+            self._buckets[folder_id] = bucket
+
+        embedding = _unit(query_embedding)[np.newaxis, :]
+        bucket.entries.append({
+            "query": query,
+            "response": response,
+            "tokens": tokens,
+            "created_at": time.time()
+        })
+        bucket.embeddings = embedding if bucket.embeddings is None else np.vstack([bucket.embeddings, embedding])
+
+        # Oldest entries go first when the folder is full
+        if len(bucket.entries) > self.max_entries_per_folder:
+            del bucket.entries[:len(bucket.entries) - self.max_entries_per_folder]
+            bucket.embeddings = bucket.embeddings[-self.max_entries_per_folder:]
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop every cached answer for a folder."""
+        if self._buckets.pop(int(folder_id), None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit rate and saved token counters."""
+        lookups = self.hits + self.misses
+        return {
+            "folders": len(self._buckets),
+            "entries": sum(len(bucket.entries) for bucket in self._buckets.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "saved_tokens": self.saved_tokens,
+            "invalidations": self.invalidations
+        }
+
+    def _current_bucket(self, folder_id: int) -> Optional[_FolderBucket]:
+        bucket = self._buckets.get(folder_id)
+        if bucket is not None and bucket.generation != folder_generations.get(folder_id):
+            self.invalidate(folder_id)
+            return None
+        return bucket
+
+
+# Singleton instance
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    max_entries_per_folder=settings.ANSWER_CACHE_MAX_ENTRIES_PER_FOLDER,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS
+)
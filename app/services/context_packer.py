@@ -0,0 +1,199 @@
+"""
+Token-Budget Context Packer
+
+Builds the "Context from documents" block of the RAG prompt under a token
+budget instead of cutting every chunk at a fixed character length.
+
+- Chunks are packed highest score first (ties broken by chunk_id), so the
+  output is deterministic for a given input.
+- The SplitSkill leaves a pageOverlapLength (500 chars) overlap between
+  neighbouring chunks of the same document. When two chunks from the same
+  parent_id overlap, the repeated text is removed from the later one.
+- Exact duplicate chunks are dropped.
+- The last chunk that doesn't fit is truncated to the remaining budget.
+"""
+
+from app.core.config import settings
+from app.services.tokenizer import count_tokens
+from typing import List, Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+NO_CONTEXT_TEXT = "No relevant documents found."
+
+
+def find_overlap(first: str, second: str, min_chars: int, max_chars: int) -> int:
+    """
+    Length of the longest suffix of `first` that is also a prefix of `second`.
+
+    Only overlaps between min_chars and max_chars long are considered, so
+    short coincidental matches (a shared word) are ignored.
+
+    Returns:
+        Overlap length in characters, or 0
+    """
+    if len(first) < min_chars or len(second) < min_chars:
+        return 0
+
+    tail = first[-max_chars:]
+    probe = second[:min_chars]
+
+    # Earliest start in the tail gives the longest overlap
+    start = tail.find(probe)
+    while start != -1:
+        length = len(tail) - start
+        if second.startswith(tail[start:]) and length >= min_chars:
+            return length
+        start = tail.find(probe, start + 1)
+
+    return 0
+
+
+class ContextPacker:
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        min_overlap_chars: int = 50,
+        max_overlap_chars: int = 600,
+        min_partial_tokens: int = 100
+    ):
+        self.token_budget = token_budget
+        self.min_overlap_chars = min_overlap_chars
+        self.max_overlap_chars = max_overlap_chars
+        self.min_partial_tokens = min_partial_tokens
+
+    def pack(self, chunks: List[Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Pack chunks into prompt context under a token budget.
+
+        Args:
+            chunks: Search results with "content", "score", "title" and
+                optionally "chunk_id", "parent_id", "page_number"
+            token_budget: Override the packer's default budget
+
+        Returns:
+            Dictionary with:
+            - text: The formatted context block
+            - tokens_used: Tokens in text
+            - chunks: The chunks that were included, in prompt order
+            - chunks_dropped: Chunks left out (duplicates or over budget)
+            - overlap_chars_removed: Characters of duplicated overlap removed
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+
+        if not chunks:
+            return {
+                "text": NO_CONTEXT_TEXT,
+                "tokens_used": count_tokens(NO_CONTEXT_TEXT),
+                "chunks": [],
+                "chunks_dropped": 0,
+                "overlap_chars_removed": 0
+            }
+
+        ordered = sorted(
+            chunks,
+            key=lambda chunk: (-(chunk.get("score") or 0), str(chunk.get("chunk_id") or ""))
+        )
+
+        included: List[Dict[str, Any]] = []
+        parts: List[str] = []
+        seen_contents = set()
+        tokens_used = 0
+        overlap_removed = 0
+
+        for chunk in ordered:
+            content = chunk.get("content") or ""
+            if not content.strip() or content in seen_contents:
+                continue
+            seen_contents.add(content)
+
+            trimmed = self._remove_overlaps(content, chunk.get("parent_id"), included)
+            overlap_removed += len(content) - len(trimmed)
+            if not trimmed.strip():
+                continue
+
+            header = self._header(len(included) + 1, chunk)
+            block = f"{header}\n{trimmed}\n"
+            block_tokens = count_tokens(block)
+            remaining = budget - tokens_used
+
+            if block_tokens > remaining:
+                # Fill what's left with the start of this chunk, then stop
+                content_budget = remaining - count_tokens(header) - 2
+                if content_budget >= self.min_partial_tokens:
+                    trimmed = self._truncate_to_tokens(trimmed, content_budget) + "..."
+                    block = f"{header}\n{trimmed}\n"
+                    block_tokens = count_tokens(block)
+                    if block_tokens <= remaining:
+                        included.append({**chunk, "content": trimmed})
+                        parts.append(block)
+                        tokens_used += block_tokens
+                break
+
+            included.append({**chunk, "content": trimmed})
+            parts.append(block)
+            tokens_used += block_tokens
+
+        return {
+            "text": "\n".join(parts) if parts else NO_CONTEXT_TEXT,
+            "tokens_used": tokens_used,
+            "chunks": included,
+            "chunks_dropped": len(chunks) - len(included),
+            "overlap_chars_removed": overlap_removed
+        }
+
+    def _remove_overlaps(self, content: str, parent_id: Optional[str], included: List[Dict[str, Any]]) -> str:
+        """Strip text this chunk shares with already-packed neighbours from the same parent."""
+        if not parent_id:
+            return content
+
+        for other in included:
+            if other.get("parent_id") != parent_id:
+                continue
+            other_content = other["content"]
+
+            # Neighbour precedes this chunk: drop the repeated prefix
+            overlap = find_overlap(other_content, content, self.min_overlap_chars, self.max_overlap_chars)
+            if overlap:
+                content = content[overlap:]
+
+            # Neighbour follows this chunk: drop the repeated suffix
+            overlap = find_overlap(content, other_content, self.min_overlap_chars, self.max_overlap_chars)
+            if overlap:
+                content = content[:-overlap]
+
+        return content
+
+    @staticmethod
+    def _header(position: int, chunk: Dict[str, Any]) -> str:
+        title = chunk.get("title", "Unknown")
+        page_number = chunk.get("page_number")
+        score = chunk.get("score") or 0
+
+        # Include page number if available
+        page_info = f", Page: {page_number}" if page_number else ""
+
+        return f"Chunk {position} (File: {title}{page_info}, Relevance: {score:.2f}):"
+
+    @staticmethod
+    def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+        """Longest prefix of text within max_tokens (binary search on characters)."""
+        if count_tokens(text) <= max_tokens:
+            return text
+
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+
+# Singleton instance
+context_packer = ContextPacker(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    max_overlap_chars=settings.CONTEXT_MAX_OVERLAP_CHARS
+)
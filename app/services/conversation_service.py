@@ -0,0 +1,268 @@
+"""
+Conversation Session Service
+
+Multi-turn chat on top of the RAG pipeline. Each session keeps its turns, a
+running summary of older turns, and the chunks already retrieved for it:
+
+- Follow-up questions are retrieved with the previous question as context,
+  so "and for 2022?" still finds the right chunks.
+- If the new retrieval query is close to one the session already retrieved
+  for (and the folder hasn't changed since), those chunks are reused instead
+  of searching again. A follow-up that brings in a number or name the
+  earlier query didn't mention ("and for 2022?") always searches again,
+  since the prepended question makes it embed close to the old one.
+- Only the summary and the most recent turns go into the prompt; once enough
+  turns pile up, the oldest are folded into the summary.
+
+Callers are responsible for verifying session ownership before calling in.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.models.conversation import ConversationSession, ConversationTurn
+from app.services.openai_service import openai_service
+from app.services.rag_service import rag_service, NO_RESULTS_ANSWER
+from app.services.folder_generations import folder_generations
+from typing import List, Dict, Any, Optional, Set
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+TITLE_MAX_CHARS = 80
+
+_NUMBER_RE = re.compile(r"\d[\d,.]*")
+_WORD_RE = re.compile(r"[A-Za-z][\w&'-]*")
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _query_words(text: str) -> Set[str]:
+    """Lowercased words and numbers in a query."""
+    return {word.lower().rstrip(".,") for word in _NUMBER_RE.findall(text) + _WORD_RE.findall(text)}
+
+
+def _key_terms(question: str) -> Set[str]:
+    """
+    Numbers (years, amounts, quarters) and names in a question.
+
+    Names are capitalized words other than the first one, so "Which segment
+    grew at Apple?" yields {"apple"} but not {"which"}.
+    """
+    terms = {number.rstrip(".,") for number in _NUMBER_RE.findall(question)}
+    for position, word in enumerate(_WORD_RE.findall(question)):
+        if position > 0 and any(char.isupper() for char in word):
+            terms.add(word.lower())
+    return terms
+
+
+class ConversationService:
+    def __init__(
+        self,
+        history_turns: int = 4,
+        summary_max_tokens: int = 400,
+        reuse_similarity: float = 0.85,
+        max_retrieval_contexts: int = 5
+    ):
+        self.history_turns = history_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.reuse_similarity = reuse_similarity
+        self.max_retrieval_contexts = max_retrieval_contexts
+
+    async def ask(self, db: AsyncSession, session: ConversationSession, query: str) -> Dict[str, Any]:
+        """
+        Answer a question within a session and record the turn.
+
+        The session must be loaded with its turns.
+
+        Args:
+            db: Database session
+            session: Conversation session to continue
+            query: The user's question
+
+        Returns:
+            Dictionary with "answer", "sources" and "reused_context"
+        """
+        folder_id = session.folder_id
+        # Stored contexts are compared against the durable folder generation
+        generation = await folder_generations.refresh(db, folder_id)
+        retrieval_query = self.build_retrieval_query(session, query)
+
+        # The keyword leg runs while the retrieval query is embedded
+        keyword_task = rag_service.start_retrieval(retrieval_query, folder_id)
+        try:
+            query_embedding = await openai_service.generate_embedding(retrieval_query)
+        except BaseException:
+            if keyword_task is not None:
+                keyword_task.cancel()
+            raise
+
+        chunks = self.find_reusable_chunks(session, query, query_embedding, generation)
+        reused_context = chunks is not None
+
+        if reused_context:
+            if keyword_task is not None:
+                keyword_task.cancel()
+            logger.info(f"Session {session.id}: reusing {len(chunks)} previously retrieved chunks")
+        else:
+            chunks = await rag_service.retrieve(retrieval_query, folder_id, query_embedding, keyword_task)
+            self.remember_chunks(session, retrieval_query, query_embedding, chunks, generation)
+
+        if chunks:
+            answer, _ = await openai_service.generate_response_with_usage(
+                query=query,
+                context=chunks,
+                history=self.history_messages(session)
+            )
+        else:
+            answer = NO_RESULTS_ANSWER
+
+        sources = rag_service.format_sources(chunks)
+        session.turns.append(ConversationTurn(
+            question=query,
+            answer=answer,
+            sources=sources,
+            reused_context=reused_context
+        ))
+        if not session.title:
+            session.title = query[:TITLE_MAX_CHARS]
+
+        await self.compact(session)
+        await db.commit()
+
+        return {"answer": answer, "sources": sources, "reused_context": reused_context}
+
+    def build_retrieval_query(self, session: ConversationSession, query: str) -> str:
+        """
+        Text used to retrieve for a question.
+
+        Follow-ups are often elliptical ("and for 2022?"), so the previous
+        question is prepended to give retrieval the missing subject.
+        """
+        if not session.turns:
+            return query
+        return f"{session.turns[-1].question}\n{query}"
+
+    def find_reusable_chunks(
+        self,
+        session: ConversationSession,
+        query: str,
+        query_embedding: List[float],
+        generation: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Chunks from an earlier retrieval whose query is close to this one.
+
+        Contexts retrieved before the folder's documents last changed are
+        ignored, as are contexts whose query didn't mention every number and
+        name in the new question.
+
+        Returns:
+            The cached chunks, or None if the session has to retrieve again
+        """
+        best_similarity = 0.0
+        best_context = None
+        key_terms = _key_terms(query)
+
+        for context in session.retrieval_contexts or []:
+            if context.get("folder_generation") != generation:
+                continue
+            if not key_terms <= _query_words(context.get("query", "")):
+                continue
+            similarity = _cosine(query_embedding, context["query_embedding"])
+            if similarity > best_similarity:
+                best_similarity = similarity
+                best_context = context
+
+        if best_context is None or best_similarity < self.reuse_similarity:
+            return None
+
+        retrieved = session.retrieved_chunks or {}
+        chunks = [retrieved[chunk_id] for chunk_id in best_context["chunk_ids"] if chunk_id in retrieved]
+        return chunks or None
+
+    def remember_chunks(
+        self,
+        session: ConversationSession,
+        retrieval_query: str,
+        query_embedding: List[float],
+        chunks: List[Dict[str, Any]],
+        generation: int
+    ) -> None:
+        """Record a retrieval so later turns can reuse it, keeping the newest contexts."""
+        if not chunks:
+            return
+
+        contexts = list(session.retrieval_contexts or [])
+        contexts.append({
+            "query": retrieval_query,
+            "query_embedding": query_embedding,
+            "chunk_ids": [chunk["chunk_id"] for chunk in chunks],
+            "folder_generation": generation
+        })
+        contexts = contexts[-self.max_retrieval_contexts:]
+
+        retrieved = dict(session.retrieved_chunks or {})
+        retrieved.update({chunk["chunk_id"]: chunk for chunk in chunks})
+
+        # Drop chunks no remaining context refers to
+        referenced = {chunk_id for context in contexts for chunk_id in context["chunk_ids"]}
+
+        # JSON columns don't track in-place changes, so assign new objects
+        session.retrieval_contexts = contexts
+        session.retrieved_chunks = {
+            chunk_id: chunk for chunk_id, chunk in retrieved.items() if chunk_id in referenced
+        }
+
+    def history_messages(self, session: ConversationSession) -> List[Dict[str, str]]:
+        """Prompt messages for the summary and the turns not yet summarized."""
+        messages = []
+        if session.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{session.summary}"
+            })
+
+        for turn in session.turns[session.summarized_turns:]:
+            messages.append({"role": "user", "content": turn.question})
+            messages.append({"role": "assistant", "content": turn.answer})
+
+        return messages
+
+    async def compact(self, session: ConversationSession) -> None:
+        """
+        Fold the oldest turns into the summary once 2 * history_turns are unsummarized.
+
+        The newest history_turns stay verbatim, so the prompt carries the
+        summary plus between history_turns and 2 * history_turns - 1 turns.
+        A failed summary is logged and retried on the next turn.
+        """
+        unsummarized = session.turns[session.summarized_turns:]
+        if len(unsummarized) < 2 * self.history_turns:
+            return
+
+        to_fold = unsummarized[:-self.history_turns]
+        try:
+            session.summary = await openai_service.summarize_conversation(
+                session.summary,
+                [{"question": turn.question, "answer": turn.answer} for turn in to_fold],
+                max_tokens=self.summary_max_tokens
+            )
+            session.summarized_turns += len(to_fold)
+            logger.info(f"Session {session.id}: summarized {len(to_fold)} turns")
+        except Exception as e:
+            logger.warning(f"Session {session.id}: failed to compact history: {str(e)}")
+
+
+# Singleton instance
+conversation_service = ConversationService(
+    history_turns=settings.SESSION_HISTORY_TURNS,
+    summary_max_tokens=settings.SESSION_SUMMARY_MAX_TOKENS,
+    reuse_similarity=settings.SESSION_REUSE_SIMILARITY,
+    max_retrieval_contexts=settings.SESSION_MAX_RETRIEVAL_CONTEXTS
+)
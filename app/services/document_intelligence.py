@@ -87,9 +87,12 @@ class DocumentIntelligenceService:
             if result.key_value_pairs:
                 for kv_pair in result.key_value_pairs:
                     if kv_pair.key and kv_pair.value:
+                        regions = kv_pair.key.bounding_regions
                         extracted_data["key_value_pairs"].append({
                             "key": kv_pair.key.content,
-                            "value": kv_pair.value.content
+                            "value": kv_pair.value.content,
+                            "confidence": kv_pair.confidence,
+                            "page_number": regions[0].page_number if regions else None
                         })
 
             logger.info(f"Successfully analyzed document: {document_url}")
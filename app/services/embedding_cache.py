@@ -0,0 +1,193 @@
+"""
+Query Embedding Cache
+
+Caches query embeddings keyed by normalized text and embedding deployment so
+repeated questions skip the Azure OpenAI round trip.
+
+Two tiers:
+1. In-memory LRU with TTL (always on)
+2. Optional SQLite file on disk that survives restarts
+"""
+
+from app.core.config import settings
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from array import array
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text for cache keys (case and whitespace insensitive)."""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: int = 86400,
+        disk_path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @staticmethod
+    def make_key(text: str, deployment: str) -> str:
+        """Build a cache key from the normalized text and embedding deployment."""
+        raw = f"{deployment}\x00{normalize_query(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, text: str, deployment: str) -> Optional[List[float]]:
+        """
+        Look up a cached embedding.
+
+        Args:
+            text: Query text (normalized internally)
+            deployment: Embedding deployment name
+
+        Returns:
+            Embedding vector, or None on a miss
+        """
+        key = self.make_key(text, deployment)
+
+        embedding = self._get_memory(key)
+        if embedding is not None:
+            self.memory_hits += 1
+            return embedding
+
+        if self._disk is not None:
+            found = await asyncio.to_thread(self._get_disk, key)
+            if found is not None:
+                created_at, embedding = found
+                self._set_memory(key, embedding, created_at)
+                self.disk_hits += 1
+                return embedding
+
+        self.misses += 1
+        return None
+
+    async def set(self, text: str, deployment: str, embedding: List[float]) -> None:
+        """
+        Store an embedding in both tiers.
+
+        Args:
+            text: Query text (normalized internally)
+            deployment: Embedding deployment name
+            embedding: Embedding vector
+        """
+        key = self.make_key(text, deployment)
+        created_at = time.time()
+        self._set_memory(key, embedding, created_at)
+
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._set_disk, key, embedding, created_at)
+            except Exception as e:
+                # The disk tier is best effort; never fail a request because of it
+                logger.warning(f"Failed to persist embedding to disk cache: {str(e)}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for the cache."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "entries": len(self._entries),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "disk_enabled": self._disk is not None
+        }
+
+    def clear(self) -> None:
+        """Drop all in-memory entries (the disk tier is left untouched)."""
+        self._entries.clear()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _get_memory(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        created_at, embedding = entry
+        if self._is_expired(created_at):
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return embedding
+
+    def _set_memory(self, key: str, embedding: List[float], created_at: float) -> None:
+        self._entries[key] = (created_at, embedding)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, created_at REAL NOT NULL, embedding BLOB NOT NULL)"
+            )
+            self._disk.commit()
+            logger.info(f"Embedding disk cache opened at {path}")
+        except Exception as e:
+            logger.error(f"Failed to open embedding disk cache at {path}: {str(e)}")
+            self._disk = None
+
+    def _get_disk(self, key: str) -> Optional[Tuple[float, List[float]]]:
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT created_at, embedding FROM embeddings WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            created_at, blob = row
+            if self._is_expired(created_at):
+                self._disk.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._disk.commit()
+                return None
+
+        return created_at, array("f", blob).tolist()
+
+    def _set_disk(self, key: str, embedding: List[float], created_at: float) -> None:
+        with self._disk_lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO embeddings (key, created_at, embedding) VALUES (?, ?, ?)",
+                (key, created_at, array("f", embedding).tobytes())
+            )
+            self._disk.commit()
+
+
+# Singleton instance
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+    disk_path=settings.EMBEDDING_CACHE_DISK_PATH
+)
@@ -0,0 +1,123 @@
+"""
+Folder Generation Counters
+
+Every folder has a generation number that is bumped whenever its set of
+indexed documents changes (upload, delete, indexing completed, metadata
+merged into the chunks). Caches record the generation they were filled at
+and treat any entry from an older generation as stale, so no cache needs to
+know which documents an entry depended on.
+
+The generation is stored on the folder row (folders.generation) and bumped
+in the same transaction as the change, so every API worker and the indexing
+worker agree on it. Each process keeps a mirror of the generations it has
+seen: requests that load a folder row pass its generation to observe()
+(or call refresh()) before touching a cache, which brings the mirror up to
+date and lets caches compare against it synchronously with get().
+
+Listeners can subscribe to be told when a folder's generation moves on so
+they can free memory eagerly instead of on next lookup.
+"""
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.folder import Folder
+from typing import Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FolderGenerationTracker:
+    def __init__(self):
+        self._generations: Dict[int, int] = {}
+        self._listeners: List[Callable[[int], None]] = []
+
+    def get(self, folder_id: int) -> int:
+        """Return the last generation this process has seen for a folder (0 if none)."""
+        return self._generations.get(int(folder_id), 0)
+
+    def observe(self, folder_id: int, generation: Optional[int]) -> int:
+        """
+        Record the generation read from a folder row.
+
+        Listeners are notified when it is newer than the one this process
+        last saw (the folder changed through another worker).
+
+        Args:
+            folder_id: The folder the row belongs to
+            generation: Value of folders.generation
+
+        Returns:
+            The folder's current generation
+        """
+        folder_id = int(folder_id)
+        generation = int(generation or 0)
+        if generation > self._generations.get(folder_id, 0):
+            self._generations[folder_id] = generation
+            self._notify(folder_id)
+        return self.get(folder_id)
+
+    async def refresh(self, db: AsyncSession, folder_id: int) -> int:
+        """
+        Read a folder's generation from the database and observe it.
+
+        Use where the request hasn't loaded the folder row already.
+
+        Returns:
+            The folder's current generation (0 if the folder doesn't exist)
+        """
+        result = await db.execute(select(Folder.generation).where(Folder.id == folder_id))
+        return self.observe(folder_id, result.scalar_one_or_none() or 0)
+
+    async def bump(self, db: AsyncSession, folder_id: int) -> Optional[int]:
+        """
+        Mark a folder's contents as changed.
+
+        The increment joins the caller's transaction, so it becomes visible to
+        other workers when the change itself is committed. This process's
+        mirror is not touched: pass the result to observe() once the commit
+        succeeds, so a rolled-back bump can't leave the mirror ahead of the
+        database.
+
+        Args:
+            db: Database session the change is being made in
+            folder_id: The folder whose documents changed
+
+        Returns:
+            The new generation number, or None if the folder doesn't exist
+        """
+        folder_id = int(folder_id)
+        result = await db.execute(
+            update(Folder)
+            .where(Folder.id == folder_id)
+            .values(generation=Folder.generation + 1)
+            .returning(Folder.generation)
+        )
+        generation = result.scalar_one_or_none()
+        if generation is None:
+            logger.warning(f"Folder {folder_id} not found, generation not bumped")
+            return None
+
+        logger.info(f"Folder {folder_id} generation bumped to {generation} (pending commit)")
+        return generation
+
+    def discard(self, folder_id: int) -> None:
+        """Forget a deleted folder and let listeners drop its entries."""
+        folder_id = int(folder_id)
+        self._generations.pop(folder_id, None)
+        self._notify(folder_id)
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        """Register a callback invoked with the folder ID whenever its generation changes."""
+        self._listeners.append(listener)
+
+    def _notify(self, folder_id: int) -> None:
+        for listener in self._listeners:
+            try:
+                listener(folder_id)
+            except Exception as e:
+                logger.error(f"Folder generation listener failed for folder {folder_id}: {str(e)}")
+
+
+# Singleton instance
+folder_generations = FolderGenerationTracker()
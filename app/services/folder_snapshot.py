@@ -0,0 +1,330 @@
+"""
+Folder Chunk Snapshots
+
+Exports a folder's indexed chunks to disk in a format that can be memory-
+mapped without parsing, so the local retrieval engine, offline evaluation and
+cold-start warmup can read one copy instead of each re-downloading JSON from
+the search index.
+
+Layout of a snapshot (one directory per folder):
+
+    folder-<id>/
+        manifest.json           format version, dtype, dimensions, segments,
+                                document IDs covered
+        segment-00000/
+            vectors.npy         (chunks, dimensions) float16 or float32
+            page_number.npy     (chunks,) int32, -1 when unknown
+            <column>.offsets.npy  (chunks + 1,) int64 byte offsets into
+            <column>.bin          the UTF-8 blob, for chunk_id, document_id,
+                                  title and text
+
+Segments are immutable. A new segment is written to a temporary directory and
+renamed into place, then the manifest is replaced atomically, so a reader
+sees either the old or the new snapshot, never a partial one. An append adds
+a segment holding only documents not yet in the snapshot; a full export
+replaces all segments.
+
+Usage:
+    python -m app.services.folder_snapshot --folder-id 3 [--append] [--dtype float16]
+"""
+
+from app.core.config import settings
+from app.services.indexer_service import indexer_service
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "finance-rag-folder-snapshot"
+VERSION = 1
+
+STRING_COLUMNS = ["chunk_id", "document_id", "title", "text"]
+VECTOR_DTYPES = ("float16", "float32")
+
+
+def snapshot_path(directory: str, folder_id: int) -> str:
+    return os.path.join(directory, f"folder-{folder_id}")
+
+
+def _fsync_directory(path: str) -> None:
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _write_file(path: str, data: bytes) -> None:
+    with open(path, "wb") as handle:
+        handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def _save_array(path: str, array: "np.ndarray") -> None:
+    with open(path, "wb") as handle:
+        np.save(handle, array)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+class SnapshotSegment:
+    """One immutable segment, memory-mapped read-only."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.page_numbers = np.load(os.path.join(path, "page_number.npy"), mmap_mode="r")
+        self._columns = {}
+        for column in STRING_COLUMNS:
+            offsets = np.load(os.path.join(path, f"{column}.offsets.npy"), mmap_mode="r")
+            blob_path = os.path.join(path, f"{column}.bin")
+            # numpy can't map an empty file
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+            self._columns[column] = (offsets, blob)
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def string(self, column: str, row: int) -> str:
+        offsets, blob = self._columns[column]
+        return blob[int(offsets[row]):int(offsets[row + 1])].tobytes().decode("utf-8")
+
+    def chunk(self, row: int) -> Dict[str, Any]:
+        page_number = int(self.page_numbers[row])
+        return {
+            **{column: self.string(column, row) for column in STRING_COLUMNS},
+            "page_number": page_number if page_number >= 0 else None
+        }
+
+
+class FolderSnapshot:
+    """
+    Read-only view of a folder snapshot.
+
+    Vectors stay memory-mapped in their stored dtype; text is decoded only
+    for the chunks that are accessed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as handle:
+            self.manifest = json.load(handle)
+        if self.manifest.get("format") != FORMAT or self.manifest.get("version") != VERSION:
+            raise ValueError(f"Unsupported snapshot format in {path}")
+        self.segments = [SnapshotSegment(os.path.join(path, segment["name"])) for segment in self.manifest["segments"]]
+
+    @classmethod
+    def open(cls, directory: str, folder_id: int) -> "FolderSnapshot":
+        return cls(snapshot_path(directory, folder_id))
+
+    def __len__(self) -> int:
+        return sum(len(segment) for segment in self.segments)
+
+    @property
+    def document_ids(self) -> List[str]:
+        return self.manifest["documents"]
+
+    def vectors(self) -> "np.ndarray":
+        """All vectors as one matrix (zero-copy when there is one segment)."""
+        if len(self.segments) == 1:
+            return self.segments[0].vectors
+        dimensions = self.manifest["dimensions"]
+        if not self.segments:
+            return np.zeros((0, dimensions), dtype=self.manifest["dtype"])
+        return np.concatenate([segment.vectors for segment in self.segments])
+
+    def iter_chunks(self, include_vectors: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Yield chunks in snapshot order.
+
+        Args:
+            include_vectors: Add each chunk's vector (a read-only view) as "vector"
+        """
+        for segment in self.segments:
+            for row in range(len(segment)):
+                chunk = segment.chunk(row)
+                if include_vectors:
+                    chunk["vector"] = segment.vectors[row]
+                yield chunk
+
+
+def _build_segment(path: str, chunks: List[Dict[str, Any]], dtype: str, dimensions: int) -> None:
+    vectors = np.zeros((len(chunks), dimensions), dtype=dtype)
+    page_numbers = np.full(len(chunks), -1, dtype=np.int32)
+    for row, chunk in enumerate(chunks):
+        vector = chunk.get("text_vector")
+        if vector is not None and len(vector) == dimensions:
+            vectors[row] = vector
+        # The chunk_id's _pages_<n> suffix is SplitSkill's chunk ordinal, not a page
+        if chunk.get("page_number") is not None:
+            page_numbers[row] = int(chunk["page_number"])
+
+    _save_array(os.path.join(path, "vectors.npy"), vectors)
+    _save_array(os.path.join(path, "page_number.npy"), page_numbers)
+
+    sources = {"chunk_id": "chunk_id", "document_id": "document_id", "title": "title", "text": "chunk"}
+    for column in STRING_COLUMNS:
+        encoded = [str(chunk.get(sources[column]) or "").encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+        _save_array(os.path.join(path, f"{column}.offsets.npy"), offsets)
+        _write_file(os.path.join(path, f"{column}.bin"), b"".join(encoded))
+
+
+def write_snapshot(
+    path: str,
+    folder_id: int,
+    chunks: List[Dict[str, Any]],
+    dtype: str = "float32",
+    append: bool = False
+) -> Dict[str, Any]:
+    """
+    Write chunks as a new segment and publish it in the manifest.
+
+    Args:
+        path: Snapshot directory of the folder
+        folder_id: Folder the chunks belong to
+        chunks: Index documents (chunk_id, document_id, title, chunk, text_vector)
+        dtype: Vector dtype for a new snapshot ("float16" or "float32")
+        append: Keep existing segments; otherwise they are replaced
+
+    Returns:
+        The new manifest
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    os.makedirs(path, exist_ok=True)
+
+    manifest_path = os.path.join(path, "manifest.json")
+    previous = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as handle:
+            previous = json.load(handle)
+
+    if append and previous is not None:
+        dtype, dimensions = previous["dtype"], previous["dimensions"]
+        segments, documents = list(previous["segments"]), set(previous["documents"])
+    else:
+        dimensions = max((len(chunk.get("text_vector") or []) for chunk in chunks), default=0)
+        segments, documents = [], set()
+
+    if chunks:
+        existing = [name for name in os.listdir(path) if name.startswith("segment-")]
+        number = max((int(name[8:13]) for name in existing if name[8:13].isdigit()), default=-1) + 1
+        name = f"segment-{number:05d}"
+
+        staging = os.path.join(path, f".{name}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(staging)
+        try:
+            _build_segment(staging, chunks, dtype, dimensions)
+            _fsync_directory(staging)
+            os.rename(staging, os.path.join(path, name))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        segment_documents = sorted({str(chunk.get("document_id")) for chunk in chunks if chunk.get("document_id") is not None})
+        segments.append({"name": name, "chunks": len(chunks), "documents": segment_documents})
+        documents.update(segment_documents)
+
+    now = datetime.now(timezone.utc).isoformat()
+    manifest = {
+        "format": FORMAT,
+        "version": VERSION,
+        "folder_id": folder_id,
+        "dtype": dtype,
+        "dimensions": dimensions,
+        "chunks": sum(segment["chunks"] for segment in segments),
+        "documents": sorted(documents),
+        "segments": segments,
+        "created_at": previous["created_at"] if append and previous else now,
+        "updated_at": now
+    }
+
+    staging_manifest = os.path.join(path, f".manifest.{uuid.uuid4().hex}.tmp")
+    _write_file(staging_manifest, json.dumps(manifest, indent=2).encode("utf-8"))
+    os.replace(staging_manifest, manifest_path)
+    _fsync_directory(path)
+
+    # Segments no longer referenced (replaced by a full export); open
+    # readers keep their mappings until they close them
+    referenced = {segment["name"] for segment in segments}
+    for name in os.listdir(path):
+        if name.startswith("segment-") and name not in referenced:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+    return manifest
+
+
+async def export_folder_snapshot(
+    folder_id: int,
+    directory: Optional[str] = None,
+    dtype: Optional[str] = None,
+    append: bool = False
+) -> Dict[str, Any]:
+    """
+    Export a folder's chunks from the search index to a snapshot.
+
+    Args:
+        folder_id: Folder to export
+        directory: Snapshot root (default SNAPSHOT_DIR)
+        dtype: Vector dtype for a new snapshot (default SNAPSHOT_VECTOR_DTYPE)
+        append: Only add documents not yet in the snapshot
+
+    Returns:
+        The snapshot manifest
+    """
+    path = snapshot_path(directory or settings.SNAPSHOT_DIR, folder_id)
+
+    known_documents: List[str] = []
+    if append and os.path.exists(os.path.join(path, "manifest.json")):
+        known_documents = FolderSnapshot(path).document_ids
+
+    try:
+        fields = ["chunk_id", "document_id", "title", "chunk", "page_number", indexer_service.VECTOR_FIELD]
+        chunks: List[Dict[str, Any]] = []
+        async for page in indexer_service.iter_folder_chunks(folder_id, fields, exclude_document_ids=known_documents):
+            chunks.extend(page)
+
+        manifest = await asyncio.to_thread(
+            write_snapshot, path, folder_id, chunks, dtype or settings.SNAPSHOT_VECTOR_DTYPE, append
+        )
+        logger.info(f"Exported {len(chunks)} chunks of folder {folder_id} to {path} ({manifest['chunks']} in snapshot)")
+        return manifest
+
+    except Exception as e:
+        logger.error(f"Error exporting snapshot of folder {folder_id}: {str(e)}")
+        raise
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a folder's indexed chunks to a memory-mappable snapshot")
+    parser.add_argument("--folder-id", type=int, required=True)
+    parser.add_argument("--output", default=settings.SNAPSHOT_DIR, help="Snapshot root directory")
+    parser.add_argument("--dtype", choices=VECTOR_DTYPES, default=settings.SNAPSHOT_VECTOR_DTYPE)
+    parser.add_argument("--append", action="store_true", help="Only add documents not yet in the snapshot")
+    args = parser.parse_args()
+
+    async def run() -> Dict[str, Any]:
+        try:
+            return await export_folder_snapshot(args.folder_id, args.output, args.dtype, args.append)
+        finally:
+            await indexer_service.close()
+
+    manifest = asyncio.run(run())
+    print(f"{snapshot_path(args.output, args.folder_id)}: {manifest['chunks']} chunks, "
+          f"{len(manifest['documents'])} documents, {len(manifest['segments'])} segments")
+
+
+if __name__ == "__main__":
+    main()
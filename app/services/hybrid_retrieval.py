@@ -0,0 +1,173 @@
+"""
+Parallel Hybrid Retrieval with Reciprocal Rank Fusion
+
+Splits hybrid search into its two legs so they don't wait on each other:
+the keyword (BM25) leg needs only the query text and starts immediately,
+while the vector leg starts as soon as the query embedding is ready. The two
+ranked lists are fused locally with weighted reciprocal rank fusion (RRF):
+
+    score(d) = sum_i  w_i / (k + rank_i(d))
+
+Chat retrieval latency becomes roughly max(embedding, keyword search) plus the
+vector search, instead of embedding + one combined search.
+"""
+
+from app.core.config import settings
+from app.services.indexer_service import indexer_service
+from typing import List, Dict, Any, Optional, Sequence
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Positions of the legs in the fused results' "leg_scores"
+KEYWORD_LEG = 0
+VECTOR_LEG = 1
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Sequence[List[Dict[str, Any]]],
+    weights: Sequence[float],
+    k: int = 60,
+    key: str = "chunk_id"
+) -> List[Dict[str, Any]]:
+    """
+    Fuse ranked result lists with weighted reciprocal rank fusion.
+
+    The fused "score" is normalized to [0, 1] by the best possible score (rank
+    1 in every list), so it stays comparable to a relevance score. The original
+    per-list scores are kept under "leg_scores".
+
+    Args:
+        ranked_lists: Result lists, each ordered best first
+        weights: Weight per list
+        k: RRF rank constant; larger values flatten the rank curve
+        key: Result field that identifies the same chunk across lists
+
+    Returns:
+        Fused results ordered by fused score (ties keep first-seen order)
+    """
+    max_score = sum(weights) / (k + 1)
+    fused: Dict[Any, Dict[str, Any]] = {}
+
+    for list_index, (results, weight) in enumerate(zip(ranked_lists, weights)):
+        for rank, result in enumerate(results, 1):
+            result_key = result.get(key)
+            entry = fused.get(result_key)
+            if entry is None:
+                entry = {**result, "score": 0.0, "leg_scores": {}}
+                fused[result_key] = entry
+            entry["score"] += weight / (k + rank)
+            entry["leg_scores"][list_index] = result.get("score")
+
+    ordered = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    for entry in ordered:
+        entry["score"] = entry["score"] / max_score if max_score else 0.0
+
+    return ordered
+
+
+class HybridRetriever:
+    def __init__(
+        self,
+        k: int = 60,
+        keyword_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        leg_depth: int = 20
+    ):
+        self.k = k
+        self.keyword_weight = keyword_weight
+        self.vector_weight = vector_weight
+        self.leg_depth = leg_depth
+
+    def start_keyword_leg(
+        self,
+        query: str,
+        folder_id: int,
+        top: int = 5,
+        include_vectors: bool = False
+    ) -> "asyncio.Task":
+        """
+        Start the keyword leg in the background.
+
+        Call this before awaiting the query embedding so both run concurrently.
+        The caller owns the task and must cancel it if it is not consumed.
+
+        Args:
+            query: The search query text
+            folder_id: Folder ID to filter by
+            top: Fused results retrieve() will be asked for
+            include_vectors: Also return each chunk's embedding as "vector"
+        """
+        return asyncio.create_task(
+            indexer_service.keyword_search(
+                query=query,
+                folder_id=folder_id,
+                top=max(self.leg_depth, top),
+                include_vectors=include_vectors
+            )
+        )
+
+    async def retrieve(
+        self,
+        query: str,
+        query_vector: List[float],
+        folder_id: int,
+        top: int = 5,
+        keyword_task: Optional["asyncio.Task"] = None,
+        include_vectors: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Run both legs and fuse them.
+
+        Each leg fetches at least `top` results, so fusing can fill a large
+        candidate pool.
+
+        Args:
+            query: The search query text
+            query_vector: The query embedding vector
+            folder_id: Folder ID to filter by
+            top: Number of fused results to return
+            keyword_task: Keyword leg started earlier with start_keyword_leg
+                (with the same top and include_vectors)
+            include_vectors: Also return each chunk's embedding as "vector"
+
+        Returns:
+            Top fused results
+        """
+        if keyword_task is None:
+            keyword_task = self.start_keyword_leg(query, folder_id, top, include_vectors)
+
+        try:
+            vector_results = await indexer_service.vector_search(
+                query_vector=query_vector,
+                folder_id=folder_id,
+                top=max(self.leg_depth, top),
+                include_vectors=include_vectors
+            )
+            keyword_results = await keyword_task
+        finally:
+            if not keyword_task.done():
+                keyword_task.cancel()
+
+        # Same order as KEYWORD_LEG and VECTOR_LEG
+        fused = reciprocal_rank_fusion(
+            [keyword_results, vector_results],
+            [self.keyword_weight, self.vector_weight],
+            k=self.k
+        )
+
+        logger.info(
+            f"Fused {len(keyword_results)} keyword and {len(vector_results)} vector results "
+            f"into {len(fused)} for folder {folder_id}"
+        )
+        return fused[:top]
+
+
+# Singleton instance
+hybrid_retriever = HybridRetriever(
+    k=settings.RRF_K,
+    keyword_weight=settings.RRF_KEYWORD_WEIGHT,
+    vector_weight=settings.RRF_VECTOR_WEIGHT,
+    leg_depth=settings.RRF_LEG_DEPTH
+)
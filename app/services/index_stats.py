@@ -0,0 +1,97 @@
+"""
+Cached Index Statistics
+
+Chunk counts per folder (total, per document, per page range) come from one
+top=0 count-and-facets query each (IndexerService.get_index_stats). They are
+cached per folder for INDEX_STATS_TTL_SECONDS, tagged with the folder
+generation, and dropped when the folder's documents are uploaded, deleted or
+indexed. The TTL bounds staleness from changes this worker didn't see
+(ingestion finishing in another worker).
+"""
+
+from app.core.config import settings
+from app.services.folder_generations import folder_generations
+from app.services.indexer_service import indexer_service
+from typing import Any, Dict, List
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IndexStatsCache:
+    def __init__(self, ttl_seconds: int = 300, max_concurrency: int = 8):
+        """
+        Args:
+            ttl_seconds: How long a folder's stats are served from cache
+            max_concurrency: Stats queries run at once for a multi-folder request
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_concurrency = max_concurrency
+
+        self._entries: Dict[int, Dict[str, Any]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    async def folder_stats(self, folder_id: int) -> Dict[str, Any]:
+        """
+        Index statistics for one folder.
+
+        Returns:
+            get_index_stats output plus "cached" and "computed_at" (epoch seconds)
+        """
+        generation = folder_generations.get(folder_id)
+        entry = self._entries.get(folder_id)
+        if entry is not None and entry["generation"] == generation and entry["expires_at"] > time.monotonic():
+            self.hits += 1
+            return {**entry["stats"], "cached": True}
+
+        self.misses += 1
+        stats = await indexer_service.get_index_stats(folder_id)
+        stats["computed_at"] = round(time.time(), 3)
+
+        # Skip storing if the folder changed while the query ran
+        if generation == folder_generations.get(folder_id):
+            self._entries[folder_id] = {
+                "stats": stats,
+                "generation": generation,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+        return {**stats, "cached": False}
+
+    async def folders_stats(self, folder_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Index statistics for several folders; uncached folders are queried concurrently.
+
+        Returns:
+            folder_id -> stats
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def one(folder_id: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.folder_stats(folder_id)
+
+        results = await asyncio.gather(*(one(folder_id) for folder_id in folder_ids))
+        return dict(zip(folder_ids, results))
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop a folder's stats (registered as a folder generation listener)."""
+        self._entries.pop(int(folder_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "folders": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+# Singleton instance
+index_stats_cache = IndexStatsCache(ttl_seconds=settings.INDEX_STATS_TTL_SECONDS)
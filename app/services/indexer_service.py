@@ -5,30 +5,134 @@ This service manages the Azure AI Search indexer for RAG document processing.
 Replaces the manual per-folder index approach with a single index and folder filtering.
 """
 
-from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient
 from azure.search.documents.models import VectorizedQuery
 from azure.core.credentials import AzureKeyCredential
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import AioHttpTransport
 from app.core.config import settings
-from typing import List, Dict, Any, Optional
+from app.services.folder_generations import folder_generations
+from app.services.local_index import local_retrieval_engine, LocalFolderIndex
+from app.services.retrieval_cache import retrieval_cache
+from typing import AsyncIterator, List, Dict, Any, Optional
+import aiohttp
+import asyncio
+import base64
+import hashlib
+import json
 import logging
 import httpx
 
 logger = logging.getLogger(__name__)
 
 
+def _cursor_fingerprint(query: str, folder_id: int) -> str:
+    return hashlib.sha256(f"{folder_id}:{' '.join(query.lower().split())}".encode()).hexdigest()[:16]
+
+
+def encode_search_cursor(query: str, folder_id: int, offset: int) -> str:
+    """Opaque continuation token for search_page."""
+    payload = json.dumps({"o": offset, "f": _cursor_fingerprint(query, folder_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_search_cursor(cursor: str, query: str, folder_id: int) -> int:
+    """Offset encoded in a cursor. Raises ValueError for a bad cursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset, fingerprint = int(payload["o"]), payload["f"]
+    except Exception:
+        raise ValueError("Malformed search cursor")
+    if fingerprint != _cursor_fingerprint(query, folder_id) or offset < 0:
+        raise ValueError("Search cursor does not match this query")
+    return offset
+
+
 class IndexerService:
-    def __init__(self):
+    RESULT_FIELDS = ["chunk_id", "chunk", "title", "document_id", "parent_id", "folder_id", "user_id"]
+    # Index key. iter_folder_chunks pages on it, which needs it filterable
+    # and sortable in finance-folder-2; if the service rejects that, paging
+    # falls back to $skip (capped at MAX_SKIP chunks per folder)
+    KEY_FIELD = "chunk_id"
+    VECTOR_FIELD = "text_vector"
+    # Azure AI Search rejects larger $skip values
+    MAX_SKIP = 100000
+    # Facets for get_index_stats (page ranges are STATS_PAGE_RANGE pages wide)
+    STATS_PAGE_RANGE = 10
+    STATS_FACETS = ["folder_id,count:1000", "document_id,count:1000", f"page_number,interval:{STATS_PAGE_RANGE}"]
+
+    def __init__(self, search_client: Optional[Any] = None):
         self.endpoint = settings.AZURE_SEARCH_ENDPOINT
         self.credential = AzureKeyCredential(settings.AZURE_SEARCH_KEY)
         self.index_name = "finance-folder-2"
         self.indexer_name = "finance-folder-2-indexer"
 
-        self.search_client = SearchClient(
+        # Async client sharing one pooled aiohttp session; created by startup()
+        # (or lazily on first use). A fake client can be injected for benchmarks.
+        self._search_client = search_client
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._startup_lock = asyncio.Lock()
+        self._stats_facets: Optional[List[str]] = None
+        self._stats_facets_lock = asyncio.Lock()
+        # Set once the index rejects keyset paging on KEY_FIELD
+        self._keyset_unsupported = False
+
+    async def startup(self) -> None:
+        """
+        Create the shared, connection-pooled search client.
+
+        Called from the application lifespan so the first request doesn't pay
+        for session setup. Safe to call more than once, including concurrently:
+        only one session and client are ever created.
+        """
+        if self._search_client is not None:
+            return
+
+        async with self._startup_lock:
+            if self._search_client is None:
+                self._create_search_client()
+
+    def _create_search_client(self) -> None:
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.AZURE_SEARCH_MAX_CONNECTIONS,
+                keepalive_timeout=settings.AZURE_SEARCH_KEEPALIVE_SECONDS
+            ),
+            # Same session options AioHttpTransport uses when it owns the session
+            cookie_jar=aiohttp.DummyCookieJar(),
+            auto_decompress=False,
+            trust_env=True
+        )
+        transport = AioHttpTransport(session=self._session, session_owner=False)
+
+        self._search_client = SearchClient(
             endpoint=self.endpoint,
             index_name=self.index_name,
-            credential=self.credential
+            credential=self.credential,
+            transport=transport
+        )
+        logger.info(
+            f"Search client ready for index {self.index_name} "
+            f"(max {settings.AZURE_SEARCH_MAX_CONNECTIONS} pooled connections)"
         )
 
+    async def close(self) -> None:
+        """Close the search client and its pooled session."""
+        if self._search_client is not None:
+            await self._search_client.close()
+            self._search_client = None
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            logger.info("Search client session closed")
+
+    async def get_search_client(self) -> SearchClient:
+        """The shared async search client, created on first use."""
+        if self._search_client is None:
+            await self.startup()
+        return self._search_client
+
     async def trigger_indexer_run(self, wait_for_completion: bool = False) -> Dict[str, Any]:
         """
         Trigger the indexer to run immediately.
@@ -104,7 +208,8 @@ class IndexerService:
         query: str,
         query_vector: List[float],
         folder_id: int,
-        top: int = 5
+        top: int = 5,
+        include_vectors: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Perform vector search with folder isolation filter.
@@ -114,41 +219,34 @@ class IndexerService:
             query_vector: The query embedding vector
             folder_id: Folder ID to filter by
             top: Number of results to return
+            include_vectors: Also return each chunk's embedding as "vector"
 
         Returns:
             List of search results
         """
         try:
+            local = self._local_index(folder_id)
+            if local is not None:
+                ranked = local.hybrid_search(query, query_vector, top)
+                return [local.result(row, score, include_vectors) for row, score in ranked]
+
             # Create vector query
             vector_query = VectorizedQuery(
                 vector=query_vector,
                 k_nearest_neighbors=top,
-                fields="text_vector"
+                fields=self.VECTOR_FIELD
             )
 
             # Search with folder filter (hybrid search: vector + text)
-            # Note: folder_id is Edm.String, so we need quotes in the filter
-            results = self.search_client.search(
+            search_results = await self._search(
+                cache_folder_id=folder_id,
                 search_text=query,
                 vector_queries=[vector_query],
-                filter=f"folder_id eq '{folder_id}'",
-                select=["chunk", "title", "document_id", "parent_id", "folder_id", "user_id"],
+                filter=self._folder_filter(folder_id),
+                select=self._select(include_vectors),
                 top=top
             )
 
-            # Convert results to list
-            search_results = []
-            for result in results:
-                search_results.append({
-                    "score": result.get("@search.score", 0),
-                    "content": result.get("chunk", ""),
-                    "title": result.get("title", ""),
-                    "document_id": result.get("document_id"),
-                    "parent_id": result.get("parent_id"),
-                    "folder_id": result.get("folder_id"),
-                    "user_id": result.get("user_id")
-                })
-
             logger.info(f"Search completed: {len(search_results)} results found for folder {folder_id}")
             return search_results
 
@@ -156,6 +254,365 @@ class IndexerService:
             logger.error(f"Error searching index: {str(e)}")
             raise
 
+    async def keyword_search(
+        self,
+        query: str,
+        folder_id: int,
+        top: int = 20,
+        include_vectors: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the keyword (BM25) leg of hybrid retrieval on its own.
+
+        Needs no embedding, so it can run while the query embedding is in flight.
+
+        Args:
+            query: The search query text
+            folder_id: Folder ID to filter by
+            top: Number of results to return
+            include_vectors: Also return each chunk's embedding as "vector"
+
+        Returns:
+            List of search results ranked by keyword score
+        """
+        try:
+            local = self._local_index(folder_id)
+            if local is not None:
+                ranked = local.keyword_search(query, top)
+                return [local.result(row, score, include_vectors) for row, score in ranked]
+
+            return await self._search(
+                cache_folder_id=folder_id,
+                search_text=query,
+                filter=self._folder_filter(folder_id),
+                select=self._select(include_vectors),
+                top=top
+            )
+
+        except Exception as e:
+            logger.error(f"Error running keyword search: {str(e)}")
+            raise
+
+    async def vector_search(
+        self,
+        query_vector: List[float],
+        folder_id: int,
+        top: int = 20,
+        include_vectors: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the vector leg of hybrid retrieval on its own.
+
+        Args:
+            query_vector: The query embedding vector
+            folder_id: Folder ID to filter by
+            top: Number of results to return
+            include_vectors: Also return each chunk's embedding as "vector"
+
+        Returns:
+            List of search results ranked by vector similarity
+        """
+        try:
+            local = self._local_index(folder_id)
+            if local is not None:
+                ranked = local.vector_search(query_vector, top)
+                return [local.result(row, score, include_vectors) for row, score in ranked]
+
+            vector_query = VectorizedQuery(
+                vector=query_vector,
+                k_nearest_neighbors=top,
+                fields=self.VECTOR_FIELD
+            )
+
+            return await self._search(
+                cache_folder_id=folder_id,
+                search_text=None,
+                vector_queries=[vector_query],
+                filter=self._folder_filter(folder_id),
+                select=self._select(include_vectors),
+                top=top
+            )
+
+        except Exception as e:
+            logger.error(f"Error running vector search: {str(e)}")
+            raise
+
+    async def iter_search(
+        self,
+        query: str,
+        folder_id: int,
+        page_size: int = 50,
+        skip: int = 0,
+        include_vectors: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield keyword search results for a folder one page at a time.
+
+        The next page is only requested when the caller iterates past the
+        current one, so stopping early stops the fetching.
+
+        Args:
+            query: The search query text
+            folder_id: Folder ID to filter by
+            page_size: Results per search request
+            skip: Results to skip before the first page
+            include_vectors: Also return each chunk's embedding as "vector"
+        """
+        while skip < self.MAX_SKIP:
+            page = await self._search(
+                search_text=query,
+                filter=self._folder_filter(folder_id),
+                select=self._select(include_vectors),
+                top=min(page_size, self.MAX_SKIP - skip),
+                skip=skip
+            )
+            for result in page:
+                yield result
+            if len(page) < page_size:
+                return
+            skip += len(page)
+
+    async def search_page(
+        self,
+        query: str,
+        folder_id: int,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Return one page of keyword search results and a cursor for the next.
+
+        Args:
+            query: The search query text
+            folder_id: Folder ID to filter by
+            limit: Results per page
+            cursor: next_cursor from the previous page, or None for the first
+
+        Returns:
+            Dictionary with results and next_cursor (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed or was issued for another query or folder
+        """
+        offset = decode_search_cursor(cursor, query, folder_id) if cursor else 0
+
+        try:
+            # One extra result tells whether there is a next page
+            results = []
+            async for result in self.iter_search(query, folder_id, page_size=limit + 1, skip=offset):
+                results.append(result)
+                if len(results) > limit:
+                    break
+
+        except Exception as e:
+            logger.error(f"Error searching index: {str(e)}")
+            raise
+
+        has_more = len(results) > limit and offset + limit < self.MAX_SKIP
+        return {
+            "results": results[:limit],
+            "next_cursor": encode_search_cursor(query, folder_id, offset + limit) if has_more else None
+        }
+
+    def _local_index(self, folder_id: int) -> Optional[LocalFolderIndex]:
+        """The folder's in-process index if it is resident; a miss starts loading it."""
+        if not settings.LOCAL_INDEX_ENABLED:
+            return None
+        return local_retrieval_engine.get(folder_id, self._load_folder_chunks)
+
+    async def _load_folder_chunks(self, folder_id: int, max_chunks: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Read all of a folder's chunks with their vectors, for the local index.
+
+        Returns:
+            The chunks, or None if the folder has more than max_chunks
+        """
+        chunks: List[Dict[str, Any]] = []
+        async for page in self.iter_folder_chunks(folder_id, self.RESULT_FIELDS + [self.VECTOR_FIELD]):
+            chunks.extend(page)
+            if len(chunks) > max_chunks:
+                return None
+        return chunks
+
+    async def iter_folder_chunks(
+        self,
+        folder_id: int,
+        fields: Optional[List[str]] = None,
+        exclude_document_ids: Optional[List[str]] = None,
+        page_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Page through every chunk in a folder, in key order.
+
+        Pages are read with a keyset cursor (KEY_FIELD gt the last key seen,
+        ordered by KEY_FIELD) rather than $skip, so the order is stable across
+        requests, chunks written or deleted by the indexer mid-read don't
+        shift later pages (no duplicates or gaps among existing chunks), and
+        folders aren't capped at MAX_SKIP chunks.
+
+        If the index rejects the cursor filter or ordering (KEY_FIELD not
+        filterable or sortable: HTTP 400), an error is logged and paging
+        continues with $skip, which has neither guarantee and stops at
+        MAX_SKIP chunks. Later calls use $skip straight away.
+
+        Args:
+            folder_id: Folder ID to filter by
+            fields: Fields to select (default RESULT_FIELDS and the vector);
+                KEY_FIELD is always included
+            exclude_document_ids: Skip chunks of these documents
+            page_size: Chunks per request (the service returns at most 1000)
+
+        Yields:
+            Pages of raw index documents
+        """
+        search_filter = self._folder_filter(folder_id)
+        if exclude_document_ids:
+            search_filter += f" and not search.in(document_id, '{','.join(exclude_document_ids)}', ',')"
+
+        select = list(fields or self.RESULT_FIELDS + [self.VECTOR_FIELD])
+        if self.KEY_FIELD not in select:
+            select.append(self.KEY_FIELD)
+
+        client = await self.get_search_client()
+        read = 0
+        if not self._keyset_unsupported:
+            last_key: Optional[str] = None
+            try:
+                while True:
+                    page_filter = search_filter
+                    if last_key is not None:
+                        escaped = last_key.replace("'", "''")
+                        page_filter += f" and {self.KEY_FIELD} gt '{escaped}'"
+
+                    results = await client.search(
+                        search_text="*",
+                        filter=page_filter,
+                        select=select,
+                        order_by=[f"{self.KEY_FIELD} asc"],
+                        top=page_size
+                    )
+                    page = [dict(result) async for result in results]
+                    if page:
+                        yield page
+                        read += len(page)
+                        last_key = page[-1][self.KEY_FIELD]
+                    if len(page) < page_size:
+                        return
+            except HttpResponseError as e:
+                if e.status_code != 400:
+                    raise
+                logger.error(
+                    f"Index {self.index_name} rejected keyset paging on {self.KEY_FIELD} "
+                    f"(it must be filterable and sortable); falling back to $skip, "
+                    f"at most {self.MAX_SKIP} chunks per folder: {str(e)}"
+                )
+
+        # Pages already read were in key order (the ordering was accepted),
+        # so keep it to continue where they stopped
+        order_by = [f"{self.KEY_FIELD} asc"] if read else None
+        skip = read
+        while True:
+            if skip >= self.MAX_SKIP:
+                logger.warning(f"Folder {folder_id} has more than {self.MAX_SKIP} chunks; stopped paging")
+                return
+
+            top = min(page_size, self.MAX_SKIP - skip)
+            results = await client.search(
+                search_text="*",
+                filter=search_filter,
+                select=select,
+                order_by=order_by,
+                top=top,
+                skip=skip
+            )
+            page = [dict(result) async for result in results]
+            # Only now: a 400 caused by something else fails here too
+            self._keyset_unsupported = True
+            if page:
+                yield page
+            if len(page) < top:
+                return
+            skip += len(page)
+
+    @staticmethod
+    def _folder_filter(folder_id: int) -> str:
+        # Note: folder_id is Edm.String, so we need quotes in the filter
+        return f"folder_id eq '{folder_id}'"
+
+    def _select(self, include_vectors: bool) -> List[str]:
+        return self.RESULT_FIELDS + [self.VECTOR_FIELD] if include_vectors else self.RESULT_FIELDS
+
+    def _to_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        converted = {
+            "chunk_id": result.get("chunk_id"),
+            "score": result.get("@search.score", 0),
+            "content": result.get("chunk", ""),
+            "title": result.get("title", ""),
+            "document_id": result.get("document_id"),
+            "parent_id": result.get("parent_id"),
+            "folder_id": result.get("folder_id"),
+            "user_id": result.get("user_id")
+        }
+        if result.get(self.VECTOR_FIELD) is not None:
+            converted["vector"] = result[self.VECTOR_FIELD]
+        return converted
+
+    async def _search(self, cache_folder_id: Optional[int] = None, **search_params) -> List[Dict[str, Any]]:
+        """
+        Run a search on the async client and convert the results to dictionaries.
+
+        Searches scoped to cache_folder_id go through the retrieval cache.
+        """
+        cache_key = None
+        if cache_folder_id is not None and settings.RETRIEVAL_CACHE_ENABLED:
+            vector_query = (search_params.get("vector_queries") or [None])[0]
+            cache_key = retrieval_cache.key(
+                self.index_name,
+                search_params.get("filter"),
+                search_params.get("search_text"),
+                vector_query.vector if vector_query is not None else None,
+                search_params.get("top"),
+                tuple(search_params.get("select") or ()),
+                vector_query.k_nearest_neighbors if vector_query is not None else None,
+                search_params.get("skip")
+            )
+            cached = retrieval_cache.get(cache_folder_id, cache_key)
+            if cached is not None:
+                return cached
+            generation = folder_generations.get(cache_folder_id)
+
+        client = await self.get_search_client()
+        results = await client.search(**search_params)
+        converted = [self._to_result(result) async for result in results]
+
+        if cache_key is not None:
+            retrieval_cache.put(cache_folder_id, cache_key, converted, generation)
+        return converted
+
+    async def has_document_chunks(self, document_id: int) -> bool:
+        """
+        Check whether any chunks for a document are in the index.
+
+        Args:
+            document_id: The document ID to check
+
+        Returns:
+            True if at least one chunk exists
+        """
+        client = await self.get_search_client()
+        # Note: document_id is Edm.String, so we need quotes in the filter
+        results = await client.search(
+            search_text="*",
+            filter=f"document_id eq '{document_id}'",
+            select=["chunk_id"],
+            top=1  # Just need to know if any exist
+        )
+
+        async for _ in results:
+            return True
+
+        return False
+
     async def delete_document_chunks(self, document_id: int) -> bool:
         """
         Delete all chunks for a specific document from the index.
@@ -167,21 +624,23 @@ class IndexerService:
             True if successful
         """
         try:
+            client = await self.get_search_client()
+
             # Search for all chunks with this document_id
             # Note: document_id is Edm.String, so we need quotes in the filter
-            results = self.search_client.search(
+            results = await client.search(
                 search_text="*",
                 filter=f"document_id eq '{document_id}'",
-                select=["id"],
+                select=["chunk_id"],
                 top=1000  # Max chunks per document
             )
 
-            # Collect document IDs to delete
-            doc_ids = [{"id": result["id"]} for result in results]
+            # Collect chunk keys to delete (chunk_id is the index key)
+            doc_ids = [{"chunk_id": result["chunk_id"]} async for result in results]
 
             if doc_ids:
                 # Delete documents
-                self.search_client.delete_documents(documents=doc_ids)
+                await client.delete_documents(documents=doc_ids)
                 logger.info(f"Deleted {len(doc_ids)} chunks for document {document_id}")
             else:
                 logger.info(f"No chunks found for document {document_id}")
@@ -196,43 +655,78 @@ class IndexerService:
         """
         Get statistics about the index.
 
+        One top=0 query: the total count gives the number of chunks, facets
+        break it down per folder (whole index only), per document and per
+        page range. Facets on fields the index can't facet are left out.
+
         Args:
             folder_id: Optional folder ID to get stats for specific folder
 
         Returns:
-            Index statistics
+            Index statistics with total_chunks, chunks_per_document,
+            chunks_per_page_range and (whole index) chunks_per_folder
         """
         try:
-            # Get total document count
-            if folder_id:
-                # Note: folder_id is Edm.String, so we need quotes in the filter
-                results = self.search_client.search(
-                    search_text="*",
-                    filter=f"folder_id eq '{folder_id}'",
-                    include_total_count=True,
-                    top=0
-                )
-            else:
-                results = self.search_client.search(
-                    search_text="*",
-                    include_total_count=True,
-                    top=0
-                )
+            client = await self.get_search_client()
+            facets = [
+                facet for facet in await self._supported_stats_facets(client)
+                if folder_id is None or not facet.startswith("folder_id,")
+            ]
 
-            # Azure Search results have a get_count() method
-            total_count = 0
-            for _ in results:
-                total_count += 1
+            results = await client.search(
+                search_text="*",
+                filter=self._folder_filter(folder_id) if folder_id else None,
+                include_total_count=True,
+                facets=facets or None,
+                top=0
+            )
+            total_count = await results.get_count()
+            facet_results = (await results.get_facets() or {}) if facets else {}
 
-            return {
-                "total_chunks": total_count,
+            stats = {
+                "total_chunks": total_count or 0,
                 "folder_id": folder_id,
-                "index_name": self.index_name
+                "index_name": self.index_name,
+                "chunks_per_document": {
+                    str(bucket["value"]): bucket["count"] for bucket in facet_results.get("document_id", [])
+                },
+                "chunks_per_page_range": [
+                    {"from": bucket["value"], "to": bucket["value"] + self.STATS_PAGE_RANGE - 1, "count": bucket["count"]}
+                    for bucket in facet_results.get("page_number", [])
+                ]
             }
+            if folder_id is None:
+                stats["chunks_per_folder"] = {
+                    str(bucket["value"]): bucket["count"] for bucket in facet_results.get("folder_id", [])
+                }
+            return stats
 
         except Exception as e:
             logger.error(f"Error getting index stats: {str(e)}")
-            return {"error": str(e)}
+            raise
+
+    async def _supported_stats_facets(self, client: Any) -> List[str]:
+        """
+        Stats facets the index accepts, probed once (not every index has page_number, or facetable IDs).
+
+        Only a 400 (field missing or not facetable) marks a facet unsupported.
+        Any other error is raised without caching the probe, so a transient
+        429 or 503 doesn't disable a stat until the next restart.
+        """
+        async with self._stats_facets_lock:
+            if self._stats_facets is None:
+                supported = []
+                for facet in self.STATS_FACETS:
+                    try:
+                        results = await client.search(search_text="*", facets=[facet], top=0)
+                        await results.get_facets()
+                        supported.append(facet)
+                    except HttpResponseError as e:
+                        if e.status_code != 400:
+                            raise
+                        logger.warning(f"Index stats facet '{facet}' not available: {str(e)}")
+                self._stats_facets = supported
+        return self._stats_facets
 
 
 # Singleton instance
@@ -0,0 +1,256 @@
+"""
+Key-Value Lookup Fast Path
+
+Document Intelligence extracts key-value pairs ("Invoice No.: 10423",
+"Fiscal Year End: June 30") and process_document stores them in
+Document.doc_metadata. A question that only asks for one of those values
+("Invoice number?") can be answered from them directly. That skips the
+embedding, the search and the completion, takes milliseconds and cites the
+document the pair came from.
+
+The fast path is deliberately conservative:
+
+- Only short questions qualify. Questions asking for reasoning ("why",
+  "compare", ...) never do.
+- The question's terms and the key's terms must match closely.
+- If matching keys in the folder disagree on the value, the question goes
+  to full RAG.
+
+Each folder's pairs are indexed in memory. The index is rebuilt when the
+folder generation changes, or after a TTL so workers that missed a bump
+catch up.
+"""
+
+from app.core.config import settings
+from app.models.document import Document
+from app.services.folder_generations import folder_generations
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import List, Dict, Any, Optional, Set
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_TERM = re.compile(r"[a-z0-9]+")
+
+# Words that carry no information about which key is meant
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "can", "could", "do", "does", "find", "for", "from",
+    "give", "i", "in", "is", "it", "its", "know", "me", "my", "of", "on", "our", "please", "show",
+    "tell", "the", "their", "this", "to", "was", "what", "whats", "when", "where", "which", "who",
+    "whom", "whose", "with", "you", "your", "listed", "stated", "document", "documents", "file"
+}
+
+# Questions containing these need reasoning over the text, not a stored value
+ANALYTICAL_TERMS = {
+    "why", "how", "explain", "describe", "compare", "comparison", "summarize", "summary", "trend",
+    "change", "changed", "difference", "impact", "affect", "analyze", "analysis", "discuss", "list"
+}
+
+# Matches scoring within this of the best must agree on the value
+AMBIGUITY_MARGIN = 0.1
+
+# Abbreviations used in form labels
+SYNONYMS = {"no": "number", "num": "number", "nbr": "number", "nr": "number", "yr": "year", "amt": "amount", "dt": "date"}
+
+
+def _terms(text: str) -> List[str]:
+    terms = []
+    for term in _TERM.findall((text or "").lower().replace("#", " number ")):
+        term = SYNONYMS.get(term, term)
+        if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+def key_terms(text: str) -> Set[str]:
+    """Informative terms of a key or question, normalized for matching."""
+    return {term for term in _terms(text) if term not in STOPWORDS}
+
+
+class _FolderIndex:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.entries: List[Dict[str, Any]] = []
+        self.by_term: Dict[str, List[int]] = {}
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        position = len(self.entries)
+        self.entries.append(entry)
+        for term in entry["terms"]:
+            self.by_term.setdefault(term, []).append(position)
+
+
+class KeyValueLookup:
+    def __init__(
+        self,
+        min_confidence: float = 0.8,
+        max_question_terms: int = 6,
+        index_ttl_seconds: int = 300
+    ):
+        """
+        Args:
+            min_confidence: Minimum match confidence to answer without RAG
+            max_question_terms: Questions with more informative terms go to RAG
+            index_ttl_seconds: Rebuild a folder's index at least this often
+        """
+        self.min_confidence = min_confidence
+        self.max_question_terms = max_question_terms
+        self.index_ttl_seconds = index_ttl_seconds
+
+        self._indexes: Dict[int, _FolderIndex] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    async def answer(self, db: AsyncSession, folder_id: int, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer an exact-lookup question from the folder's extracted key-value pairs.
+
+        Args:
+            db: Database session
+            folder_id: Folder the question is scoped to
+            query: The user's question
+
+        Returns:
+            Response with answer, sources and metadata, or None to fall back to RAG
+        """
+        terms = key_terms(query)
+        if not terms or len(terms) > self.max_question_terms or terms & ANALYTICAL_TERMS:
+            return None
+
+        try:
+            index = await self._get_index(db, folder_id)
+        except Exception as e:
+            logger.error(f"Error loading key-value pairs for folder {folder_id}: {str(e)}")
+            return None
+
+        match = self.match(index, terms)
+        if match is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entries, confidence = match
+        best = entries[0]
+        logger.info(f"Answered '{query}' from key '{best['key']}' in folder {folder_id} (confidence {confidence:.2f})")
+
+        sources, seen = [], set()
+        for entry in entries:
+            if entry["document_id"] in seen:
+                continue
+            seen.add(entry["document_id"])
+            sources.append({
+                "filename": entry["filename"],
+                "relevance_score": round(confidence, 3),
+                "document_id": str(entry["document_id"]),
+                "page_number": entry["page_number"]
+            })
+
+        return {
+            "answer": f"{best['key'].rstrip(': ')}: {best['value']}",
+            "sources": sources,
+            "metadata": {"fast_path": "key_value", "confidence": round(confidence, 3), "matched_key": best["key"]}
+        }
+
+    def match(self, index: _FolderIndex, terms: Set[str]) -> Optional[tuple]:
+        """
+        Find the key-value entries the question asks for.
+
+        Confidence is the Jaccard similarity of question and key terms,
+        scaled by Document Intelligence's confidence in the pair.
+
+        Returns:
+            Tuple of (best entries, all with the same value; confidence), or
+            None when nothing matches confidently or the matches disagree
+        """
+        candidates = {position for term in terms for position in index.by_term.get(term, ())}
+        if not candidates:
+            return None
+
+        scored = []
+        for position in candidates:
+            entry = index.entries[position]
+            similarity = len(terms & entry["terms"]) / len(terms | entry["terms"])
+            scored.append((similarity * entry["confidence"], entry))
+
+        best_score = max(score for score, _ in scored)
+        if best_score < self.min_confidence:
+            return None
+
+        contenders = [entry for score, entry in scored if score >= best_score - AMBIGUITY_MARGIN]
+        if len({entry["normalized_value"] for entry in contenders}) > 1:
+            # Similar keys with different values (e.g. one invoice number per
+            # document): the question is ambiguous, let RAG handle it
+            return None
+
+        best = [entry for score, entry in scored if score >= best_score - 1e-9]
+
+        best.sort(key=lambda entry: entry["document_id"])
+        return best, best_score
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop a folder's index (registered as a folder generation listener)."""
+        self._indexes.pop(int(folder_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "folders_indexed": len(self._indexes),
+            "pairs_indexed": sum(len(index.entries) for index in self._indexes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    async def _get_index(self, db: AsyncSession, folder_id: int) -> _FolderIndex:
+        generation = folder_generations.get(folder_id)
+        index = self._indexes.get(folder_id)
+        if (
+            index is not None
+            and index.generation == generation
+            and time.monotonic() - index.built_at < self.index_ttl_seconds
+        ):
+            return index
+
+        result = await db.execute(
+            select(Document.id, Document.original_filename, Document.doc_metadata)
+            .where(Document.folder_id == folder_id)
+        )
+
+        index = _FolderIndex(generation)
+        for document_id, filename, doc_metadata in result.all():
+            for pair in (doc_metadata or {}).get("key_value_pairs") or []:
+                key, value = (pair.get("key") or "").strip(), (pair.get("value") or "").strip()
+                terms = key_terms(key)
+                if not terms or not value:
+                    continue
+                confidence = pair.get("confidence")
+                index.add({
+                    "key": key,
+                    "value": value,
+                    "normalized_value": " ".join(_TERM.findall(value.lower())),
+                    "terms": terms,
+                    "confidence": 1.0 if confidence is None else confidence,
+                    "document_id": document_id,
+                    "filename": filename,
+                    "page_number": pair.get("page_number")
+                })
+
+        self._indexes[folder_id] = index
+        logger.info(f"Indexed {len(index.entries)} key-value pairs for folder {folder_id}")
+        return index
+
+
+# Singleton instance
+key_value_lookup = KeyValueLookup(
+    min_confidence=settings.KEY_VALUE_MIN_CONFIDENCE,
+    max_question_terms=settings.KEY_VALUE_MAX_QUESTION_TERMS,
+    index_ttl_seconds=settings.KEY_VALUE_INDEX_TTL_SECONDS
+)
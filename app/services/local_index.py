@@ -0,0 +1,288 @@
+"""
+Local In-Process Retrieval Engine
+
+Most folders hold a few thousand chunks or fewer, yet every retrieval is a
+network round trip to the shared search index. With LOCAL_INDEX_ENABLED, a
+folder that is searched is loaded into memory in the background: its chunk
+vectors as one normalized float32 matrix, and its text as a BM25 inverted
+index in CSR arrays. Until the load finishes, the folder is still searched on
+Azure AI Search. While it is resident, IndexerService answers its searches
+in-process:
+
+- vector search: exact cosine similarity (one matrix-vector product)
+- keyword search: BM25 (k1=1.2, b=0.75, the service defaults)
+- hybrid search: both legs fused with RRF (k=60), as the service does
+
+Scores follow the service's conventions (BM25 score, 1 / (1 + cosine
+distance), summed RRF), so adaptive depth and MMR behave the same.
+BM25 statistics are per folder rather than per index shard, so keyword
+scores differ slightly from the service's.
+
+Folders larger than LOCAL_INDEX_MAX_CHUNKS are never loaded. Resident
+folders are evicted least recently used first to stay within
+LOCAL_INDEX_MEMORY_MB. A folder is dropped when its generation changes
+(documents added, deleted or re-indexed), and reloaded after a TTL so
+workers that missed a bump catch up.
+"""
+
+from app.core.config import settings
+from app.services.folder_generations import folder_generations
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import re
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"\w+")
+
+# Fields kept per chunk besides the vector
+CHUNK_FIELDS = ["chunk_id", "chunk", "title", "document_id", "parent_id", "folder_id", "user_id"]
+
+# Loads a folder's chunks (with "text_vector"), or returns None if it has more than max_chunks
+FolderLoader = Callable[[int, int], Awaitable[Optional[List[Dict[str, Any]]]]]
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+class LocalFolderIndex:
+    """One folder's chunks, vectors and BM25 postings."""
+
+    def __init__(self, chunks: List[Dict[str, Any]], generation: int, vector_field: str = "text_vector"):
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        self.chunks = [{field: chunk.get(field) for field in CHUNK_FIELDS} for chunk in chunks]
+
+        # Vectors: unit rows, so cosine similarity is a dot product
+        dimensions = max((len(chunk.get(vector_field) or []) for chunk in chunks), default=0)
+        self.vectors = np.zeros((len(chunks), dimensions), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            vector = chunk.get(vector_field)
+            if vector and len(vector) == dimensions:
+                self.vectors[row] = vector
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.has_vector = norms[:, 0] > 0
+        np.divide(self.vectors, norms, out=self.vectors, where=norms > 0)
+
+        # BM25: postings per term in CSR layout (indptr into documents / frequencies)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for row, chunk in enumerate(chunks):
+            tokens = _tokenize(chunk.get("chunk")) + _tokenize(chunk.get("title"))
+            lengths[row] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[row] = counts.get(row, 0) + 1
+
+        self.vocabulary = {term: position for position, term in enumerate(postings)}
+        self.indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum([len(counts) for counts in postings.values()])
+        self.documents = np.fromiter(
+            (row for counts in postings.values() for row in counts), dtype=np.int32, count=int(self.indptr[-1])
+        )
+        self.frequencies = np.fromiter(
+            (count for counts in postings.values() for count in counts.values()), dtype=np.float32, count=int(self.indptr[-1])
+        )
+        self.lengths = lengths
+        self.average_length = float(lengths.mean()) if len(chunks) and lengths.mean() > 0 else 1.0
+
+        self.nbytes = self._estimate_size()
+
+    def keyword_search(self, query: str, top: int) -> List[tuple]:
+        """(row, BM25 score) pairs, best first; chunks matching no term are left out."""
+        k1, b = 1.2, 0.75
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        normalizer = k1 * (1 - b + b * self.lengths / self.average_length)
+
+        for term in _tokenize(query):
+            position = self.vocabulary.get(term)
+            if position is None:
+                continue
+            start, end = self.indptr[position], self.indptr[position + 1]
+            rows, frequencies = self.documents[start:end], self.frequencies[start:end]
+            idf = np.log(1 + (len(self.chunks) - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * frequencies * (k1 + 1) / (frequencies + normalizer[rows])
+
+        return self._top(scores, top, scores > 0)
+
+    def vector_search(self, query_vector: List[float], top: int) -> List[tuple]:
+        """(row, score) pairs, best first, scored 1 / (1 + cosine distance) like the service."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not len(self.chunks) or norm == 0 or query.shape[0] != self.vectors.shape[1]:
+            return []
+        similarity = self.vectors @ (query / norm)
+        return self._top(1.0 / (2.0 - similarity), top, self.has_vector)
+
+    def hybrid_search(self, query: str, query_vector: List[float], top: int, k: int = 60) -> List[tuple]:
+        """Keyword and vector legs fused with RRF, as the service ranks hybrid queries."""
+        fused: Dict[int, float] = {}
+        for ranked in (self.keyword_search(query, max(top, 50)), self.vector_search(query_vector, top)):
+            for rank, (row, _) in enumerate(ranked, 1):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    def result(self, row: int, score: float, include_vectors: bool) -> Dict[str, Any]:
+        """A chunk in IndexerService's result format."""
+        chunk = self.chunks[row]
+        result = {
+            "chunk_id": chunk["chunk_id"],
+            "score": float(score),
+            "content": chunk["chunk"] or "",
+            "title": chunk["title"] or "",
+            "document_id": chunk["document_id"],
+            "parent_id": chunk["parent_id"],
+            "folder_id": chunk["folder_id"],
+            "user_id": chunk["user_id"]
+        }
+        if include_vectors and self.has_vector[row]:
+            result["vector"] = self.vectors[row].tolist()
+        return result
+
+    @staticmethod
+    def _top(scores: "np.ndarray", top: int, mask: "np.ndarray") -> List[tuple]:
+        rows = np.flatnonzero(mask)
+        if not len(rows) or top <= 0:
+            return []
+        if len(rows) > top:
+            rows = rows[np.argpartition(-scores[rows], top - 1)[:top]]
+        rows = rows[np.argsort(-scores[rows], kind="stable")]
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def _estimate_size(self) -> int:
+        arrays = (self.vectors, self.has_vector, self.indptr, self.documents, self.frequencies, self.lengths)
+        text = sum(sys.getsizeof(value) for chunk in self.chunks for value in chunk.values())
+        terms = sum(sys.getsizeof(term) + 100 for term in self.vocabulary)
+        return sum(array.nbytes for array in arrays) + text + terms + 350 * len(self.chunks)
+
+
+class LocalRetrievalEngine:
+    def __init__(self, max_chunks: int = 2000, memory_budget_mb: int = 256, ttl_seconds: int = 600):
+        """
+        Args:
+            max_chunks: Folders with more chunks stay on the search service
+            memory_budget_mb: Memory for resident folders (least recently used evicted)
+            ttl_seconds: Reload a resident folder at least this often
+        """
+        self.max_chunks = max_chunks
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+
+        self._folders: "OrderedDict[int, LocalFolderIndex]" = OrderedDict()
+        self._loading: Dict[int, "asyncio.Task"] = {}
+        self._too_large: Dict[int, float] = {}  # folder_id -> retry after (monotonic)
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    def get(self, folder_id: int, loader: Optional[FolderLoader] = None) -> Optional[LocalFolderIndex]:
+        """
+        The folder's resident index, or None.
+
+        On a miss, starts loading the folder in the background with `loader`
+        so later searches can be served locally.
+        """
+        generation = folder_generations.get(folder_id)
+        index = self._folders.get(folder_id)
+        if index is not None and (
+            index.generation != generation or time.monotonic() - index.loaded_at > self.ttl_seconds
+        ):
+            del self._folders[folder_id]
+            index = None
+
+        if index is not None:
+            self._folders.move_to_end(folder_id)
+            self.hits += 1
+            return index
+
+        self.misses += 1
+        if loader is not None:
+            self._start_load(folder_id, generation, loader)
+        return None
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop a folder (registered as a folder generation listener)."""
+        folder_id = int(folder_id)
+        self._folders.pop(folder_id, None)
+        self._too_large.pop(folder_id, None)
+        loading = self._loading.pop(folder_id, None)
+        if loading is not None:
+            loading.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "folders": len(self._folders),
+            "chunks": sum(len(index.chunks) for index in self._folders.values()),
+            "memory_bytes": sum(index.nbytes for index in self._folders.values()),
+            "memory_budget_bytes": self.memory_budget,
+            "loading": len(self._loading),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _start_load(self, folder_id: int, generation: int, loader: FolderLoader) -> None:
+        if folder_id in self._loading or self._too_large.get(folder_id, 0) > time.monotonic():
+            return
+        task = asyncio.create_task(self._load(folder_id, generation, loader))
+        task.add_done_callback(lambda finished: self._forget_load(folder_id, finished))
+        self._loading[folder_id] = task
+
+    def _forget_load(self, folder_id: int, task: "asyncio.Task") -> None:
+        if self._loading.get(folder_id) is task:
+            del self._loading[folder_id]
+
+    async def _load(self, folder_id: int, generation: int, loader: FolderLoader) -> None:
+        try:
+            chunks = await loader(folder_id, self.max_chunks)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The folder just stays on the search service
+            logger.warning(f"Failed to load folder {folder_id} into the local index: {str(e)}")
+            return
+
+        if chunks is None:
+            self._too_large[folder_id] = time.monotonic() + self.ttl_seconds
+            return
+        if generation != folder_generations.get(folder_id):
+            return
+
+        # Building the arrays is CPU-bound; keep it off the event loop
+        index = await asyncio.to_thread(LocalFolderIndex, chunks, generation)
+        if generation != folder_generations.get(folder_id):
+            return
+        if index.nbytes > self.memory_budget:
+            self._too_large[folder_id] = time.monotonic() + self.ttl_seconds
+            return
+
+        self._folders[folder_id] = index
+        self._folders.move_to_end(folder_id)
+        self.loads += 1
+        while sum(resident.nbytes for resident in self._folders.values()) > self.memory_budget:
+            self._folders.popitem(last=False)
+            self.evictions += 1
+
+        logger.info(f"Loaded folder {folder_id} into the local index ({len(index.chunks)} chunks, {index.nbytes} bytes)")
+
+
+# Singleton instance
+local_retrieval_engine = LocalRetrievalEngine(
+    max_chunks=settings.LOCAL_INDEX_MAX_CHUNKS,
+    memory_budget_mb=settings.LOCAL_INDEX_MEMORY_MB,
+    ttl_seconds=settings.LOCAL_INDEX_TTL_SECONDS
+)
@@ -0,0 +1,348 @@
+"""
+Quota-Aware Azure OpenAI Scheduler
+
+Azure OpenAI deployments have a tokens-per-minute (TPM) and a
+requests-per-minute (RPM) quota. Sending requests as fast as they arrive
+overshoots the quota in bursts, and the resulting 429s are retried blindly,
+which causes the next burst. This scheduler admits calls against client-side
+token buckets sized to each deployment's quota instead:
+
+- Every call is admitted with an estimated token cost. Azure counts prompt
+  tokens plus max_tokens against TPM when the request arrives, so the
+  estimate is charged up front and not refunded.
+- Waiting calls are admitted in priority order (interactive chat before batch
+  work), FIFO within a priority.
+- A 429 pauses admission for the whole deployment for the retry-after the
+  service asked for, then the call is retried.
+- Transient failures (connection errors, timeouts, 408, 409 and 5xx) are
+  retried with exponential backoff, as the SDK would; SDK retries are off
+  while the scheduler runs so 429s can't bypass it.
+
+Azure enforces the quota over short windows (1 or 10 seconds), not per
+minute. Buckets therefore hold only one second of quota and refill at a
+target fraction of it. Any 10-second window then stays under the
+service's limit, even when the bucket starts full.
+
+The quota is per deployment, but every API worker process runs its own
+scheduler, so each one admits only its share (quota / processes).
+"""
+
+from app.core.config import settings
+from app.core.metrics import metrics, LATENCY_BUCKETS
+from openai import APIConnectionError, APIStatusError, RateLimitError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 5
+PRIORITY_BATCH = 10
+
+# Priority for calls made in the current task (see OpenAIScheduler.priority)
+_current_priority: ContextVar[int] = ContextVar("openai_priority", default=PRIORITY_INTERACTIVE)
+
+BUCKET_WINDOW_SECONDS = 1
+STATS_WINDOW_SECONDS = 60
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_PREFETCH: "prefetch", PRIORITY_BATCH: "batch"}
+
+queue_wait = metrics.histogram(
+    "rag_openai_queue_wait_seconds",
+    "Time OpenAI calls waited for quota before being sent",
+    (0.0,) + LATENCY_BUCKETS,
+    labels=("deployment", "priority")
+)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` per second,
+    holding at most `window_seconds` of refill.
+
+    A request larger than the whole bucket is admitted once the bucket is
+    full and leaves it in debt, so oversized requests are delayed, not stuck.
+    """
+
+    def __init__(self, per_minute: float, window_seconds: float = BUCKET_WINDOW_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * window_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be taken now)."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+
+class DeploymentScheduler:
+    """
+    Admission queue for one deployment.
+
+    Args:
+        name: Deployment name
+        tokens_per_minute: TPM quota
+        requests_per_minute: RPM quota
+        target_utilization: Fraction of the quota to admit
+    """
+
+    def __init__(
+        self,
+        name: str,
+        tokens_per_minute: int,
+        requests_per_minute: int,
+        target_utilization: float = 0.9
+    ):
+        self.name = name
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.tokens = TokenBucket(tokens_per_minute * target_utilization)
+        self.requests = TokenBucket(requests_per_minute * target_utilization)
+
+        self._queue: List[list] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional["asyncio.Task"] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._paused_until = 0.0
+
+        self._admitted: deque = deque()  # (admitted_at, tokens) within STATS_WINDOW_SECONDS
+        self._queue_waits: deque = deque(maxlen=1000)
+        self.throttled = 0
+
+    async def acquire(self, tokens: int, priority: int) -> None:
+        """Wait until a call costing `tokens` may be sent."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._sequence), tokens, future, time.monotonic()])
+        self._wake()
+        await future
+
+    def throttle(self, retry_after: float) -> None:
+        """Pause admission after a 429 for the time the service asked for."""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Deployment {self.name} throttled, pausing admission for {retry_after:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        self._prune()
+        waits = sorted(self._queue_waits)
+        used = sum(tokens for _, tokens in self._admitted)
+
+        def percentile(fraction: float) -> float:
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 1) if waits else 0.0
+
+        return {
+            "tokens_per_minute": self.tokens_per_minute,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_last_minute": used,
+            "requests_last_minute": len(self._admitted),
+            "token_utilization": round(used / self.tokens_per_minute, 3) if self.tokens_per_minute else 0.0,
+            "queue_depth": sum(1 for waiter in self._queue if not waiter[3].done()),
+            "queue_wait_p50_ms": percentile(0.5),
+            "queue_wait_p95_ms": percentile(0.95),
+            "queue_wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+            "throttled": self.throttled,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1)
+        }
+
+    def _wake(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        else:
+            self._wakeup.set()
+
+    async def _dispatch(self) -> None:
+        """Admit queued calls in priority order as quota becomes available."""
+        while self._queue:
+            priority, _, tokens, future, queued_at = self._queue[0]
+            if future.done():
+                # Caller was cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+
+            now = time.monotonic()
+            delay = max(
+                self._paused_until - now,
+                self.tokens.time_until(tokens),
+                self.requests.time_until(1)
+            )
+            if delay > 0:
+                # A new arrival may outrank the head of the queue, so wake up for it too
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self.tokens.take(tokens)
+            self.requests.take(1)
+            self._admitted.append((now, tokens))
+            self._queue_waits.append(now - queued_at)
+            queue_wait.observe(now - queued_at, self.name, PRIORITY_NAMES.get(priority, str(priority)))
+            future.set_result(None)
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - STATS_WINDOW_SECONDS
+        while self._admitted and self._admitted[0][0] < cutoff:
+            self._admitted.popleft()
+
+
+class OpenAIScheduler:
+    def __init__(
+        self,
+        quotas: Dict[str, Dict[str, int]],
+        max_retries: int = 5,
+        target_utilization: float = 0.9,
+        enabled: bool = True,
+        transient_retries: int = 2,
+        processes: int = 1
+    ):
+        """
+        Args:
+            quotas: Deployment name -> {"tpm": ..., "rpm": ...}
+            max_retries: Retries after a 429 before the error is raised
+            transient_retries: Retries after a connection error, timeout,
+                408, 409 or 5xx before the error is raised
+            target_utilization: Fraction of each quota to admit, headroom for
+                estimation error and other clients of the deployment
+            enabled: When False, calls go straight through
+            processes: Worker processes sharing the deployments' quota; this
+                process admits 1/processes of it
+        """
+        self.quotas = quotas
+        self.max_retries = max_retries
+        self.target_utilization = target_utilization
+        self.enabled = enabled
+        self.transient_retries = transient_retries
+        self.processes = max(1, processes)
+        self._deployments: Dict[str, DeploymentScheduler] = {}
+
+    @contextmanager
+    def priority(self, priority: int) -> Iterator[None]:
+        """Run the OpenAI calls made inside the block (and tasks it starts) at this priority."""
+        token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    async def call(self, deployment: str, tokens: int, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Send an OpenAI call when the deployment's quota allows it.
+
+        Args:
+            deployment: Deployment the call goes to
+            tokens: Estimated tokens the call counts against TPM
+            fn: Coroutine function making the call
+
+        Returns:
+            The call's result
+        """
+        if not self.enabled:
+            return await fn()
+
+        scheduler = self.get_deployment(deployment)
+        priority = _current_priority.get()
+
+        attempt = 0
+        transient_attempt = 0
+        while True:
+            await scheduler.acquire(tokens, priority)
+            try:
+                return await fn()
+            except RateLimitError as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Deployment {deployment} still throttled after {attempt} retries")
+                    raise
+                scheduler.throttle(self._retry_after(e, attempt))
+                attempt += 1
+            except (APIConnectionError, APIStatusError) as e:
+                if not self._is_transient(e) or transient_attempt >= self.transient_retries:
+                    raise
+                delay = self._backoff(transient_attempt)
+                logger.warning(f"Deployment {deployment} call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                transient_attempt += 1
+                await asyncio.sleep(delay)
+
+    def get_deployment(self, deployment: str) -> DeploymentScheduler:
+        scheduler = self._deployments.get(deployment)
+        if scheduler is None:
+            quota = self.quotas.get(deployment) or {"tpm": 60000, "rpm": 360}
+            scheduler = DeploymentScheduler(
+                deployment,
+                quota["tpm"] // self.processes,
+                quota["rpm"] // self.processes,
+                self.target_utilization
+            )
+            self._deployments[deployment] = scheduler
+        return scheduler
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: scheduler.stats() for name, scheduler in self._deployments.items()}
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Errors the OpenAI SDK itself would retry (other than 429, handled separately)."""
+        if isinstance(error, APIConnectionError):
+            # Includes APITimeoutError
+            return True
+        return error.status_code in (408, 409) or error.status_code >= 500
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with jitter, like the SDK's (0.5s doubling, at most 8s)."""
+        return min(8.0, 0.5 * 2 ** attempt) * (1 - 0.25 * random.random())
+
+    @staticmethod
+    def _retry_after(error: RateLimitError, attempt: int) -> float:
+        """Delay requested by the service, or exponential backoff if it didn't say."""
+        headers = error.response.headers if error.response is not None else {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return min(60.0, 2.0 ** attempt)
+
+
+# Singleton instance
+openai_scheduler = OpenAIScheduler(
+    quotas={
+        settings.AZURE_OPENAI_DEPLOYMENT: {
+            "tpm": settings.AZURE_OPENAI_CHAT_TPM,
+            "rpm": settings.AZURE_OPENAI_CHAT_RPM
+        },
+        settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT: {
+            "tpm": settings.AZURE_OPENAI_EMBEDDING_TPM,
+            "rpm": settings.AZURE_OPENAI_EMBEDDING_RPM
+        }
+    },
+    max_retries=settings.OPENAI_SCHEDULER_MAX_RETRIES,
+    transient_retries=settings.OPENAI_SCHEDULER_TRANSIENT_RETRIES,
+    target_utilization=settings.OPENAI_SCHEDULER_TARGET_UTILIZATION,
+    enabled=settings.OPENAI_SCHEDULER_ENABLED,
+    processes=settings.WEB_CONCURRENCY
+)
@@ -1,46 +1,184 @@
 from openai import AsyncAzureOpenAI
 from app.core.config import settings
-from typing import List, Dict, Any
+from app.services.embedding_cache import embedding_cache
+from app.services.tokenizer import count_tokens, count_message_tokens
+from app.services.openai_scheduler import OpenAIScheduler, openai_scheduler
+from app.services.context_packer import context_packer
+from typing import List, Dict, Any, AsyncIterator, Tuple, Optional
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 class OpenAIService:
-    def __init__(self):
-        self.client = AsyncAzureOpenAI(
+    def __init__(self, client: Optional[Any] = None, scheduler: Optional[OpenAIScheduler] = None):
+        # Any object exposing the AsyncAzureOpenAI surface can be injected,
+        # e.g. a local fake for offline benchmarks
+        self.client = client or AsyncAzureOpenAI(
             api_key=settings.AZURE_OPENAI_KEY,
             api_version=settings.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
+            azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+            # The scheduler retries 429s after retry-after (and transient errors
+            # with backoff); SDK retries would bypass it
+            max_retries=0 if settings.OPENAI_SCHEDULER_ENABLED else 2
         )
+        self.scheduler = scheduler or openai_scheduler
         self.deployment = settings.AZURE_OPENAI_DEPLOYMENT
         self.embedding_deployment = settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+        self.embedding_batch_max_items = settings.EMBEDDING_BATCH_MAX_ITEMS
+        self.embedding_batch_max_tokens = settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.embedding_batch_concurrency = settings.EMBEDDING_BATCH_CONCURRENCY
 
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str, use_cache: bool = True) -> List[float]:
         """
         Generate embedding vector for text using Azure OpenAI.
 
+        Repeated queries are served from the embedding cache, keyed by
+        normalized text and embedding deployment.
+
         Args:
             text: Text to generate embedding for
+            use_cache: Read from and write to the embedding cache
 
         Returns:
             Embedding vector as list of floats
         """
+        if use_cache:
+            cached = await embedding_cache.get(text, self.embedding_deployment)
+            if cached is not None:
+                logger.info("Embedding cache hit")
+                return cached
+
         try:
-            response = await self.client.embeddings.create(
-                model=self.embedding_deployment,
-                input=text
+            response = await self.scheduler.call(
+                self.embedding_deployment,
+                count_tokens(text),
+                lambda: self.client.embeddings.create(
+                    model=self.embedding_deployment,
+                    input=text
+                )
             )
 
             embedding = response.data[0].embedding
             logger.info(f"Generated embedding vector of dimension {len(embedding)}")
 
+            if use_cache:
+                await embedding_cache.set(text, self.embedding_deployment, embedding)
+
             return embedding
 
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
 
+    async def generate_embeddings(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """
+        Generate embedding vectors for many texts with as few requests as possible.
+
+        Cache hits and duplicate texts are resolved locally. The remaining texts
+        are packed into requests up to the deployment's per-request item and
+        token limits, and packed requests run concurrently under
+        EMBEDDING_BATCH_CONCURRENCY.
+
+        Args:
+            texts: Texts to generate embeddings for
+            use_cache: Read from and write to the embedding cache (disable for
+                bulk chunk re-embedding so it doesn't evict query embeddings)
+
+        Returns:
+            Embedding vectors in the same order as texts
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+
+        # Map each distinct uncached text to every position it appears at
+        pending: Dict[str, List[int]] = {}
+        for position, text in enumerate(texts):
+            if text in pending:
+                pending[text].append(position)
+                continue
+
+            if use_cache:
+                cached = await embedding_cache.get(text, self.embedding_deployment)
+                if cached is not None:
+                    embeddings[position] = cached
+                    continue
+
+            pending[text] = [position]
+
+        if pending:
+            batches = self.pack_embedding_batches(list(pending))
+            semaphore = asyncio.Semaphore(self.embedding_batch_concurrency)
+
+            async def embed_batch(batch: List[str]) -> List[List[float]]:
+                async with semaphore:
+                    response = await self.scheduler.call(
+                        self.embedding_deployment,
+                        sum(count_tokens(text) for text in batch),
+                        lambda: self.client.embeddings.create(
+                            model=self.embedding_deployment,
+                            input=batch
+                        )
+                    )
+                # The API does not promise output order, each item carries its input index
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+            try:
+                batch_vectors = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+            except Exception as e:
+                logger.error(f"Error generating batch embeddings: {str(e)}")
+                raise
+
+            for batch, vectors in zip(batches, batch_vectors):
+                for text, embedding in zip(batch, vectors):
+                    for position in pending[text]:
+                        embeddings[position] = embedding
+                    if use_cache:
+                        await embedding_cache.set(text, self.embedding_deployment, embedding)
+
+            logger.info(
+                f"Generated {len(pending)} embeddings in {len(batches)} requests "
+                f"({len(texts) - sum(len(p) for p in pending.values())} served from cache)"
+            )
+
+        return embeddings
+
+    def pack_embedding_batches(self, texts: List[str]) -> List[List[str]]:
+        """
+        Greedily pack texts into embedding requests, preserving order.
+
+        A request is closed when adding the next text would exceed either the
+        item limit or the token limit. A single text over the token limit is
+        sent on its own.
+
+        Args:
+            texts: Texts to pack
+
+        Returns:
+            List of request batches
+        """
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+
+        for text in texts:
+            tokens = count_tokens(text)
+            if current and (
+                len(current) >= self.embedding_batch_max_items
+                or current_tokens + tokens > self.embedding_batch_max_tokens
+            ):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+
+            current.append(text)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
     async def generate_response(
         self,
         query: str,
@@ -58,71 +196,220 @@ class OpenAIService:
         Returns:
             Generated response text
         """
-        try:
-            # Format context from search results
-            context_text = self._format_context(context)
-
-            # Create the system message
-            system_message = """You are a helpful AI assistant that answers questions based on the provided documents.
-            Use the context provided to answer questions accurately. If the context doesn't contain relevant information
-            to answer the question, say so clearly. Always cite which document your information comes from."""
+        answer, _ = await self.generate_response_with_usage(query, context, max_tokens)
+        return answer
 
-            # Create the user message with context
-            user_message = f"""Context from documents:
-{context_text}
+    async def generate_response_with_usage(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        max_tokens: int = 1000,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Generate a response and report the tokens it consumed.
 
-Question: {query}
+        Args:
+            query: The user's question
+            context: List of relevant document chunks from search
+            max_tokens: Maximum tokens in response
+            history: Earlier conversation messages placed before the question
 
-Please provide a detailed answer based on the context above."""
+        Returns:
+            Tuple of (response text, usage dict with prompt_tokens,
+            completion_tokens and total_tokens)
+        """
+        try:
+            messages = self.build_messages(query, context, history)
 
             # Call Azure OpenAI
-            response = await self.client.chat.completions.create(
-                model=self.deployment,
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
-                max_tokens=max_tokens,
-                temperature=0.7,
-            )
+            response = await self._complete(messages, max_tokens, temperature=0.7)
 
             answer = response.choices[0].message.content
             logger.info("Generated response from Azure OpenAI")
 
-            return answer
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
+                "completion_tokens": response.usage.completion_tokens if response.usage else 0,
+                "total_tokens": response.usage.total_tokens if response.usage else 0
+            }
+
+            return answer, usage
 
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             raise
 
-    def _format_context(self, context: List[Dict[str, Any]]) -> str:
+    async def stream_response(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        max_tokens: int = 1000
+    ) -> AsyncIterator[str]:
         """
-        Format search results into context for the prompt.
+        Stream a RAG response from Azure OpenAI token by token.
+
+        Uses the same prompt as generate_response, but yields completion
+        deltas as they arrive instead of waiting for the full answer.
 
-        Context now comes from semantic chunks with metadata.
+        Args:
+            query: The user's question
+            context: List of relevant document chunks from search
+            max_tokens: Maximum tokens in response
+
+        Yields:
+            Text deltas of the generated response
+        """
+        try:
+            stream = await self._complete(
+                self.build_messages(query, context), max_tokens, temperature=0.7, stream=True
+            )
+
+            async for chunk in stream:
+                # Azure sends a leading chunk with prompt filter results and no choices
+                if not chunk.choices:
+                    continue
+
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+
+            logger.info("Streamed response from Azure OpenAI")
+
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            raise
+
+    async def summarize_conversation(
+        self,
+        summary: Optional[str],
+        turns: List[Dict[str, str]],
+        max_tokens: int = 400
+    ) -> str:
+        """
+        Fold conversation turns into a running summary.
+
+        Args:
+            summary: The existing summary, if any
+            turns: Turns to fold in, each with "question" and "answer"
+            max_tokens: Maximum tokens in the new summary
+
+        Returns:
+            Updated summary text
         """
-        if not context:
-            return "No relevant documents found."
+        transcript = "\n\n".join(
+            f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns
+        )
+
+        user_message = f"""Existing summary:
+{summary or "(none)"}
 
-        formatted_parts = []
-        for i, chunk in enumerate(context, 1):
-            title = chunk.get("title", "Unknown")
-            content = chunk.get("content", "")
-            score = chunk.get("score", 0)
-            page_number = chunk.get("page_number")
+New conversation turns:
+{transcript}
 
-            # Truncate very long content (chunks are already ~2000 chars from Text Split skill)
-            if len(content) > 2000:
-                content = content[:2000] + "..."
+Update the summary so it covers the existing summary and the new turns."""
 
-            # Include page number if available
-            page_info = f", Page: {page_number}" if page_number else ""
+        messages = [
+            {
+                "role": "system",
+                "content": "You summarize conversations about financial documents. Keep the "
+                           "documents, companies, periods and figures discussed, and any open "
+                           "questions. Be concise."
+            },
+            {"role": "user", "content": user_message}
+        ]
+
+        try:
+            response = await self._complete(messages, max_tokens, temperature=0.0)
+
+            logger.info(f"Summarized {len(turns)} conversation turns")
+            return response.choices[0].message.content
+
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            raise
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        stream: bool = False
+    ) -> Any:
+        """
+        Send a chat completion through the quota scheduler.
 
-            formatted_parts.append(
-                f"Chunk {i} (File: {title}{page_info}, Relevance: {score:.2f}):\n{content}\n"
+        The call is charged its prompt tokens plus max_tokens, which is how
+        Azure counts it against the deployment's TPM quota.
+        """
+        return await self.scheduler.call(
+            self.deployment,
+            count_message_tokens(messages) + max_tokens,
+            lambda: self.client.chat.completions.create(
+                model=self.deployment,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=stream,
             )
+        )
+
+    def build_messages(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for a RAG completion.
+
+        Args:
+            query: The user's question
+            context: List of relevant document chunks from search
+            history: Earlier conversation messages placed between the system
+                message and the question
+
+        Returns:
+            System, history and user messages for the chat completions API
+        """
+        # Format context from search results
+        context_text = self.pack_context(context)["text"]
+
+        # Create the system message
+        system_message = """You are a helpful AI assistant that answers questions based on the provided documents.
+        Use the context provided to answer questions accurately. If the context doesn't contain relevant information
+        to answer the question, say so clearly. Always cite which document your information comes from."""
+
+        # Create the user message with context
+        user_message = f"""Context from documents:
+{context_text}
+
+Question: {query}
+
+Please provide a detailed answer based on the context above."""
 
-        return "\n".join(formatted_parts)
+        return [
+            {"role": "system", "content": system_message},
+            *(history or []),
+            {"role": "user", "content": user_message}
+        ]
+
+    def pack_context(self, context: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Pack search results into prompt context under CONTEXT_TOKEN_BUDGET.
+
+        Overlap between neighbouring chunks of the same document is removed and
+        the highest-scoring chunks are packed first (see ContextPacker.pack).
+
+        Returns:
+            Packing result with "text" and "tokens_used"
+        """
+        packed = context_packer.pack(context)
+        logger.info(
+            f"Packed {len(packed['chunks'])}/{len(context)} chunks into {packed['tokens_used']} context tokens "
+            f"({packed['overlap_chars_removed']} overlapping chars removed)"
+        )
+        return packed
 
 
 # Singleton instance
@@ -0,0 +1,317 @@
+"""
+Retrieval Prefetch Cache
+
+While the user types, the front end sends the partial query to
+POST /chat/prefetch. The query is embedded and the folder searched in the
+background, and the embedding and selected chunks are kept here for a
+short time. When the question is submitted, /chat takes them instead of
+making those two round trips. If the prefetch is still running, /chat
+waits for it rather than starting the same work again.
+
+A submitted question can use a prefetch for the same normalized query, or
+for one whose words overlap almost entirely (e.g. the user added a
+question mark or a trailing word after the debounce fired). Numbers and
+period words (years, quarters, months) must match exactly for a near
+match: "revenue in fiscal 2022" must not be answered from "revenue in
+fiscal 2023". Its metadata says which: "prefetch" is "hit" for the same
+normalized query and "near_hit" otherwise. A near hit's chunks were
+retrieved for different text, so its answer must not be cached under the
+submitted query, and the submitted query is embedded again for the
+answer cache lookup.
+
+Prefetching must not burn quota on every keystroke:
+
+- Each user has a token bucket of prefetches. Buckets that have refilled
+  completely are dropped (a full bucket is the same as a new one), so only
+  users who prefetched recently take memory.
+- A new prefetch from the same user cancels the previous one if it is
+  still running.
+- The calls run at a lower scheduler priority than interactive chat.
+
+Entries are tagged with the folder generation and dropped when the folder's
+documents change.
+"""
+
+from app.core.config import settings
+from app.services.embedding_cache import normalize_query
+from app.services.folder_generations import folder_generations
+from app.services.openai_scheduler import TokenBucket
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+import asyncio
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# (query embedding, selected chunks, retrieval metadata)
+Prefetched = Tuple[List[float], List[Dict[str, Any]], Dict[str, Any]]
+
+
+def _query_terms(query: str) -> FrozenSet[str]:
+    return frozenset(word.strip("?.!,;:") for word in normalize_query(query).split()) - {""}
+
+
+def _similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+_DIGIT = re.compile(r"\d")
+
+# Words naming a reporting period; like numbers, they change the question
+# ("may" is left out: it is more often the verb)
+_PERIOD_WORDS = frozenset({
+    "january", "february", "march", "april", "june", "july", "august",
+    "september", "october", "november", "december",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "first", "second", "third", "fourth", "quarter", "quarterly", "annual", "annually",
+    "monthly", "half", "ytd", "qtd", "mtd", "ttm", "ltm"
+})
+
+
+def _period_terms(terms: FrozenSet[str]) -> FrozenSet[str]:
+    """Numeric and period tokens (2023, q3, fy22, march, ytd, ...)."""
+    return frozenset(term for term in terms if _DIGIT.search(term) or term in _PERIOD_WORDS)
+
+
+class _InFlight:
+    def __init__(self, folder_id: int, query: str, task: "asyncio.Task"):
+        self.folder_id = folder_id
+        self.terms = _query_terms(query)
+        self.task = task
+
+
+class PrefetchCache:
+    def __init__(
+        self,
+        ttl_seconds: int = 60,
+        max_entries: int = 1000,
+        similarity_threshold: float = 0.8,
+        per_user_per_minute: int = 30,
+        burst: int = 5,
+        wait_seconds: float = 2.0
+    ):
+        """
+        Args:
+            ttl_seconds: How long a prefetched result can be used
+            max_entries: Entries kept across all folders (least recently used evicted)
+            similarity_threshold: Word overlap (Jaccard) for a query to use a
+                prefetch; numeric and period tokens must match as well
+            per_user_per_minute: Sustained prefetch rate allowed per user
+            burst: Prefetches a user may send back to back
+            wait_seconds: Longest /chat waits for a matching prefetch still in flight
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.per_user_per_minute = per_user_per_minute
+        self.burst = burst
+        self.wait_seconds = wait_seconds
+
+        # (folder_id, normalized query) -> entry
+        self._entries: "OrderedDict[Tuple[int, str], Dict[str, Any]]" = OrderedDict()
+        self._in_flight: Dict[int, _InFlight] = {}  # user_id -> running prefetch
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()  # user_id -> bucket, least recently used first
+
+        self.started = 0
+        self.rate_limited = 0
+        self.cancelled = 0
+        self.hits = 0
+        self.misses = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    def schedule(
+        self,
+        user_id: int,
+        folder_id: int,
+        query: str,
+        fetch: Callable[[], Awaitable[Prefetched]]
+    ) -> str:
+        """
+        Start a prefetch for a user's partial query.
+
+        Args:
+            user_id: User typing the query
+            folder_id: Folder the query is scoped to
+            query: Partial query
+            fetch: Coroutine function returning (embedding, chunks, metadata)
+
+        Returns:
+            "cached" or "in_flight" if the query is already covered,
+            "rate_limited" if the user is over their prefetch rate,
+            otherwise "started"
+        """
+        if self._find_entry(folder_id, query) is not None:
+            return "cached"
+
+        running = self._in_flight.get(user_id)
+        if running is not None and not running.task.done():
+            if running.folder_id == folder_id and running.terms == _query_terms(query):
+                return "in_flight"
+
+        self._prune_buckets()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_user_per_minute, window_seconds=self.burst * 60 / self.per_user_per_minute)
+            self._buckets[user_id] = bucket
+        self._buckets.move_to_end(user_id)
+        if bucket.time_until(1) > 0:
+            self.rate_limited += 1
+            return "rate_limited"
+        bucket.take(1)
+
+        # The user kept typing: the previous prefetch is stale
+        self.cancel(user_id)
+
+        generation = folder_generations.get(folder_id)
+        task = asyncio.create_task(self._run(folder_id, query, generation, fetch))
+        task.add_done_callback(lambda finished: self._forget(user_id, finished))
+        self._in_flight[user_id] = _InFlight(folder_id, query, task)
+        self.started += 1
+        return "started"
+
+    def cancel(self, user_id: int) -> bool:
+        """Cancel the user's running prefetch, if any. Returns True if one was cancelled."""
+        running = self._in_flight.pop(user_id, None)
+        if running is None or running.task.done():
+            return False
+        running.task.cancel()
+        self.cancelled += 1
+        return True
+
+    async def take(self, folder_id: int, query: str) -> Optional[Prefetched]:
+        """
+        Prefetched embedding and chunks for a submitted query, or None.
+
+        Waits up to wait_seconds for a matching prefetch that is still running.
+        The returned metadata has "prefetch" set to "hit" or "near_hit".
+        """
+        terms = _query_terms(query)
+        for running in list(self._in_flight.values()):
+            if (
+                running.folder_id == folder_id
+                and not running.task.done()
+                and self._near_match(terms, running.terms) >= self.similarity_threshold
+            ):
+                # asyncio.wait neither raises nor cancels the prefetch on timeout
+                await asyncio.wait({running.task}, timeout=self.wait_seconds)
+                break
+
+        entry = self._find_entry(folder_id, query)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        match = "hit" if entry["query"] == normalize_query(query) else "near_hit"
+        return entry["embedding"], entry["results"], {**entry["metadata"], "prefetch": match}
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop a folder's entries (registered as a folder generation listener)."""
+        for key in [key for key in self._entries if key[0] == int(folder_id)]:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "in_flight": sum(1 for running in self._in_flight.values() if not running.task.done()),
+            "rate_limit_buckets": len(self._buckets),
+            "started": self.started,
+            "rate_limited": self.rate_limited,
+            "cancelled": self.cancelled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _near_match(self, a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        """Word overlap of two queries, or 0.0 if their numeric and period tokens differ."""
+        if _period_terms(a) != _period_terms(b):
+            return 0.0
+        return _similarity(a, b)
+
+    def _prune_buckets(self) -> None:
+        """Drop buckets of users idle long enough for their bucket to refill."""
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if bucket.time_until(bucket.capacity) > 0:
+                # Used more recently than any bucket behind it
+                break
+            del self._buckets[user_id]
+
+    def _forget(self, user_id: int, task: "asyncio.Task") -> None:
+        running = self._in_flight.get(user_id)
+        if running is not None and running.task is task:
+            del self._in_flight[user_id]
+
+    async def _run(
+        self,
+        folder_id: int,
+        query: str,
+        generation: int,
+        fetch: Callable[[], Awaitable[Prefetched]]
+    ) -> None:
+        try:
+            embedding, results, metadata = await fetch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed prefetch only means /chat does the work itself
+            logger.warning(f"Prefetch failed for folder {folder_id}: {str(e)}")
+            return
+
+        if generation != folder_generations.get(folder_id):
+            return
+
+        key = (folder_id, normalize_query(query))
+        self._entries[key] = {
+            "query": key[1],
+            "terms": _query_terms(query),
+            "embedding": embedding,
+            "results": results,
+            "metadata": metadata,
+            "generation": generation,
+            "expires_at": time.monotonic() + self.ttl_seconds
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _find_entry(self, folder_id: int, query: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        generation = folder_generations.get(folder_id)
+
+        key = (folder_id, normalize_query(query))
+        entry = self._entries.get(key)
+        if entry is None:
+            # Near match: same folder, almost the same words, same numbers and periods
+            terms = _query_terms(query)
+            best = 0.0
+            for candidate_key, candidate in self._entries.items():
+                if candidate_key[0] != folder_id:
+                    continue
+                similarity = self._near_match(terms, candidate["terms"])
+                if similarity >= self.similarity_threshold and similarity > best:
+                    key, entry, best = candidate_key, candidate, similarity
+
+        if entry is None:
+            return None
+        if entry["expires_at"] < now or entry["generation"] != generation:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+
+# Singleton instance
+prefetch_cache = PrefetchCache(
+    ttl_seconds=settings.PREFETCH_TTL_SECONDS,
+    max_entries=settings.PREFETCH_MAX_ENTRIES,
+    similarity_threshold=settings.PREFETCH_SIMILARITY_THRESHOLD,
+    per_user_per_minute=settings.PREFETCH_PER_USER_PER_MINUTE,
+    burst=settings.PREFETCH_BURST
+)
@@ -0,0 +1,500 @@
+"""
+RAG (Retrieval Augmented Generation) Pipeline Service
+
+Shared retrieval and generation steps behind the chat endpoints.
+Callers are responsible for verifying folder ownership before calling in.
+"""
+
+from app.core.config import settings
+from app.core.metrics import timed_stage, record_stage, retrieved_chunks, llm_tokens
+from app.services.indexer_service import indexer_service
+from app.services.hybrid_retrieval import hybrid_retriever
+from app.services.reranker import mmr_reranker
+from app.services.retrieval_depth import adaptive_depth
+from app.services.openai_service import openai_service
+from app.services.answer_cache import answer_cache
+from app.services.folder_generations import folder_generations
+from app.services.single_flight import single_flight
+from app.services.openai_scheduler import openai_scheduler, PRIORITY_BATCH, PRIORITY_PREFETCH
+from app.services.prefetch_cache import prefetch_cache
+from app.services.embedding_cache import normalize_query
+from app.services.tokenizer import count_tokens, count_message_tokens
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the documents to answer your question."
+
+
+class RAGService:
+    def __init__(self, top: int = 5):
+        self.top = top
+
+    @staticmethod
+    def format_sources(search_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Format search results into the source shape returned by ChatResponse.
+
+        Args:
+            search_results: Chunks returned by the indexer service
+
+        Returns:
+            List of source dictionaries
+        """
+        return [
+            {
+                "filename": result.get("title"),
+                "relevance_score": result.get("score"),
+                "document_id": result.get("document_id"),
+                "page_number": result.get("page_number")
+            }
+            for result in search_results
+        ]
+
+    async def retrieve(
+        self,
+        query: str,
+        folder_id: int,
+        query_embedding: Optional[List[float]] = None,
+        keyword_task: Optional["asyncio.Task"] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve the most relevant chunks for a query within a folder.
+
+        See retrieve_with_metadata; this returns the chunks only.
+        """
+        results, _ = await self.retrieve_with_metadata(query, folder_id, query_embedding, keyword_task)
+        return results
+
+    async def retrieve_with_metadata(
+        self,
+        query: str,
+        folder_id: int,
+        query_embedding: Optional[List[float]] = None,
+        keyword_task: Optional["asyncio.Task"] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Retrieve the most relevant chunks for a query within a folder.
+
+        With ADAPTIVE_DEPTH_ENABLED, a deeper list is fetched once and the
+        number of chunks kept is chosen from the distribution of the chunks'
+        cosine similarity to the query. With
+        RERANK_ENABLED, a larger candidate pool is fetched with its vectors
+        and re-ranked with MMR so near-duplicate chunks don't crowd out other
+        evidence.
+
+        Args:
+            query: The user's question
+            folder_id: Folder ID to restrict the search to
+            query_embedding: Precomputed query embedding, generated if omitted
+            keyword_task: Keyword leg already started by start_retrieval
+
+        Returns:
+            Tuple of (search results, retrieval metadata with
+            "retrieval_depth", "depth_reason" and "candidates")
+        """
+        if keyword_task is None:
+            keyword_task = self.start_retrieval(query, folder_id)
+
+        try:
+            # Step 1: Generate embedding for the query
+            # (the keyword leg, if any, is already running)
+            if query_embedding is None:
+                logger.info(f"Generating embedding for query: {query}")
+                with timed_stage("embedding"):
+                    query_embedding = await openai_service.generate_embedding(query)
+
+            # Step 2: Search with folder isolation
+            # The indexer service uses a single index with folder_id filtering
+            # This ensures users only see their own folder's documents
+            logger.info(f"Searching folder {folder_id} for relevant chunks")
+            with timed_stage("search"):
+                if keyword_task is not None:
+                    results = await hybrid_retriever.retrieve(
+                        query=query,
+                        query_vector=query_embedding,
+                        folder_id=folder_id,
+                        top=self._fetch_depth(),
+                        keyword_task=keyword_task,
+                        include_vectors=self._include_vectors()
+                    )
+                else:
+                    results = await indexer_service.search_with_folder_filter(
+                        query=query,
+                        query_vector=query_embedding,
+                        folder_id=folder_id,
+                        top=self._fetch_depth(),
+                        include_vectors=self._include_vectors()
+                    )
+
+        finally:
+            if keyword_task is not None and not keyword_task.done():
+                keyword_task.cancel()
+
+        with timed_stage("rerank"):
+            # Step 3: Decide how many chunks the question needs
+            if settings.ADAPTIVE_DEPTH_ENABLED:
+                depth, reason = adaptive_depth.choose(results, query_embedding)
+            else:
+                depth, reason = min(self.top, len(results)), "fixed"
+
+            # Step 4: Pick distinct chunks from the over-fetched pool
+            if settings.RERANK_ENABLED:
+                selected = mmr_reranker.rerank(query_embedding, results, depth)
+            else:
+                selected = results[:depth]
+
+            # Vectors were only needed to choose; keep them out of prompts,
+            # prefetch entries and session JSON
+            selected = [{key: value for key, value in result.items() if key != "vector"} for result in selected]
+
+        retrieved_chunks.observe(len(selected))
+        logger.info(f"Kept {len(selected)} of {len(results)} retrieved chunks ({reason})")
+        metadata = {"retrieval_depth": len(selected), "depth_reason": reason, "candidates": len(results)}
+        return selected, metadata
+
+    def start_retrieval(self, query: str, folder_id: int) -> Optional["asyncio.Task"]:
+        """
+        Start the parts of retrieval that don't need the query embedding.
+
+        Returns:
+            The running keyword-leg task in "rrf" mode, otherwise None
+        """
+        if settings.RETRIEVAL_MODE == "rrf":
+            return hybrid_retriever.start_keyword_leg(
+                query, folder_id, self._fetch_depth(), include_vectors=self._include_vectors()
+            )
+        return None
+
+    def _include_vectors(self) -> bool:
+        """Chunk vectors are needed for MMR and for scoring adaptive depth on raw cosine."""
+        return settings.RERANK_ENABLED or settings.ADAPTIVE_DEPTH_ENABLED
+
+    def _fetch_depth(self) -> int:
+        """Results to fetch from search, enough for the MMR candidate pool and the deepest adaptive cut."""
+        depth = self.top
+        if settings.RERANK_ENABLED:
+            depth = max(depth, mmr_reranker.candidate_pool)
+        if settings.ADAPTIVE_DEPTH_ENABLED:
+            depth = max(depth, adaptive_depth.max_depth)
+        return depth
+
+    async def _embed_or_cached_answer(
+        self,
+        query: str,
+        folder_id: int,
+        keyword_task: Optional["asyncio.Task"],
+        query_embedding: Optional[List[float]] = None
+    ) -> Tuple[List[float], Optional[Dict[str, Any]]]:
+        """
+        Embed the query (unless already embedded) and check the answer cache.
+
+        The keyword leg is cancelled when the cache answers the question.
+
+        Returns:
+            Tuple of (query embedding, cached response or None)
+        """
+        if query_embedding is None:
+            try:
+                logger.info(f"Generating embedding for query: {query}")
+                with timed_stage("embedding"):
+                    query_embedding = await openai_service.generate_embedding(query)
+            except BaseException:
+                if keyword_task is not None:
+                    keyword_task.cancel()
+                raise
+
+        cached = None
+        if settings.ANSWER_CACHE_ENABLED:
+            with timed_stage("answer_cache"):
+                cached = answer_cache.lookup(folder_id, query_embedding)
+            if cached is not None and keyword_task is not None:
+                keyword_task.cancel()
+
+        return query_embedding, cached
+
+    async def answer(
+        self,
+        query: str,
+        folder_id: int,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """
+        Answer a question from the documents in a folder.
+
+        Args:
+            query: The user's question
+            folder_id: Folder ID to restrict the search to
+            query_embedding: Precomputed query embedding, generated if omitted
+
+        Returns:
+            Dictionary with "answer", "sources" and retrieval "metadata"
+            (ChatResponse shape)
+        """
+        # Read the generation before retrieval so answers computed against
+        # documents that change mid-request are never cached
+        generation = folder_generations.get(folder_id)
+
+        prefetched = await self._take_prefetched(query, folder_id, query_embedding)
+        if prefetched is not None:
+            query_embedding = self._prefetched_embedding(prefetched)
+
+        # The keyword leg runs while the query is embedded
+        keyword_task = self.start_retrieval(query, folder_id) if prefetched is None else None
+        query_embedding, cached = await self._embed_or_cached_answer(
+            query, folder_id, keyword_task, query_embedding
+        )
+        if cached is not None:
+            return self._mark_cached(cached)
+
+        if prefetched is not None:
+            search_results, metadata = prefetched[1], prefetched[2]
+        else:
+            search_results, metadata = await self.retrieve_with_metadata(
+                query, folder_id, query_embedding, keyword_task
+            )
+
+        if not search_results:
+            return {"answer": NO_RESULTS_ANSWER, "sources": [], "metadata": metadata}
+
+        # Step 5: Generate response using Azure OpenAI with retrieved context
+        logger.info("Generating response with Azure OpenAI")
+        with timed_stage("generate"):
+            answer, usage = await openai_service.generate_response_with_usage(
+                query=query,
+                context=search_results
+            )
+        llm_tokens.observe(usage["prompt_tokens"], "prompt")
+        llm_tokens.observe(usage["completion_tokens"], "completion")
+
+        response = {"answer": answer, "sources": self.format_sources(search_results), "metadata": metadata}
+
+        if settings.ANSWER_CACHE_ENABLED and self._cacheable(metadata):
+            answer_cache.store(
+                folder_id, query, query_embedding, response, generation,
+                tokens=usage["total_tokens"]
+            )
+
+        return response
+
+    async def answer_coalesced(self, query: str, folder_id: int) -> Dict[str, Any]:
+        """
+        Answer a question, sharing the work with identical requests already in flight.
+
+        Requests are identical when they target the same folder (at the same
+        document generation) with the same normalized query.
+
+        Args:
+            query: The user's question
+            folder_id: Folder ID to restrict the search to
+
+        Returns:
+            Same as answer(); the dictionary may be shared between callers
+        """
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await self.answer(query, folder_id)
+
+        digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        key = f"chat:{folder_id}:{folder_generations.get(folder_id)}:{digest}"
+        return await single_flight.do(key, lambda: self.answer(query, folder_id))
+
+    async def stream_answer(self, query: str, folder_id: int) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer a question as a sequence of frames.
+
+        Frames are emitted in this order:
+        - {"type": "sources", "sources": [...]} once retrieval finishes
+        - {"type": "token", "content": "..."} for each completion delta
+        - {"type": "done", "answer": "...", "sources": [...], "metadata": {...}} with the full ChatResponse
+
+        Args:
+            query: The user's question
+            folder_id: Folder ID to restrict the search to
+
+        Yields:
+            Frame dictionaries
+        """
+        generation = folder_generations.get(folder_id)
+
+        prefetched = await self._take_prefetched(query, folder_id)
+        keyword_task = self.start_retrieval(query, folder_id) if prefetched is None else None
+        query_embedding, cached = await self._embed_or_cached_answer(
+            query, folder_id, keyword_task, self._prefetched_embedding(prefetched)
+        )
+        if cached is not None:
+            yield {"type": "sources", "sources": cached["sources"]}
+            yield {"type": "token", "content": cached["answer"]}
+            yield {"type": "done", **self._mark_cached(cached)}
+            return
+
+        if prefetched is not None:
+            search_results, metadata = prefetched[1], prefetched[2]
+        else:
+            search_results, metadata = await self.retrieve_with_metadata(
+                query, folder_id, query_embedding, keyword_task
+            )
+        sources = self.format_sources(search_results)
+
+        yield {"type": "sources", "sources": sources}
+
+        if not search_results:
+            yield {"type": "done", "answer": NO_RESULTS_ANSWER, "sources": [], "metadata": metadata}
+            return
+
+        logger.info("Streaming response with Azure OpenAI")
+        answer_parts = []
+        started = time.perf_counter()
+        async for delta in openai_service.stream_response(query=query, context=search_results):
+            if not answer_parts:
+                record_stage("first_token", time.perf_counter() - started)
+            answer_parts.append(delta)
+            yield {"type": "token", "content": delta}
+        # Includes the time the client took to read the stream
+        record_stage("generate", time.perf_counter() - started)
+
+        answer = "".join(answer_parts)
+        response = {"answer": answer, "sources": sources, "metadata": metadata}
+
+        # Streaming responses carry no usage block, so estimate the token counts
+        prompt_tokens = count_message_tokens(openai_service.build_messages(query, search_results))
+        completion_tokens = count_tokens(answer)
+        llm_tokens.observe(prompt_tokens, "prompt")
+        llm_tokens.observe(completion_tokens, "completion")
+
+        if settings.ANSWER_CACHE_ENABLED and self._cacheable(metadata):
+            answer_cache.store(
+                folder_id, query, query_embedding, response, generation,
+                tokens=prompt_tokens + completion_tokens
+            )
+
+        yield {"type": "done", **response}
+
+    async def prefetch(self, query: str, folder_id: int) -> Tuple[List[float], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Embed a partial query and retrieve its chunks ahead of the actual /chat call.
+
+        Runs below interactive priority so prefetching never delays submitted questions.
+
+        Returns:
+            Tuple of (query embedding, selected chunks, retrieval metadata)
+        """
+        with openai_scheduler.priority(PRIORITY_PREFETCH):
+            query_embedding = await openai_service.generate_embedding(query)
+        results, metadata = await self.retrieve_with_metadata(query, folder_id, query_embedding)
+        return query_embedding, results, metadata
+
+    async def _take_prefetched(
+        self,
+        query: str,
+        folder_id: int,
+        query_embedding: Optional[List[float]] = None
+    ) -> Optional[Tuple[List[float], List[Dict[str, Any]], Dict[str, Any]]]:
+        """Prefetched embedding and chunks for the query, unless the caller already embedded it."""
+        if query_embedding is not None or not settings.PREFETCH_ENABLED:
+            return None
+        with timed_stage("prefetch"):
+            return await prefetch_cache.take(folder_id, query)
+
+    @staticmethod
+    def _prefetched_embedding(
+        prefetched: Optional[Tuple[List[float], List[Dict[str, Any]], Dict[str, Any]]]
+    ) -> Optional[List[float]]:
+        """
+        The prefetch's embedding if it was computed for the submitted query.
+
+        A near hit's embedding is of the partial query, so the answer cache
+        must be looked up with a fresh embedding of the submitted one.
+        """
+        if prefetched is None or prefetched[2].get("prefetch") != "hit":
+            return None
+        return prefetched[0]
+
+    @staticmethod
+    def _cacheable(metadata: Dict[str, Any]) -> bool:
+        """
+        Whether an answer may go into the answer cache.
+
+        Not when its chunks were prefetched for a different partial query: the
+        answer would be served for questions matching the submitted one.
+        """
+        return metadata.get("prefetch") != "near_hit"
+
+    @staticmethod
+    def _mark_cached(cached: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of a cached response whose metadata says it came from the answer cache."""
+        return {**cached, "metadata": {**(cached.get("metadata") or {}), "answer_cache": "hit"}}
+
+    async def answer_batch(
+        self,
+        questions: List[str],
+        folder_id: int,
+        concurrency: int = 8
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer a list of questions against one folder, yielding each result as it finishes.
+
+        All query embeddings are generated up front with one batched call, then
+        retrieval and generation run for up to `concurrency` questions at a time.
+        A failing question yields an error frame and doesn't stop the batch.
+
+        Frames:
+        - {"type": "result", "index": i, "question": "...", "answer": "...", "sources": [...]}
+        - {"type": "error", "index": i, "question": "...", "detail": "..."}
+        - {"type": "done", "total": n, "failed": m} once every question is finished
+
+        Args:
+            questions: Questions to answer
+            folder_id: Folder ID to restrict the search to
+            concurrency: Maximum questions in flight at once
+
+        Yields:
+            Frame dictionaries, results in completion order
+        """
+        logger.info(f"Embedding {len(questions)} batch questions for folder {folder_id}")
+        # Batch work yields OpenAI quota to interactive chat
+        with openai_scheduler.priority(PRIORITY_BATCH):
+            embeddings = await openai_service.generate_embeddings(questions)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer_one(index: int, question: str, embedding: List[float]) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    with openai_scheduler.priority(PRIORITY_BATCH):
+                        result = await self.answer(question, folder_id, query_embedding=embedding)
+                    return {"type": "result", "index": index, "question": question, **result}
+                except Exception as e:
+                    logger.error(f"Error answering batch question {index}: {str(e)}")
+                    return {
+                        "type": "error",
+                        "index": index,
+                        "question": question,
+                        "detail": "Failed to process question"
+                    }
+
+        tasks = [
+            asyncio.create_task(answer_one(index, question, embedding))
+            for index, (question, embedding) in enumerate(zip(questions, embeddings))
+        ]
+
+        failed = 0
+        try:
+            for next_finished in asyncio.as_completed(tasks):
+                frame = await next_finished
+                if frame["type"] == "error":
+                    failed += 1
+                yield frame
+        finally:
+            # Client went away mid-batch: stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+        yield {"type": "done", "total": len(questions), "failed": failed}
+
+
+# Singleton instance
+rag_service = RAGService()
@@ -0,0 +1,125 @@
+"""
+Maximal Marginal Relevance (MMR) Re-ranking
+
+The search service ranks chunks by relevance only, so the top hits are often
+near-identical overlapping chunks from the same filing page. Retrieval
+over-fetches a candidate pool together with the chunk vectors, and this module
+picks the final chunks locally:
+
+    mmr(d) = lambda * sim(q, d) - (1 - lambda) * max_{s in selected} sim(d, s)
+
+Similarities are cosine, computed with NumPy on the whole pool at once. Each
+selection step updates a running "max similarity to anything selected" array
+with one matrix-vector product, so selecting k of n chunks costs O(k * n * d).
+"""
+
+from app.core.config import settings
+from typing import List, Dict, Any, Sequence
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length (zero rows stay zero)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7
+) -> List[int]:
+    """
+    Select k candidates by maximal marginal relevance.
+
+    Args:
+        query_vector: The query embedding
+        candidate_vectors: One embedding per candidate
+        k: Number of candidates to select
+        lambda_mult: 1.0 ranks by relevance only, 0.0 by diversity only
+
+    Returns:
+        Indexes into candidate_vectors, in selection order
+    """
+    candidates = normalize_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    if candidates.ndim != 2 or not len(candidates):
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    relevance = candidates @ (query / query_norm if query_norm else query)
+
+    k = min(k, len(candidates))
+    selected: List[int] = []
+    max_similarity = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    for _ in range(k):
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, candidates @ candidates[chosen], out=max_similarity)
+
+    return selected
+
+
+class MMRReranker:
+    def __init__(self, lambda_mult: float = 0.7, candidate_pool: int = 30):
+        self.lambda_mult = lambda_mult
+        self.candidate_pool = candidate_pool
+
+    def rerank(
+        self,
+        query_vector: List[float],
+        candidates: List[Dict[str, Any]],
+        top: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Pick `top` relevant but mutually distinct chunks from a candidate pool.
+
+        Candidates without a "vector" can't be compared; if any are missing
+        the pool keeps its service order. The "vector" key is removed from the
+        returned chunks.
+
+        Args:
+            query_vector: The query embedding
+            candidates: Search results fetched with include_vectors=True
+            top: Number of chunks to return
+
+        Returns:
+            Selected chunks in MMR order
+        """
+        if all(candidate.get("vector") for candidate in candidates):
+            order = mmr_select(
+                query_vector,
+                [candidate["vector"] for candidate in candidates],
+                top,
+                self.lambda_mult
+            )
+        else:
+            logger.warning("Candidates are missing vectors, skipping MMR re-ranking")
+            order = list(range(min(top, len(candidates))))
+
+        logger.info(f"Re-ranked {len(candidates)} candidates to {len(order)} with MMR")
+        return [
+            {key: value for key, value in candidates[index].items() if key != "vector"}
+            for index in order
+        ]
+
+
+# Singleton instance
+mmr_reranker = MMRReranker(
+    lambda_mult=settings.RERANK_MMR_LAMBDA,
+    candidate_pool=settings.RERANK_CANDIDATE_POOL
+)
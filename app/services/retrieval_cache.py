@@ -0,0 +1,196 @@
+"""
+Retrieval Result Cache
+
+Retries, refreshes and several users asking the same thing about one folder
+send identical searches. The results of folder-scoped searches are cached
+in front of Azure AI Search, keyed on:
+
+    (index, filter, normalized query text, quantized query-vector hash, top, ...)
+
+The query vector is rounded before hashing, so embeddings that differ only
+in float noise share an entry. Entries are tagged with the folder generation,
+which is bumped on every upload, delete, indexing run and metadata merge,
+and are dropped as soon as it changes. Size is bounded by entry count and by
+estimated memory (least recently used evicted first).
+"""
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.embedding_cache import normalize_query
+from app.services.folder_generations import folder_generations
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import hashlib
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+retrieval_cache_lookups = metrics.counter(
+    "rag_retrieval_cache_lookups_total", "Retrieval cache lookups by outcome", labels=("outcome",)
+)
+
+
+def vector_fingerprint(vector: Optional[Sequence[float]], decimals: int = 4) -> Optional[str]:
+    """Hash of the vector rounded to `decimals` places (None for no vector)."""
+    if vector is None:
+        return None
+    quantized = np.round(np.asarray(vector, dtype=np.float64) * 10 ** decimals).astype(np.int64)
+    return hashlib.blake2b(quantized.tobytes(), digest_size=16).hexdigest()
+
+
+def _estimate_size(results: List[Dict[str, Any]]) -> int:
+    return 500 + sum(
+        300 + len(result.get("content") or "") + 32 * len(result.get("vector") or ())
+        for result in results
+    )
+
+
+class RetrievalCache:
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        max_mb: int = 64,
+        ttl_seconds: int = 300,
+        vector_decimals: int = 4
+    ):
+        """
+        Args:
+            max_entries: Entries kept across all folders
+            max_mb: Estimated memory for cached results
+            ttl_seconds: Longest an entry is served (bounds staleness from
+                changes made in other workers)
+            vector_decimals: Rounding applied to query vectors before hashing
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+        self.vector_decimals = vector_decimals
+
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._keys_by_folder: Dict[int, Set[Tuple]] = {}
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        folder_generations.add_listener(self.invalidate)
+
+    def key(
+        self,
+        index_name: str,
+        filter: Optional[str],
+        query: Optional[str],
+        vector: Optional[Sequence[float]],
+        top: Optional[int],
+        *extra: Any
+    ) -> Tuple:
+        """
+        Cache key for a search.
+
+        Args:
+            index_name: Index searched
+            filter: OData filter
+            query: Search text (normalized for the key)
+            vector: Query vector (quantized and hashed)
+            top: Results requested
+            extra: Anything else that changes the results (select, k, skip)
+        """
+        return (
+            index_name,
+            filter,
+            normalize_query(query) if query else None,
+            vector_fingerprint(vector, self.vector_decimals),
+            top,
+            *extra
+        )
+
+    def get(self, folder_id: int, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        """Cached results (copies) for the key, or None."""
+        entry = self._entries.get(key)
+        if entry is not None and (
+            entry["generation"] != folder_generations.get(folder_id) or entry["expires_at"] < time.monotonic()
+        ):
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            retrieval_cache_lookups.inc("miss")
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        retrieval_cache_lookups.inc("hit")
+        return [dict(result) for result in entry["results"]]
+
+    def put(self, folder_id: int, key: Tuple, results: List[Dict[str, Any]], generation: int) -> None:
+        """
+        Store results fetched at `generation` (skipped if the folder changed since).
+
+        Args:
+            folder_id: Folder the search was scoped to
+            key: Key from key()
+            results: Search results
+            generation: Folder generation read before the search started
+        """
+        if generation != folder_generations.get(folder_id):
+            return
+
+        size = _estimate_size(results)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {
+            "results": [dict(result) for result in results],
+            "folder_id": int(folder_id),
+            "generation": generation,
+            "expires_at": time.monotonic() + self.ttl_seconds,
+            "size": size
+        }
+        self._keys_by_folder.setdefault(int(folder_id), set()).add(key)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, folder_id: int) -> None:
+        """Drop a folder's entries (registered as a folder generation listener)."""
+        for key in list(self._keys_by_folder.get(int(folder_id), ())):
+            self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "estimated_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        keys = self._keys_by_folder.get(entry["folder_id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_folder[entry["folder_id"]]
+
+
+# Singleton instance
+retrieval_cache = RetrievalCache(
+    max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+    max_mb=settings.RETRIEVAL_CACHE_MAX_MB,
+    ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,141 @@
+"""
+Adaptive Retrieval Depth
+
+Decides how many retrieved chunks go into the prompt instead of always using
+five. Retrieval over-fetches once; the cut is then made from the score
+distribution of the ranked results:
+
+- Score gap: a sharp drop after the first few results means the query has a
+  small set of clearly relevant chunks (a simple lookup), so stop at the gap.
+- Score mass: otherwise take the smallest prefix holding a fixed fraction of
+  the total score. Flat distributions (broad questions like "summarize the
+  risk factors") need more chunks to reach it than peaked ones.
+- Token budget: never pick more chunks than fit in the prompt context budget.
+
+The rules run on raw relevance, not on the fused "score": RRF scores are
+1 / (k + rank), so with k = 60 the top dozen results sit within ~15% of each
+other whatever their content, and every query would fall through to the
+mass rule. Relevance is the cosine between the query and chunk vectors (or
+the vector leg's score when results carry no vectors), rescaled so the
+weakest candidate in the pool is 0 and the best is 1. Unrelated chunks still
+have a cosine well above 0, so the pool's floor stands in for "irrelevant".
+"""
+
+from app.core.config import settings
+from app.services.hybrid_retrieval import VECTOR_LEG
+from app.services.reranker import normalize_rows
+from app.services.tokenizer import count_tokens
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveDepth:
+    def __init__(
+        self,
+        min_depth: int = 2,
+        max_depth: int = 12,
+        gap_threshold: float = 0.25,
+        mass_fraction: float = 0.8,
+        token_budget: int = 6000
+    ):
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.gap_threshold = gap_threshold
+        self.mass_fraction = mass_fraction
+        self.token_budget = token_budget
+
+    def choose(
+        self,
+        results: List[Dict[str, Any]],
+        query_vector: Optional[Sequence[float]] = None
+    ) -> Tuple[int, str]:
+        """
+        Choose how many of the ranked results to keep.
+
+        Args:
+            results: Search results with "content" and "vector" (or, from
+                fused retrieval, "leg_scores"; otherwise "score" is used)
+            query_vector: Query embedding, to score results that carry vectors
+
+        Returns:
+            Tuple of (depth, reason), reason being one of "score_gap",
+            "score_mass", "token_budget", "max_depth" or "all_results"
+        """
+        if len(results) <= self.min_depth:
+            return len(results), "all_results"
+
+        pool = sorted(relevance_scores(results, query_vector), reverse=True)
+        best, floor = pool[0], pool[-1]
+        if best <= floor:
+            return self._fit_budget(results, self.min_depth, "all_results")
+
+        normalized = [(score - floor) / (best - floor) for score in pool[:self.max_depth]]
+
+        # 1. Largest drop between neighbours, past the minimum depth
+        gap_depth, largest_gap = None, 0.0
+        for depth in range(self.min_depth, len(normalized)):
+            gap = normalized[depth - 1] - normalized[depth]
+            if gap > largest_gap:
+                gap_depth, largest_gap = depth, gap
+
+        if gap_depth is not None and largest_gap >= self.gap_threshold:
+            return self._fit_budget(results, gap_depth, "score_gap")
+
+        # 2. Smallest prefix holding mass_fraction of the score mass
+        total = sum(normalized)
+        cumulative = 0.0
+        for depth, score in enumerate(normalized, 1):
+            cumulative += score
+            if depth >= self.min_depth and cumulative >= self.mass_fraction * total:
+                reason = "max_depth" if depth == self.max_depth else "score_mass"
+                return self._fit_budget(results, depth, reason)
+
+        return self._fit_budget(results, len(normalized), "max_depth")
+
+    def _fit_budget(self, results: List[Dict[str, Any]], depth: int, reason: str) -> Tuple[int, str]:
+        """Lower depth until the highest-scoring `depth` chunks fit in the token budget."""
+        ordered = sorted(results, key=lambda result: result.get("score") or 0, reverse=True)
+
+        tokens = 0
+        for fitted, result in enumerate(ordered[:depth]):
+            tokens += count_tokens(result.get("content") or "")
+            if tokens > self.token_budget:
+                # Keep at least one chunk; the packer truncates it to fit
+                return max(1, fitted), "token_budget"
+
+        return depth, reason
+
+
+def relevance_scores(results: List[Dict[str, Any]], query_vector: Optional[Sequence[float]] = None) -> List[float]:
+    """
+    Raw query relevance of each result, for depth selection.
+
+    Cosine similarity to the query when every result has a "vector";
+    otherwise the vector leg's score for fused results (0 for chunks only the
+    keyword leg found) and the result score for everything else.
+    """
+    if query_vector is not None and results and all(result.get("vector") is not None for result in results):
+        vectors = normalize_rows(np.asarray([result["vector"] for result in results], dtype=np.float32))
+        query = normalize_rows(np.asarray([query_vector], dtype=np.float32))[0]
+        return (vectors @ query).tolist()
+
+    scores = []
+    for result in results:
+        if "leg_scores" in result:
+            scores.append(result["leg_scores"].get(VECTOR_LEG) or 0.0)
+        else:
+            scores.append(result.get("score") or 0.0)
+    return scores
+
+
+# Singleton instance
+adaptive_depth = AdaptiveDepth(
+    min_depth=settings.ADAPTIVE_DEPTH_MIN,
+    max_depth=settings.ADAPTIVE_DEPTH_MAX,
+    gap_threshold=settings.ADAPTIVE_DEPTH_GAP_THRESHOLD,
+    mass_fraction=settings.ADAPTIVE_DEPTH_MASS_FRACTION,
+    token_budget=settings.CONTEXT_TOKEN_BUDGET
+)
@@ -1,26 +1,134 @@
 """
 Azure AI Search service for document retrieval with folder isolation
+
+Folder isolation is part of the search request (an OData filter on
+folder_id). Chunks indexed before the metadata merger populated folder_id
+have folder_id null; their folder is only recorded in the base64-encoded
+blob URL in parent_id. Those chunks are found by paging through the
+folder_id-null results and resolving parent_ids with ParentFolderResolver,
+which decodes each distinct parent_id once and caches the folder. Parents
+already known to belong to the folder are included in the first request's
+filter, so a folder's legacy chunks cost extra requests only until they
+have been seen once.
 """
 import re
 import base64
-from typing import List, Dict, Any, Optional
+import binascii
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 import os
 
+# Blob names are folder-<id>/... (older uploads used folder_<id>/...)
+_FOLDER_IN_PATH = re.compile(r'/folder[-_](\d+)/')
+
+
+def decode_parent_id(parent_id: str) -> str:
+    """
+    Decode a parent_id back to the blob URL.
+
+    The blob indexer encodes it as a URL token: URL-safe base64 without
+    padding, followed by a digit giving the number of stripped '=' characters.
+    Plain base64 is accepted too.
+    """
+    candidates = []
+    if parent_id and parent_id[-1] in "012":
+        candidates.append(parent_id[:-1] + "=" * int(parent_id[-1]))
+    candidates.append(parent_id + "=" * (-len(parent_id) % 4))
+
+    for candidate in candidates:
+        try:
+            return base64.urlsafe_b64decode(candidate.replace("+", "-").replace("/", "_")).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            continue
+    return base64.b64decode(parent_id + "==").decode("utf-8", errors="ignore")
+
+
+class ParentFolderResolver:
+    """Maps parent_id -> folder ID, decoding each distinct parent_id once."""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._folders: "OrderedDict[str, Optional[int]]" = OrderedDict()
+        # search_multi_folder resolves from several threads
+        self._lock = threading.Lock()
+
+    def resolve(self, parent_ids: Iterable[str]) -> Dict[str, Optional[int]]:
+        """
+        Resolve a batch of parent_ids to folder IDs.
+
+        Duplicates in the batch and parent_ids seen before are served from
+        the cache; only new parent_ids are decoded.
+
+        Returns:
+            parent_id -> folder ID (None if the path has no folder)
+        """
+        resolved: Dict[str, Optional[int]] = {}
+        missing = []
+        with self._lock:
+            for parent_id in set(parent_ids):
+                if parent_id in self._folders:
+                    self._folders.move_to_end(parent_id)
+                    resolved[parent_id] = self._folders[parent_id]
+                else:
+                    missing.append(parent_id)
+
+        for parent_id in missing:
+            try:
+                match = _FOLDER_IN_PATH.search(decode_parent_id(parent_id))
+            except Exception:
+                match = None
+            resolved[parent_id] = int(match.group(1)) if match else None
+
+        with self._lock:
+            for parent_id in missing:
+                self._folders[parent_id] = resolved[parent_id]
+            while len(self._folders) > self.max_entries:
+                self._folders.popitem(last=False)
+
+        return resolved
+
+    def known_parents(self, folder_id: int, limit: int = 500) -> List[str]:
+        """Parent_ids already resolved to this folder (most recently used first)."""
+        with self._lock:
+            parents = [parent_id for parent_id, folder in reversed(self._folders.items()) if folder == folder_id]
+        return parents[:limit]
+
+
+# Shared across SearchService instances
+parent_folder_resolver = ParentFolderResolver()
+
+
 class SearchService:
     """Service for searching documents with folder isolation"""
 
-    def __init__(self):
+    # Paging through folder_id-null chunks
+    LEGACY_PAGE_SIZE = 50
+    LEGACY_MAX_PAGES = 10
+    # After a search finds no folder_id-null chunks at all, skip the scan for this long
+    LEGACY_RECHECK_SECONDS = 300
+    # Known legacy parents put into the first request's filter
+    MAX_FILTER_PARENTS = 500
+    # Concurrent per-folder searches in search_multi_folder
+    MAX_FAN_OUT = 8
+
+    def __init__(self, client: Optional[Any] = None, resolver: Optional[ParentFolderResolver] = None):
         self.endpoint = os.getenv("AZURE_SEARCH_ENDPOINT")
         self.key = os.getenv("AZURE_SEARCH_KEY")
         self.index_name = "finance-folder-2"
 
-        self.client = SearchClient(
+        self.client = client or SearchClient(
             endpoint=self.endpoint,
             index_name=self.index_name,
             credential=AzureKeyCredential(self.key)
         )
+        self.resolver = resolver or parent_folder_resolver
+        self._no_legacy_until = 0.0
 
     @staticmethod
     def extract_folder_id_from_parent_id(parent_id: str) -> Optional[int]:
@@ -30,17 +138,7 @@ class SearchService:
         parent_id format (base64): https://...blob.core.windows.net/raw-documents/folder_X/filename.pdf
         Returns: X (as integer) or None if not found
         """
-        try:
-            # Decode base64
-            decoded = base64.b64decode(parent_id + "==").decode('utf-8', errors='ignore')
-
-            # Extract folder_X pattern
-            match = re.search(r'/folder_(\d+)/', decoded)
-            if match:
-                return int(match.group(1))
-            return None
-        except Exception:
-            return None
+        return parent_folder_resolver.resolve([parent_id]).get(parent_id)
 
     def search_with_folder_filter(
         self,
@@ -63,101 +161,217 @@ class SearchService:
         Returns:
             List of search results filtered by folder_id
         """
-        # Perform search without folder filter first
-        # (since folder_id field is null, we filter in application layer)
+        results = list(islice(self.iter_search_with_folder_filter(query, folder_id, top, use_semantic, debug), top))
+        ranked = sorted(results, key=lambda result: result["score"] or 0, reverse=True)
+
+        if debug:
+            print(f"[DEBUG] Results matching folder_id={folder_id}: {len(ranked)}")
+
+        return ranked
+
+    def iter_search_with_folder_filter(
+        self,
+        query: str,
+        folder_id: int,
+        page_size: int = 50,
+        use_semantic: bool = True,
+        debug: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield a folder's search results lazily, fetching pages as they are consumed
+
+        Chunks tagged with the folder come first, in score order. Legacy chunks
+        found by paging through folder_id-null results follow. A caller that
+        stops after n results never requests the pages beyond them.
+
+        Args:
+            query: Search query text
+            folder_id: Folder ID to filter by (enforces user isolation)
+            page_size: Results per request for the tagged chunks
+            use_semantic: Use semantic search ranking
+            debug: Print debug information
+
+        Yields:
+            Search results filtered by folder_id
+        """
+        # Chunks tagged with the folder, plus legacy chunks whose parent is known to be in it
+        folder_filter = f"folder_id eq '{folder_id}'"
+        known_parents = self.resolver.known_parents(folder_id, self.MAX_FILTER_PARENTS)
+        if known_parents:
+            folder_filter = (
+                f"{folder_filter} or "
+                f"(folder_id eq null and search.in(parent_id, '{'|'.join(known_parents)}', '|'))"
+            )
+
+        if debug:
+            print(f"\n[DEBUG] Searching folder {folder_id} ({len(known_parents)} known legacy parents)")
+
+        seen = set()
+        for page in self._iter_pages(query, folder_filter, page_size, use_semantic):
+            for result in page:
+                seen.add(result.get("chunk_id"))
+                yield self._to_result(result, folder_id)
+
+        # Legacy chunks of this folder that haven't been seen yet
+        if time.monotonic() < self._no_legacy_until:
+            return
+
+        legacy_pages = self._iter_pages(query, "folder_id eq null", self.LEGACY_PAGE_SIZE, use_semantic, self.LEGACY_MAX_PAGES)
+        for page_number, page in enumerate(legacy_pages):
+            if page_number == 0 and not page:
+                self._no_legacy_until = time.monotonic() + self.LEGACY_RECHECK_SECONDS
+
+            folders = self.resolver.resolve(result.get("parent_id") for result in page if result.get("parent_id"))
+            matched = [
+                result for result in page
+                if folders.get(result.get("parent_id")) == folder_id and result.get("chunk_id") not in seen
+            ]
+
+            if debug:
+                print(f"[DEBUG] Legacy page {page_number}: {len(page)} results, {len(matched)} in folder {folder_id}")
+
+            for result in matched:
+                seen.add(result.get("chunk_id"))
+                yield self._to_result(result, folder_id)
+
+    def _iter_pages(
+        self,
+        query: str,
+        filter: str,
+        page_size: int,
+        use_semantic: bool,
+        max_pages: Optional[int] = None
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages of results until a short page (or max_pages) is reached."""
+        page_number = 0
+        while max_pages is None or page_number < max_pages:
+            page = self._search(query, filter, page_size, page_number * page_size, use_semantic)
+            yield page
+            if len(page) < page_size:
+                return
+            page_number += 1
+
+    def _search(self, query: str, filter: str, top: int, skip: int, use_semantic: bool) -> List[Dict[str, Any]]:
         search_params = {
             "search_text": query,
-            "top": top * 3,  # Get more results to filter
-            "select": ["id", "parent_id", "title", "chunk"],
+            "filter": filter,
+            "top": top,
+            "select": ["chunk_id", "parent_id", "folder_id", "title", "chunk"],
         }
+        if skip:
+            search_params["skip"] = skip
 
         if use_semantic:
             search_params["query_type"] = "semantic"
             search_params["semantic_configuration_name"] = "semantic-config"
 
-        results = list(self.client.search(**search_params))
+        return list(self.client.search(**search_params))
 
-        if debug:
-            print(f"\n[DEBUG] Total raw results from Azure Search: {len(results)}")
-            folder_distribution = {}
-
-        # Filter results by folder_id extracted from parent_id
-        filtered_results = []
-        for result in results:
-            parent_id = result.get("parent_id")
-            if parent_id:
-                result_folder_id = self.extract_folder_id_from_parent_id(parent_id)
-
-                if debug:
-                    # Track folder distribution
-                    if result_folder_id:
-                        folder_distribution[result_folder_id] = folder_distribution.get(result_folder_id, 0) + 1
-
-                if result_folder_id == folder_id:
-                    filtered_results.append({
-                        "id": result.get("id"),
-                        "title": result.get("title"),
-                        "content": result.get("chunk"),
-                        "score": result.get("@search.score"),
-                        "folder_id": result_folder_id
-                    })
-
-                    if len(filtered_results) >= top:
-                        break
-
-        if debug:
-            print(f"[DEBUG] Folder distribution in results: {folder_distribution}")
-            print(f"[DEBUG] Results matching folder_id={folder_id}: {len(filtered_results)}")
-
-        return filtered_results
+    @staticmethod
+    def _to_result(result: Dict[str, Any], folder_id: int) -> Dict[str, Any]:
+        return {
+            "chunk_id": result.get("chunk_id"),
+            "title": result.get("title"),
+            "content": result.get("chunk"),
+            "score": result.get("@search.score"),
+            "folder_id": folder_id
+        }
 
     def search_multi_folder(
         self,
         query: str,
         folder_ids: List[int],
         top: int = 40,
-        use_semantic: bool = True
+        use_semantic: bool = True,
+        fan_out: bool = False
     ) -> List[Dict[str, Any]]:
         """
         Search across multiple folders (for users with multiple folder access)
 
+        Every folder gets a quota of top / len(folder_ids) results, so one large
+        folder can't crowd out the others. Slots a folder can't fill go to the
+        best remaining results, compared by score relative to the top score in
+        their own folder.
+
+        By default one request covers all folders (search.in on folder_id), and
+        only folders left short of their quota are searched individually,
+        which includes the scan for their unresolved legacy chunks.
+        With fan_out, every folder is searched individually, concurrently.
+
         Args:
             query: Search query text
             folder_ids: List of folder IDs user has access to
             top: Number of results to return
             use_semantic: Use semantic search ranking
+            fan_out: Search each folder with its own request
 
         Returns:
             List of search results from allowed folders
         """
-        search_params = {
-            "search_text": query,
-            "top": top * 2,  # Get more results to filter (2x for multi-folder)
-            "select": ["id", "parent_id", "title", "chunk"],
-        }
+        folder_ids = list(dict.fromkeys(int(folder_id) for folder_id in folder_ids))
+        if not folder_ids or top <= 0:
+            return []
+        if len(folder_ids) == 1:
+            return self.search_with_folder_filter(query, folder_ids[0], top, use_semantic)
 
-        if use_semantic:
-            search_params["query_type"] = "semantic"
-            search_params["semantic_configuration_name"] = "semantic-config"
+        quota = -(-top // len(folder_ids))
+        by_folder: Dict[int, List[Dict[str, Any]]] = {folder_id: [] for folder_id in folder_ids}
+
+        if fan_out:
+            short = folder_ids
+        else:
+            pool_size = max(top * 2, 50)
+            results = self._search(query, self._multi_folder_filter(folder_ids), pool_size, 0, use_semantic)
+            folders = self.resolver.resolve(
+                result.get("parent_id") for result in results if not result.get("folder_id") and result.get("parent_id")
+            )
+            for result in results:
+                folder_id = int(result["folder_id"]) if result.get("folder_id") else folders.get(result.get("parent_id"))
+                if folder_id in by_folder:
+                    by_folder[folder_id].append(self._to_result(result, folder_id))
+
+            # A short folder may have been outranked in the shared pool, or have
+            # legacy chunks whose parents aren't resolved yet (only the
+            # per-folder search scans folder_id-null chunks for them)
+            short = [folder_id for folder_id in folder_ids if len(by_folder[folder_id]) < quota]
+
+        if short:
+            with ThreadPoolExecutor(max_workers=min(len(short), self.MAX_FAN_OUT)) as executor:
+                searches = {
+                    folder_id: executor.submit(self.search_with_folder_filter, query, folder_id, top, use_semantic)
+                    for folder_id in short
+                }
+                for folder_id, search in searches.items():
+                    by_folder[folder_id] = search.result()
+
+        return self._merge_fair(by_folder, top, quota)
+
+    @staticmethod
+    def _merge_fair(by_folder: Dict[int, List[Dict[str, Any]]], top: int, quota: int) -> List[Dict[str, Any]]:
+        selected, leftovers, seen = [], [], set()
+        for folder_results in by_folder.values():
+            folder_results = sorted(folder_results, key=lambda result: result["score"] or 0, reverse=True)
+            best = (folder_results[0]["score"] or 0) if folder_results else 0
+            for rank, result in enumerate(folder_results):
+                if result["chunk_id"] in seen:
+                    continue
+                seen.add(result["chunk_id"])
+                relative = (result["score"] or 0) / best if best else 0.0
+                (selected if rank < quota else leftovers).append((relative, result))
+
+        # quota * folders can exceed top: keep the relatively strongest
+        selected.sort(key=lambda item: item[0], reverse=True)
+        leftovers.sort(key=lambda item: item[0], reverse=True)
+        merged = [result for _, result in (selected + leftovers)[:top]]
+        return sorted(merged, key=lambda result: result["score"] or 0, reverse=True)
 
-        results = list(self.client.search(**search_params))
-
-        # Filter results by allowed folder_ids
-        filtered_results = []
-        for result in results:
-            parent_id = result.get("parent_id")
-            if parent_id:
-                result_folder_id = self.extract_folder_id_from_parent_id(parent_id)
-                if result_folder_id in folder_ids:
-                    filtered_results.append({
-                        "id": result.get("id"),
-                        "title": result.get("title"),
-                        "content": result.get("chunk"),
-                        "score": result.get("@search.score"),
-                        "folder_id": result_folder_id
-                    })
-
-                    if len(filtered_results) >= top:
-                        break
-
-        return filtered_results
+    def _multi_folder_filter(self, folder_ids: List[int]) -> str:
+        folder_filter = f"search.in(folder_id, '{','.join(str(folder_id) for folder_id in folder_ids)}', ',')"
+        known_parents = [
+            parent_id
+            for folder_id in folder_ids
+            for parent_id in self.resolver.known_parents(folder_id, self.MAX_FILTER_PARENTS)
+        ][:self.MAX_FILTER_PARENTS]
+        if known_parents:
+            folder_filter += f" or (folder_id eq null and search.in(parent_id, '{'|'.join(known_parents)}', '|'))"
+        return folder_filter
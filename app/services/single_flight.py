@@ -0,0 +1,251 @@
+"""
+Single-Flight Request Coalescing
+
+Concurrent identical requests share one computation instead of each running
+their own embedding, search and completion. The first caller for a key starts
+the work; everyone who asks for the same key while it's in flight awaits the
+same result (or exception).
+
+The work runs in its own task, so one caller disconnecting doesn't cancel it
+for the others. It is only cancelled once every caller waiting on it has gone.
+
+Coalescing is always in-process. With a lock backend (e.g. Redis) it also
+works across workers: the worker that takes the lock computes and publishes
+the result, and other workers wait for it. If the lock holder dies or takes
+too long, a waiting worker computes the result itself.
+"""
+
+from abc import ABC, abstractmethod
+from app.core.config import settings
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightBackend(ABC):
+    """
+    Cross-worker lock and result hand-off used by SingleFlight.
+
+    Results passed through a backend must be JSON-serializable.
+    """
+
+    @abstractmethod
+    async def acquire(self, key: str) -> Optional[str]:
+        """Try to take the lock for key. Returns a lock token, or None if another worker holds it."""
+
+    @abstractmethod
+    async def release(self, key: str, token: str) -> None:
+        """Release the lock, if it is still held with this token."""
+
+    @abstractmethod
+    async def publish(self, key: str, result: Any) -> None:
+        """Make the result available to workers waiting on key."""
+
+    @abstractmethod
+    async def wait_result(self, key: str, timeout: float) -> Optional[Any]:
+        """Wait for the lock holder's result. Returns None if it never arrives."""
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisSingleFlightBackend(SingleFlightBackend):
+    """
+    Redis lock backend: SET NX PX for the lock, a short-lived key for the
+    result, and polling for waiters.
+
+    Args:
+        url: Redis connection URL
+        lock_ttl_seconds: Lock expiry, bounds how long a crashed holder blocks others
+        result_ttl_seconds: How long a published result stays readable
+        poll_interval_seconds: Waiter polling interval
+        prefix: Key prefix
+    """
+
+    # Delete the lock only if we still own it
+    _RELEASE_SCRIPT = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        url: str,
+        lock_ttl_seconds: float = 60,
+        result_ttl_seconds: float = 5,
+        poll_interval_seconds: float = 0.05,
+        prefix: str = "singleflight:"
+    ):
+        # Optional dependency, only needed when the Redis backend is configured
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+        self.lock_ttl_ms = int(lock_ttl_seconds * 1000)
+        self.result_ttl_ms = int(result_ttl_seconds * 1000)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.prefix = prefix
+
+    async def acquire(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        acquired = await self._redis.set(f"{self.prefix}lock:{key}", token, nx=True, px=self.lock_ttl_ms)
+        return token if acquired else None
+
+    async def release(self, key: str, token: str) -> None:
+        await self._redis.eval(self._RELEASE_SCRIPT, 1, f"{self.prefix}lock:{key}", token)
+
+    async def publish(self, key: str, result: Any) -> None:
+        await self._redis.set(f"{self.prefix}result:{key}", json.dumps(result), px=self.result_ttl_ms)
+
+    async def wait_result(self, key: str, timeout: float) -> Optional[Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while loop.time() < deadline:
+            payload = await self._redis.get(f"{self.prefix}result:{key}")
+            if payload is not None:
+                return json.loads(payload)
+
+            # Lock gone without a result: the holder failed
+            if not await self._redis.exists(f"{self.prefix}lock:{key}"):
+                return None
+
+            await asyncio.sleep(self.poll_interval_seconds)
+
+        return None
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, backend: Optional[SingleFlightBackend] = None, wait_timeout_seconds: float = 60):
+        self.backend = backend
+        self.wait_timeout_seconds = wait_timeout_seconds
+
+        self._calls: Dict[str, _Call] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_results = 0
+        self.cancelled = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Callers share the returned object, so treat it as read-only.
+
+        Args:
+            key: Identifies equivalent requests
+            fn: Coroutine function computing the result
+
+        Returns:
+            The shared result
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(self._execute(key, fn)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined in-flight request {key[:16]}")
+
+        call.waiters += 1
+        try:
+            # Shield so this caller's cancellation doesn't cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller is gone, nobody needs the result
+                self.cancelled += 1
+                call.task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_results": self.remote_results,
+            "cancelled": self.cancelled,
+            "backend": type(self.backend).__name__ if self.backend else None
+        }
+
+    async def close(self) -> None:
+        if self.backend is not None:
+            await self.backend.close()
+
+    async def _execute(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.backend is None:
+            return await fn()
+
+        try:
+            token = await self.backend.acquire(key)
+        except Exception as e:
+            logger.warning(f"Single-flight backend unavailable, computing locally: {str(e)}")
+            return await fn()
+
+        if token is None:
+            # Another worker is computing it
+            result = await self.backend.wait_result(key, self.wait_timeout_seconds)
+            if result is not None:
+                self.remote_results += 1
+                return result
+            logger.info(f"No result from other worker for {key[:16]}, computing locally")
+            return await fn()
+
+        try:
+            result = await fn()
+            try:
+                await self.backend.publish(key, result)
+            except Exception as e:
+                logger.warning(f"Failed to publish single-flight result: {str(e)}")
+            return result
+        finally:
+            try:
+                await self.backend.release(key, token)
+            except Exception as e:
+                logger.warning(f"Failed to release single-flight lock: {str(e)}")
+
+    def _finished(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Mark the exception retrieved if every caller left before it was raised
+        if not call.task.cancelled():
+            call.task.exception()
+
+
+def _create_backend() -> Optional[SingleFlightBackend]:
+    if settings.SINGLE_FLIGHT_BACKEND == "redis":
+        if not settings.REDIS_URL:
+            logger.warning("SINGLE_FLIGHT_BACKEND is redis but REDIS_URL is not set, coalescing in-process only")
+            return None
+        return RedisSingleFlightBackend(
+            settings.REDIS_URL,
+            lock_ttl_seconds=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS
+        )
+    return None
+
+
+# Singleton instance
+single_flight = SingleFlight(
+    backend=_create_backend(),
+    wait_timeout_seconds=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS
+)
@@ -0,0 +1,38 @@
+"""
+Token counting helpers.
+
+Uses tiktoken when it is installed and falls back to a ~4 characters per
+token estimate otherwise, which is close enough for budgeting English text.
+"""
+
+from typing import List, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception as e:
+    _encoding = None
+    logger.info(f"tiktoken unavailable, using character-based token estimates: {e}")
+
+# Per-message overhead added by the chat completions format
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """Count (or estimate) the number of tokens in a string."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Count (or estimate) the prompt tokens of a chat completions message list."""
+    return sum(
+        count_tokens(message.get("content") or "") + MESSAGE_TOKEN_OVERHEAD
+        for message in messages
+    ) + 2
@@ -0,0 +1,85 @@
+"""
+Benchmark: prompt context size with fixed 2000-char truncation vs. the token-budget packer.
+
+Builds synthetic search results shaped like SplitSkill output (2000-char pages
+with a 500-char overlap between neighbours of the same document) and reports
+context tokens and packing time for both approaches.
+
+Usage:
+    python -m benchmarks.context_packing --chunks 8 --budget 3000
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from app.services.context_packer import ContextPacker
+from app.services.tokenizer import count_tokens
+import argparse
+import random
+import time
+
+VOCABULARY = (
+    "revenue net income operating margin fiscal year segment cash flow liquidity "
+    "debt covenant guidance EBITDA quarter growth decline risk factors impairment"
+).split()
+
+
+def make_chunks(count: int, page_chars: int, overlap: int, documents: int, seed: int) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    for document in range(documents):
+        text = " ".join(rng.choice(VOCABULARY) for _ in range(page_chars * count))
+        step = page_chars - overlap
+        for page in range(count // documents):
+            chunks.append({
+                "chunk_id": f"doc{document}_page{page}",
+                "parent_id": f"doc{document}",
+                "title": f"report-{document}.pdf",
+                "content": text[page * step:page * step + page_chars],
+                "score": rng.random()
+            })
+    return chunks
+
+
+def truncation_context(chunks: list) -> str:
+    """The previous _format_context behaviour."""
+    parts = []
+    for i, chunk in enumerate(chunks, 1):
+        content = chunk["content"]
+        if len(content) > 2000:
+            content = content[:2000] + "..."
+        parts.append(f"Chunk {i} (File: {chunk['title']}, Relevance: {chunk['score']:.2f}):\n{content}\n")
+    return "\n".join(parts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=8)
+    parser.add_argument("--documents", type=int, default=2)
+    parser.add_argument("--page-chars", type=int, default=2000)
+    parser.add_argument("--overlap", type=int, default=500)
+    parser.add_argument("--budget", type=int, default=6000, help="Packer token budget")
+    parser.add_argument("--repeat", type=int, default=200, help="Timing iterations")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks, args.page_chars, args.overlap, args.documents, seed=7)
+    packer = ContextPacker(token_budget=args.budget)
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        old_text = truncation_context(chunks)
+    old_ms = (time.perf_counter() - started) * 1000 / args.repeat
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        packed = packer.pack(chunks)
+    new_ms = (time.perf_counter() - started) * 1000 / args.repeat
+
+    print(f"chunks={len(chunks)} overlap={args.overlap} budget={args.budget}")
+    print(f"{'method':<12}{'tokens':>8}{'chunks':>8}{'ms/call':>10}")
+    print(f"{'truncate':<12}{count_tokens(old_text):>8}{len(chunks):>8}{old_ms:>10.3f}")
+    print(f"{'packer':<12}{packed['tokens_used']:>8}{len(packed['chunks']):>8}{new_ms:>10.3f}")
+    print(f"overlap chars removed: {packed['overlap_chars_removed']}")
+
+
+if __name__ == "__main__":
+    main()
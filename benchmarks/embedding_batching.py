@@ -0,0 +1,81 @@
+"""
+Benchmark: one-request-per-text embeddings vs. packed batch embeddings.
+
+Runs OpenAIService against the local fake client, so no Azure quota is used.
+
+Usage:
+    python -m benchmarks.embedding_batching --texts 500 --base-ms 120 --per-item-ms 0.5
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from benchmarks.fakes import FakeAsyncAzureOpenAI, LatencyModel
+from app.services.openai_service import OpenAIService
+import argparse
+import asyncio
+import time
+
+
+def make_texts(count: int) -> list:
+    templates = [
+        "What was net revenue in FY{year} for segment {n}?",
+        "EBITDA margin trend {year} vs {prev} (item {n})",
+        "List the risk factors related to liquidity, note {n}, fiscal {year}",
+    ]
+    return [
+        templates[i % len(templates)].format(year=2015 + i % 10, prev=2014 + i % 10, n=i)
+        for i in range(count)
+    ]
+
+
+async def run(args) -> None:
+    texts = make_texts(args.texts)
+
+    def new_service() -> tuple:
+        client = FakeAsyncAzureOpenAI(
+            embedding_latency=LatencyModel(args.base_ms, args.per_item_ms, args.jitter_ms),
+            dimensions=args.dimensions
+        )
+        service = OpenAIService(client=client)
+        service.embedding_batch_max_items = args.max_items
+        service.embedding_batch_concurrency = args.concurrency
+        return service, client
+
+    # Sequential single-text calls (what every caller does today)
+    service, client = new_service()
+    started = time.perf_counter()
+    for text in texts:
+        await service.generate_embedding(text, use_cache=False)
+    sequential_s = time.perf_counter() - started
+    sequential_requests = client.embedding_requests
+
+    # Packed batch API
+    service, client = new_service()
+    started = time.perf_counter()
+    vectors = await service.generate_embeddings(texts, use_cache=False)
+    batched_s = time.perf_counter() - started
+    batched_requests = client.embedding_requests
+
+    assert len(vectors) == len(texts)
+
+    print(f"texts={len(texts)} max_items={args.max_items} concurrency={args.concurrency}")
+    print(f"{'mode':<12}{'requests':>10}{'seconds':>10}{'texts/s':>12}")
+    print(f"{'sequential':<12}{sequential_requests:>10}{sequential_s:>10.2f}{len(texts) / sequential_s:>12.1f}")
+    print(f"{'batched':<12}{batched_requests:>10}{batched_s:>10.2f}{len(texts) / batched_s:>12.1f}")
+    print(f"speedup: {sequential_s / batched_s:.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--base-ms", type=float, default=120.0, help="Fake per-request latency")
+    parser.add_argument("--per-item-ms", type=float, default=0.5, help="Fake per-text latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--max-items", type=int, default=64, help="Texts per request")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dimensions", type=int, default=256)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
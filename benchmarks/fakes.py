@@ -0,0 +1,555 @@
+"""
+In-process stand-ins for Azure services, used by the offline benchmarks.
+
+Fakes expose the same call surface the app uses on the real SDK clients and
+simulate service time with a configurable latency model.
+"""
+
+from types import SimpleNamespace
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from collections import Counter as TermCounter, deque
+from openai import InternalServerError, RateLimitError
+from azure.core.exceptions import HttpResponseError
+from app.services.tokenizer import count_tokens, count_message_tokens
+import asyncio
+import hashlib
+import httpx
+import math
+import random
+import re
+import time
+
+
+class LatencyModel:
+    """
+    Simulated service time: a base latency plus per-item cost, with jitter.
+
+    Real services have a long tail; `tail_fraction` of requests take an extra
+    `tail_ms` on top of the normal latency.
+
+    Args:
+        base_ms: Fixed latency per request
+        per_item_ms: Extra latency per input item (e.g. per text embedded)
+        jitter_ms: Standard deviation of normally distributed jitter
+        seed: Random seed for reproducible runs
+        tail_fraction: Fraction of requests that are slow
+        tail_ms: Extra latency of a slow request
+    """
+
+    def __init__(
+        self,
+        base_ms: float = 0.0,
+        per_item_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int = 0,
+        tail_fraction: float = 0.0,
+        tail_ms: float = 0.0
+    ):
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.jitter_ms = jitter_ms
+        self.tail_fraction = tail_fraction
+        self.tail_ms = tail_ms
+        self._random = random.Random(seed)
+
+    def sample(self, items: int = 1) -> float:
+        """Return a latency in seconds for a request with `items` inputs."""
+        latency_ms = self.base_ms + self.per_item_ms * items
+        if self.jitter_ms:
+            latency_ms += self._random.gauss(0, self.jitter_ms)
+        if self.tail_fraction and self._random.random() < self.tail_fraction:
+            latency_ms += self.tail_ms
+        return max(0.0, latency_ms) / 1000.0
+
+    async def wait(self, items: int = 1) -> None:
+        await asyncio.sleep(self.sample(items))
+
+
+class FaultModel:
+    """
+    Simulated service errors: each call fails with probability `error_rate`.
+
+    Args:
+        error_rate: Fraction of calls that fail
+        seed: Random seed for reproducible runs
+    """
+
+    def __init__(self, error_rate: float = 0.0, seed: int = 0):
+        self.error_rate = error_rate
+        self.failures = 0
+        self._random = random.Random(seed)
+
+    def should_fail(self) -> bool:
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.failures += 1
+            return True
+        return False
+
+
+def _openai_server_error() -> InternalServerError:
+    response = httpx.Response(
+        500,
+        request=httpx.Request("POST", "https://fake.openai.azure.com/")
+    )
+    return InternalServerError("Internal server error", response=response, body=None)
+
+
+def fake_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """Deterministic unit vector derived from the text, stable across runs."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+def hashed_embedding(text: str, dimensions: int = 1536) -> List[float]:
+    """
+    Bag-of-words unit vector (feature hashing): texts sharing words get a
+    higher cosine similarity. A crude lexical stand-in for a real embedding
+    model, enough to give the vector leg meaningful rankings offline.
+    """
+    vector = [0.0] * dimensions
+    for token in _TOKEN.findall((text or "").lower()):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+
+class FakeQuota:
+    """
+    Deployment quota enforced like Azure OpenAI: requests whose tokens
+    (prompt + max_tokens) would exceed the TPM/RPM share of a sliding window
+    are rejected with a 429 and a retry-after-ms header.
+
+    Args:
+        tokens_per_minute: TPM quota
+        requests_per_minute: RPM quota
+        window_seconds: Enforcement window
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, window_seconds: float = 10.0):
+        self.window_seconds = window_seconds
+        self.max_tokens = tokens_per_minute * window_seconds / 60
+        self.max_requests = requests_per_minute * window_seconds / 60
+        self._admitted: deque = deque()
+        self.rejected = 0
+
+    def admit(self, tokens: int) -> None:
+        now = time.monotonic()
+        while self._admitted and self._admitted[0][0] <= now - self.window_seconds:
+            self._admitted.popleft()
+
+        used = sum(admitted for _, admitted in self._admitted)
+        if used + tokens > self.max_tokens or len(self._admitted) + 1 > self.max_requests:
+            self.rejected += 1
+            retry_after = (self._admitted[0][0] + self.window_seconds - now) if self._admitted else 1.0
+            response = httpx.Response(
+                429,
+                headers={"retry-after-ms": str(int(max(retry_after, 0.001) * 1000))},
+                request=httpx.Request("POST", "https://fake.openai.azure.com/")
+            )
+            raise RateLimitError("Rate limit exceeded", response=response, body=None)
+
+        self._admitted.append((now, tokens))
+
+
+class _FakeEmbeddings:
+    def __init__(self, owner: "FakeAsyncAzureOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, input, **kwargs):
+        inputs = [input] if isinstance(input, str) else list(input)
+        if self._owner.embedding_quota is not None:
+            self._owner.embedding_quota.admit(sum(count_tokens(text) for text in inputs))
+        self._owner.embedding_requests += 1
+        self._owner.embedding_inputs += len(inputs)
+
+        await self._owner.embedding_latency.wait(len(inputs))
+        if self._owner.faults.should_fail():
+            raise _openai_server_error()
+
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(index=i, embedding=self._owner.embedding_fn(text, self._owner.dimensions))
+                for i, text in enumerate(inputs)
+            ],
+            model=model
+        )
+
+
+class _FakeStream:
+    def __init__(self, pieces: List[str], latency: LatencyModel):
+        self._pieces = pieces
+        self._latency = latency
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        # Leading chunk with no choices, like Azure's prompt filter results
+        yield SimpleNamespace(choices=[])
+        for piece in self._pieces:
+            await self._latency.wait()
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeAsyncAzureOpenAI"):
+        self._owner = owner
+
+    async def create(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 1000, stream: bool = False, **kwargs):
+        prompt_tokens = count_message_tokens(messages)
+        if self._owner.chat_quota is not None:
+            self._owner.chat_quota.admit(prompt_tokens + max_tokens)
+        self._owner.chat_requests += 1
+
+        completion_tokens = min(max_tokens, self._owner.completion_tokens)
+        words = ["Based", "on", "the", "documents,"] + ["revenue"] * max(0, completion_tokens - 4)
+        pieces = [word + " " for word in words[:completion_tokens]]
+
+        await self._owner.chat_latency.wait()
+        if self._owner.faults.should_fail():
+            raise _openai_server_error()
+
+        if stream:
+            return _FakeStream(pieces, self._owner.token_latency)
+
+        await asyncio.sleep(self._owner.token_latency.sample(len(pieces)))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="".join(pieces).strip()))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+
+class FakeAsyncAzureOpenAI:
+    """
+    Stand-in for openai.AsyncAzureOpenAI.
+
+    Pass an instance to OpenAIService(client=...) to run without Azure.
+
+    Args:
+        embedding_latency: Latency model for embeddings.create
+        dimensions: Embedding dimensions to return
+        chat_latency: Time to first token for chat.completions.create
+        token_latency: Time per generated token
+        completion_tokens: Tokens in each generated answer (capped by max_tokens)
+        chat_quota: Quota enforced on chat completions, None for unlimited
+        embedding_quota: Quota enforced on embeddings, None for unlimited
+        faults: Error model for embedding and chat calls (HTTP 500)
+        embedding_fn: Function (text, dimensions) -> vector, e.g. hashed_embedding
+    """
+
+    def __init__(
+        self,
+        embedding_latency: Optional[LatencyModel] = None,
+        dimensions: int = 1536,
+        chat_latency: Optional[LatencyModel] = None,
+        token_latency: Optional[LatencyModel] = None,
+        completion_tokens: int = 150,
+        chat_quota: Optional[FakeQuota] = None,
+        embedding_quota: Optional[FakeQuota] = None,
+        faults: Optional[FaultModel] = None,
+        embedding_fn: Callable[[str, int], List[float]] = fake_embedding
+    ):
+        self.embedding_latency = embedding_latency or LatencyModel()
+        self.dimensions = dimensions
+        self.chat_latency = chat_latency or LatencyModel()
+        self.token_latency = token_latency or LatencyModel()
+        self.completion_tokens = completion_tokens
+        self.chat_quota = chat_quota
+        self.embedding_quota = embedding_quota
+        self.faults = faults or FaultModel()
+        self.embedding_fn = embedding_fn
+
+        self.embedding_requests = 0
+        self.embedding_inputs = 0
+        self.chat_requests = 0
+        self.embeddings = _FakeEmbeddings(self)
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+
+
+_FILTER_EQ = re.compile(r"^(\w+) eq (?:'([^']*)'|(null))$")
+_FILTER_GT = re.compile(r"^(\w+) gt '((?:[^']|'')*)'$")
+_FILTER_IN = re.compile(r"^search\.in\((\w+),\s*'([^']*)'(?:,\s*'([^']*)')?\)$")
+_TOKEN = re.compile(r"\w+")
+
+
+def _http_error(status_code: int, message: str) -> HttpResponseError:
+    error = HttpResponseError(message=message)
+    error.status_code = status_code
+    return error
+
+
+def _strip_parens(expression: str) -> str:
+    expression = expression.strip()
+    while expression.startswith("(") and _closing_paren(expression) == len(expression) - 1:
+        expression = expression[1:-1].strip()
+    return expression
+
+
+def _closing_paren(expression: str) -> int:
+    depth = 0
+    for position, char in enumerate(expression):
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if depth == 0:
+            return position
+    return -1
+
+
+def _matches_filter(document: Dict[str, Any], expression: Optional[str]) -> bool:
+    """
+    Evaluate the OData subset the app uses: `eq` (including null), string
+    `gt`, `search.in` and `not`, joined with `and` / `or` (`and` binds tighter; parentheses only
+    around a whole alternative or clause).
+    """
+    if not expression:
+        return True
+
+    for alternative in _strip_parens(expression).split(" or "):
+        alternative = _strip_parens(alternative)
+        if all(_matches_clause(document, _strip_parens(clause)) for clause in alternative.split(" and ")):
+            return True
+    return False
+
+
+def _matches_clause(document: Dict[str, Any], clause: str) -> bool:
+    if clause.startswith("not "):
+        return not _matches_clause(document, _strip_parens(clause[4:]))
+
+    match = _FILTER_EQ.match(clause)
+    if match:
+        field, value, null = match.groups()
+        actual = document.get(field)
+        if null:
+            return actual is None
+        return actual is not None and str(actual) == value
+
+    match = _FILTER_GT.match(clause)
+    if match:
+        field, value = match.groups()
+        actual = document.get(field)
+        return actual is not None and str(actual) > value.replace("''", "'")
+
+    match = _FILTER_IN.match(clause)
+    if match:
+        field, values, delimiter = match.groups()
+        allowed = {value.strip() for value in values.split(delimiter or ",")}
+        return document.get(field) is not None and str(document.get(field)) in allowed
+
+    raise ValueError(f"Unsupported filter clause in fake search client: {clause}")
+
+
+def _facet(documents: List[Dict[str, Any]], facet: str) -> List[Dict[str, Any]]:
+    """Value facet ("field,count:N") or numeric interval facet ("field,interval:N")."""
+    field, *options = facet.split(",")
+    parameters = dict(option.split(":", 1) for option in options)
+    values = [document.get(field) for document in documents if document.get(field) is not None]
+
+    if "interval" in parameters:
+        interval = float(parameters["interval"])
+        buckets = TermCounter(type(value)(math.floor(value / interval) * interval) for value in values)
+        return [{"value": value, "count": count} for value, count in sorted(buckets.items())]
+
+    counts = TermCounter(values).most_common(int(parameters.get("count", 10)))
+    return [{"value": value, "count": count} for value, count in counts]
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class FakeSearchResults:
+    """Stand-in for the async SDK's AsyncSearchItemPaged."""
+
+    def __init__(self, documents: List[Dict[str, Any]], count: Optional[int] = None, facets: Optional[Dict] = None):
+        self._documents = documents
+        self._count = count
+        self._facets = facets
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents:
+            yield document
+
+    async def get_count(self) -> Optional[int]:
+        return self._count
+
+    async def get_facets(self) -> Optional[Dict]:
+        return self._facets
+
+
+class FakeAsyncSearchClient:
+    """
+    In-memory stand-in for azure.search.documents.aio.SearchClient.
+
+    Holds chunk documents shaped like the finance-folder-2 index and supports
+    the parts of the query API the app uses: keyword scoring (BM25), vector
+    similarity on `text_vector`, hybrid ranking, OData filters, select,
+    order_by, top and skip. Pass an instance to IndexerService(search_client=...).
+
+    Args:
+        documents: Initial chunk documents
+        latency: Latency model applied to every call
+        key_field: Index key field
+        faults: Error model for search calls (HTTP 503)
+        facetable: Fields that can be faceted (default: all); faceting
+            another field fails with HTTP 400 as on the service
+    """
+
+    def __init__(
+        self,
+        documents: Optional[List[Dict[str, Any]]] = None,
+        latency: Optional[LatencyModel] = None,
+        key_field: str = "chunk_id",
+        faults: Optional[FaultModel] = None,
+        facetable: Optional[List[str]] = None
+    ):
+        self.latency = latency or LatencyModel()
+        self.faults = faults or FaultModel()
+        self.facetable = facetable
+        self.key_field = key_field
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.search_requests = 0
+        # Term counts per document, so BM25 scoring doesn't re-tokenize every call
+        self._term_counts: Dict[str, Tuple[TermCounter, int]] = {}
+        for document in documents or []:
+            self.documents[document[key_field]] = dict(document)
+
+    async def search(
+        self,
+        search_text: Optional[str] = None,
+        *,
+        filter: Optional[str] = None,
+        vector_queries: Optional[list] = None,
+        select: Optional[List[str]] = None,
+        top: Optional[int] = None,
+        skip: Optional[int] = None,
+        order_by: Optional[List[str]] = None,
+        include_total_count: Optional[bool] = None,
+        facets: Optional[List[str]] = None,
+        **kwargs
+    ) -> FakeSearchResults:
+        self.search_requests += 1
+        await self.latency.wait()
+        if self.faults.should_fail():
+            raise _http_error(503, "Service unavailable")
+        for facet in facets or []:
+            field = facet.split(",")[0]
+            if self.facetable is not None and field not in self.facetable:
+                raise _http_error(400, f"Field '{field}' is not facetable")
+
+        candidates = [doc for doc in self.documents.values() if _matches_filter(doc, filter)]
+        ranked = self._rank(candidates, search_text, vector_queries)
+        for clause in reversed(order_by or []):
+            field, _, direction = clause.partition(" ")
+            ranked.sort(key=lambda item: str(item[1].get(field)), reverse=direction.strip() == "desc")
+
+        start = skip or 0
+        page = ranked[start:start + (50 if top is None else top)]
+
+        results = []
+        for score, document in page:
+            fields = select or list(document)
+            result = {field: document.get(field) for field in fields}
+            result["@search.score"] = score
+            results.append(result)
+
+        return FakeSearchResults(
+            results,
+            count=len(ranked) if include_total_count else None,
+            facets={facet.split(",")[0]: _facet([doc for _, doc in ranked], facet) for facet in facets} if facets else None
+        )
+
+    async def delete_documents(self, documents: List[Dict[str, Any]]) -> list:
+        await self.latency.wait()
+        for document in documents:
+            self.documents.pop(document[self.key_field], None)
+            self._term_counts.pop(document[self.key_field], None)
+        return [SimpleNamespace(key=document[self.key_field], succeeded=True) for document in documents]
+
+    async def upload_documents(self, documents: List[Dict[str, Any]]) -> list:
+        await self.latency.wait()
+        for document in documents:
+            self.documents[document[self.key_field]] = dict(document)
+            self._term_counts.pop(document[self.key_field], None)
+        return [SimpleNamespace(key=document[self.key_field], succeeded=True) for document in documents]
+
+    async def close(self) -> None:
+        pass
+
+    def _rank(self, candidates: List[Dict[str, Any]], search_text: Optional[str], vector_queries: Optional[list]):
+        keyword_ranked = None
+        if search_text and search_text != "*":
+            keyword_ranked = self._bm25(candidates, _tokenize(search_text))
+
+        vector_ranked = None
+        if vector_queries:
+            query = vector_queries[0]
+            scored = [
+                (_cosine(query.vector, doc.get(query.fields, [])), doc)
+                for doc in candidates if doc.get(query.fields)
+            ]
+            scored.sort(key=lambda item: item[0], reverse=True)
+            vector_ranked = scored[:query.k_nearest_neighbors or len(scored)]
+
+        if keyword_ranked is not None and vector_ranked is not None:
+            # Hybrid queries are ranked with RRF on the service as well
+            fused: Dict[str, list] = {}
+            for ranked in (keyword_ranked, vector_ranked):
+                for rank, (_, doc) in enumerate(ranked, 1):
+                    entry = fused.setdefault(doc[self.key_field], [0.0, doc])
+                    entry[0] += 1.0 / (60 + rank)
+            return sorted(((score, doc) for score, doc in fused.values()), key=lambda item: item[0], reverse=True)
+
+        if keyword_ranked is not None:
+            return keyword_ranked
+        if vector_ranked is not None:
+            return vector_ranked
+        return [(1.0, doc) for doc in candidates]
+
+    def _document_terms(self, doc: Dict[str, Any]) -> Tuple[TermCounter, int]:
+        key = doc[self.key_field]
+        terms = self._term_counts.get(key)
+        if terms is None:
+            tokens = _tokenize(doc.get("chunk", "")) + _tokenize(doc.get("title", ""))
+            terms = (TermCounter(tokens), len(tokens))
+            self._term_counts[key] = terms
+        return terms
+
+    def _bm25(self, candidates: List[Dict[str, Any]], terms: List[str], k1: float = 1.2, b: float = 0.75):
+        tokenized = [(*self._document_terms(doc), doc) for doc in candidates]
+        if not tokenized or not terms:
+            return []
+
+        average_length = sum(length for _, length, _ in tokenized) / len(tokenized) or 1.0
+        document_frequency = {term: sum(1 for counts, _, _ in tokenized if term in counts) for term in set(terms)}
+
+        scored = []
+        for counts, length, doc in tokenized:
+            score = 0.0
+            for term in terms:
+                frequency = counts.get(term, 0)
+                if not frequency:
+                    continue
+                idf = math.log(1 + (len(tokenized) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+            if score > 0:
+                scored.append((score, doc))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
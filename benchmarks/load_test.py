@@ -0,0 +1,398 @@
+"""
+Load test: replay a chat workload against the FastAPI app, fully offline.
+
+The app runs in process behind httpx's ASGI transport. Only the external
+services are replaced:
+
+- Azure AI Search is replaced by FakeAsyncSearchClient, seeded with chunks for
+  every folder in the workload.
+- Azure OpenAI is replaced by FakeAsyncAzureOpenAI.
+- Postgres is replaced by a temporary SQLite database, unless --database-url
+  points at a scratch database. Either way a load-test user and one folder
+  per workload folder id are created in it.
+
+Everything else is the real request path: JWT auth, the folder ownership
+query, retrieval, re-ranking, the OpenAI scheduler and the caches. The fakes
+take latency and error-rate options, so a run can model a slow or flaky
+dependency.
+
+The workload is a JSONL file of {"folder_id": ..., "query": ...} lines. It is
+replayed in order (wrapping around) by --concurrency clients, each sending
+its next request as soon as the previous one completes. Without --workload a
+synthetic one is generated; --save-workload writes it out for editing.
+
+The report covers:
+- throughput;
+- latency percentiles;
+- per-stage percentiles from the Server-Timing header;
+- event-loop lag, measured by a ticker task on the same loop as the app.
+
+The fakes' own CPU time (BM25 and cosine scoring in Python) counts towards
+loop lag, so compare runs with the same fake settings.
+
+Usage:
+    python -m benchmarks.load_test --concurrency 20 --requests 500
+    python -m benchmarks.load_test --workload queries.jsonl --search-error-rate 0.02 --output run.json
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from benchmarks.fakes import FakeAsyncAzureOpenAI, FakeAsyncSearchClient, FakeQuota, FaultModel, LatencyModel, fake_embedding
+from app.main import app
+from app.core.config import settings
+from app.core.database import Base, get_db
+from app.core.security import create_access_token, get_password_hash
+from app.models.user import User
+from app.models.folder import Folder
+from app.services.indexer_service import indexer_service
+from app.services.openai_scheduler import OpenAIScheduler
+from app.services.openai_service import openai_service
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+import httpx
+
+VOCABULARY = (
+    "revenue net income operating margin fiscal year segment cash flow liquidity "
+    "debt covenant guidance EBITDA quarter growth decline risk factors impairment "
+    "goodwill dividend buyback inventory backlog headcount lease pension tax"
+).split()
+
+QUESTIONS = [
+    "What drove {a} growth in the {b} segment?",
+    "How did {a} change year over year?",
+    "Summarize the {a} and {b} risk factors.",
+    "What is the guidance for {a}?",
+    "Explain the {a} impairment and its effect on {b}.",
+]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def synthetic_workload(folders: int, queries: int, repeat_fraction: float, seed: int) -> List[Dict[str, Any]]:
+    """Folder/query pairs where `repeat_fraction` of queries repeat an earlier one."""
+    rng = random.Random(seed)
+    workload: List[Dict[str, Any]] = []
+    for _ in range(queries):
+        if workload and rng.random() < repeat_fraction:
+            workload.append(dict(rng.choice(workload)))
+            continue
+        template = rng.choice(QUESTIONS)
+        workload.append({
+            "folder_id": rng.randint(1, folders),
+            "query": template.format(a=rng.choice(VOCABULARY), b=rng.choice(VOCABULARY))
+        })
+    return workload
+
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        workload = [json.loads(line) for line in f if line.strip()]
+    for item in workload:
+        if "folder_id" not in item or "query" not in item:
+            raise ValueError(f"Workload line needs folder_id and query: {item}")
+    return workload
+
+
+def seed_documents(folder_ids: List[int], chunks_per_folder: int, dimensions: int, seed: int) -> List[Dict[str, Any]]:
+    """Chunk documents shaped like the finance-folder-2 index, for the given folders."""
+    rng = random.Random(seed)
+    documents = []
+    for folder_id in folder_ids:
+        for i in range(chunks_per_folder):
+            text = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(150, 350)))
+            document_id = i // 10
+            documents.append({
+                "chunk_id": f"f{folder_id}_d{document_id}_c{i}",
+                "chunk": text,
+                "title": f"report-{folder_id}-{document_id}.pdf",
+                "document_id": str(document_id),
+                "parent_id": f"f{folder_id}_d{document_id}",
+                "folder_id": str(folder_id),
+                "user_id": "1",
+                "text_vector": fake_embedding(text, dimensions)
+            })
+    return documents
+
+
+async def setup_database(database_url: str, folder_ids: List[int]):
+    """
+    Create the schema (if missing), a load-test user and one folder per
+    workload folder id.
+
+    Returns:
+        Tuple of (engine, user id, workload folder id -> database folder id)
+    """
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        user = User(email=f"loadtest-{int(time.time())}@example.com", hashed_password=get_password_hash("loadtest"))
+        db.add(user)
+        await db.flush()
+
+        folders = {}
+        for folder_id in folder_ids:
+            folder = Folder(user_id=user.id, folder_name=f"Load test folder {folder_id}")
+            db.add(folder)
+            folders[folder_id] = folder
+        await db.commit()
+
+    async def get_test_db():
+        async with session_factory() as session:
+            try:
+                yield session
+            finally:
+                await session.close()
+
+    app.dependency_overrides[get_db] = get_test_db
+    return engine, user.id, {folder_id: folder.id for folder_id, folder in folders.items()}
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float, lags: List[float]) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for part in header.split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+
+async def replay(args, workload: List[Dict[str, Any]], token: str) -> Dict[str, Any]:
+    path = "/api/v1/chat/stream" if args.endpoint == "stream" else "/api/v1/chat"
+    requests = itertools.islice(itertools.cycle(workload), args.warmup + args.requests)
+    sent = itertools.count()
+
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    statuses: Dict[str, int] = {}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://loadtest",
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=args.timeout
+    ) as client:
+
+        async def send(item: Dict[str, Any]) -> str:
+            response = await client.post(path, json={"query": item["query"], "folder_id": item["folder_id"]})
+            if response.status_code != 200:
+                return str(response.status_code)
+            if args.endpoint == "stream" and '"type": "error"' in response.text:
+                return "stream_error"
+            for stage, ms in parse_server_timing(response.headers.get("server-timing", "")).items():
+                stages.setdefault(stage, []).append(ms)
+            return "200"
+
+        async def worker() -> None:
+            for item in requests:
+                number = next(sent)
+                started = time.perf_counter()
+                try:
+                    outcome = await send(item)
+                except Exception as e:
+                    outcome = type(e).__name__
+                if number < args.warmup:
+                    continue
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[outcome] = statuses.get(outcome, 0) + 1
+
+        stop = asyncio.Event()
+        lags: List[float] = []
+        ticker = asyncio.create_task(measure_loop_lag(stop, args.tick_ms / 1000, lags))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        await ticker
+
+    return {
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 1),
+            "p95": round(percentile(latencies, 0.95), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(lags, 0.50), 2),
+            "p99": round(percentile(lags, 0.99), 2),
+            "max": round(max(lags), 2) if lags else 0.0
+        },
+        "stages_ms": {
+            stage: {"p50": round(percentile(values, 0.50), 1), "p95": round(percentile(values, 0.95), 1)}
+            for stage, values in stages.items()
+        }
+    }
+
+
+def install_fakes(args, documents: List[Dict[str, Any]]):
+    search_client = FakeAsyncSearchClient(
+        documents,
+        latency=LatencyModel(
+            args.search_ms, jitter_ms=args.search_ms / 5,
+            tail_fraction=args.tail_fraction, tail_ms=args.search_ms * args.tail_multiplier, seed=args.seed
+        ),
+        faults=FaultModel(args.search_error_rate, seed=args.seed)
+    )
+    openai_client = FakeAsyncAzureOpenAI(
+        embedding_latency=LatencyModel(
+            args.embedding_ms, jitter_ms=args.embedding_ms / 5,
+            tail_fraction=args.tail_fraction, tail_ms=args.embedding_ms * args.tail_multiplier, seed=args.seed + 1
+        ),
+        dimensions=args.dimensions,
+        chat_latency=LatencyModel(
+            args.chat_ms, jitter_ms=args.chat_ms / 5,
+            tail_fraction=args.tail_fraction, tail_ms=args.chat_ms * args.tail_multiplier, seed=args.seed + 2
+        ),
+        token_latency=LatencyModel(args.token_ms, seed=args.seed + 3),
+        completion_tokens=args.completion_tokens,
+        chat_quota=FakeQuota(args.tpm, args.rpm) if args.tpm else None,
+        faults=FaultModel(args.openai_error_rate, seed=args.seed + 4)
+    )
+
+    indexer_service._search_client = search_client
+    openai_service.client = openai_client
+    # Without a quota the scheduler would only pace calls against the
+    # production TPM settings, which measures the quota rather than the app
+    openai_service.scheduler = OpenAIScheduler(
+        {settings.AZURE_OPENAI_DEPLOYMENT: {"tpm": args.tpm or 0, "rpm": args.rpm}},
+        enabled=bool(args.tpm)
+    )
+
+    if args.no_caches:
+        settings.ANSWER_CACHE_ENABLED = False
+        settings.SINGLE_FLIGHT_ENABLED = False
+        settings.RETRIEVAL_CACHE_ENABLED = False
+
+    return search_client, openai_client
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    latency, lag = report["latency_ms"], report["loop_lag_ms"]
+    print(
+        f"endpoint={report['endpoint']} concurrency={report['concurrency']} "
+        f"requests={report['requests']} elapsed={report['elapsed_s']:.1f}s"
+    )
+    print(f"throughput      {report['throughput_rps']:.1f} req/s")
+    print(f"statuses        {report['statuses']}")
+    print(f"latency ms      p50={latency['p50']:.1f} p95={latency['p95']:.1f} p99={latency['p99']:.1f} max={latency['max']:.1f}")
+    print(f"loop lag ms     p50={lag['p50']:.2f} p99={lag['p99']:.2f} max={lag['max']:.2f}")
+    if report["stages_ms"]:
+        print(f"{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}")
+        for stage, values in report["stages_ms"].items():
+            print(f"{stage:<16}{values['p50']:>10.1f}{values['p95']:>10.1f}")
+    print(
+        f"fake calls      search={report['fake_calls']['search']} embeddings={report['fake_calls']['embeddings']} "
+        f"chat={report['fake_calls']['chat']}"
+    )
+
+
+async def run(args) -> None:
+    if args.workload:
+        workload = load_workload(args.workload)
+    else:
+        workload = synthetic_workload(args.folders, args.queries, args.repeat_fraction, args.seed)
+    if args.save_workload:
+        with open(args.save_workload, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(item) + "\n" for item in workload)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(directory, 'loadtest.db')}"
+        engine, user_id, folders = await setup_database(
+            database_url, sorted({int(item["folder_id"]) for item in workload})
+        )
+        try:
+            # Workload folder ids are labels; send the ids of the folders created for them
+            workload = [{**item, "folder_id": folders[int(item["folder_id"])]} for item in workload]
+            search_client, openai_client = install_fakes(
+                args, seed_documents(sorted(folders.values()), args.chunks_per_folder, args.dimensions, args.seed)
+            )
+            report = await replay(args, workload, create_access_token({"sub": str(user_id)}))
+        finally:
+            await engine.dispose()
+
+    report["fake_calls"] = {
+        "search": search_client.search_requests,
+        "embeddings": openai_client.embedding_requests,
+        "chat": openai_client.chat_requests
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", help="JSONL file of {folder_id, query} lines")
+    parser.add_argument("--save-workload", help="Write the replayed workload to this JSONL file")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests sent first")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--tick-ms", type=float, default=10.0, help="Loop-lag ticker interval")
+    parser.add_argument("--output", help="Write the report as JSON, for comparing runs")
+    parser.add_argument("--database-url", help="Async SQLAlchemy URL (default: temporary SQLite); a user and folders are added")
+    parser.add_argument("--no-caches", action="store_true", help="Disable the answer and retrieval caches and request coalescing")
+
+    synthetic = parser.add_argument_group("synthetic workload and index")
+    synthetic.add_argument("--folders", type=int, default=5)
+    synthetic.add_argument("--queries", type=int, default=200, help="Distinct workload lines")
+    synthetic.add_argument("--repeat-fraction", type=float, default=0.2, help="Share of queries repeating earlier ones")
+    synthetic.add_argument("--chunks-per-folder", type=int, default=100)
+    synthetic.add_argument("--dimensions", type=int, default=256, help="Embedding dimensions")
+    synthetic.add_argument("--seed", type=int, default=7)
+
+    fakes = parser.add_argument_group("fake services")
+    fakes.add_argument("--search-ms", type=float, default=60.0)
+    fakes.add_argument("--embedding-ms", type=float, default=40.0)
+    fakes.add_argument("--chat-ms", type=float, default=400.0, help="Time to first token")
+    fakes.add_argument("--token-ms", type=float, default=5.0, help="Time per generated token")
+    fakes.add_argument("--completion-tokens", type=int, default=150)
+    fakes.add_argument("--tail-fraction", type=float, default=0.01, help="Share of slow calls per service")
+    fakes.add_argument("--tail-multiplier", type=float, default=10.0, help="Extra latency of a slow call, in base latencies")
+    fakes.add_argument("--search-error-rate", type=float, default=0.0)
+    fakes.add_argument("--openai-error-rate", type=float, default=0.0)
+    fakes.add_argument("--tpm", type=int, help="Enforce a chat TPM quota (and schedule against it)")
+    fakes.add_argument("--rpm", type=int, default=720)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
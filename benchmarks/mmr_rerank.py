@@ -0,0 +1,126 @@
+"""
+Benchmark: cost and effect of MMR re-ranking over the candidate pool.
+
+Builds a pool of chunk vectors in which groups of candidates are
+near-duplicates (overlapping chunks of the same page), then selects `top`
+chunks with the NumPy MMR used by the reranker and with a pure-Python version
+of the same algorithm. Reports time per re-rank at each pool size, plus how
+redundant the selected chunks are compared to plain top-k by relevance.
+
+"numpy ms" includes converting the JSON float lists returned by search into
+an array, which dominates at large pools; "array ms" is the selection alone.
+
+Usage:
+    python -m benchmarks.mmr_rerank --pools 50 200 1000 --dims 1536 --top 5
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from app.services.reranker import mmr_select, normalize_rows
+import argparse
+import math
+import time
+import numpy as np
+
+
+def make_pool(size: int, dims: int, duplicates: int, seed: int):
+    """Query plus `size` candidates in groups of `duplicates` near-identical vectors."""
+    rng = np.random.default_rng(seed)
+    query = rng.normal(size=dims)
+
+    groups = math.ceil(size / duplicates)
+    # Each group's base vector leans towards the query by a different amount
+    bases = normalize_rows(rng.normal(size=(groups, dims))) + np.linspace(0.6, 0.0, groups)[:, None] * (
+        query / np.linalg.norm(query)
+    )
+    pool = np.repeat(bases, duplicates, axis=0)[:size]
+    pool = pool + rng.normal(scale=0.3 / math.sqrt(dims), size=pool.shape)
+    return query.tolist(), pool.tolist()
+
+
+def python_mmr(query, candidates, k, lambda_mult):
+    """Reference MMR in pure Python, as it would be written without NumPy."""
+    def unit(vector):
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def dot(a, b):
+        return sum(x * y for x, y in zip(a, b))
+
+    query = unit(query)
+    candidates = [unit(candidate) for candidate in candidates]
+    relevance = [dot(query, candidate) for candidate in candidates]
+    max_similarity = [-math.inf] * len(candidates)
+    selected = []
+
+    for _ in range(min(k, len(candidates))):
+        best, best_score = None, -math.inf
+        for index in range(len(candidates)):
+            if index in selected:
+                continue
+            score = relevance[index] if not selected else (
+                lambda_mult * relevance[index] - (1 - lambda_mult) * max_similarity[index]
+            )
+            if score > best_score:
+                best, best_score = index, score
+        selected.append(best)
+        for index, candidate in enumerate(candidates):
+            max_similarity[index] = max(max_similarity[index], dot(candidate, candidates[best]))
+
+    return selected
+
+
+def mean_pairwise_similarity(pool: np.ndarray, indexes) -> float:
+    chosen = pool[list(indexes)]
+    similarity = chosen @ chosen.T
+    count = len(indexes)
+    return float((similarity.sum() - np.trace(similarity)) / (count * (count - 1))) if count > 1 else 0.0
+
+
+def time_call(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pools", type=int, nargs="+", default=[50, 200, 1000], help="Candidate pool sizes")
+    parser.add_argument("--dims", type=int, default=1536, help="Embedding dimensions")
+    parser.add_argument("--top", type=int, default=5, help="Chunks selected")
+    parser.add_argument("--duplicates", type=int, default=4, help="Near-duplicate chunks per group")
+    parser.add_argument("--lambda-mult", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=20, help="Timing iterations")
+    parser.add_argument("--skip-python", action="store_true", help="Don't time the pure-Python reference")
+    args = parser.parse_args()
+
+    print(f"dims={args.dims} top={args.top} lambda={args.lambda_mult} duplicates/group={args.duplicates}")
+    print(f"{'pool':>6}{'numpy ms':>10}{'array ms':>10}{'python ms':>11}{'top-k sim':>11}{'mmr sim':>9}")
+
+    for size in args.pools:
+        query, candidates = make_pool(size, args.dims, args.duplicates, seed=size)
+        unit_pool = normalize_rows(np.asarray(candidates, dtype=np.float32))
+
+        numpy_ms = time_call(lambda: mmr_select(query, candidates, args.top, args.lambda_mult), args.repeat)
+        array_ms = time_call(lambda: mmr_select(query, unit_pool, args.top, args.lambda_mult), args.repeat)
+        selected = mmr_select(query, candidates, args.top, args.lambda_mult)
+
+        python_ms = float("nan")
+        if not args.skip_python:
+            python_ms = time_call(lambda: python_mmr(query, candidates, args.top, args.lambda_mult), 1)
+
+        relevance = unit_pool @ (np.asarray(query) / np.linalg.norm(query))
+        top_k = np.argsort(-relevance)[:args.top]
+
+        print(
+            f"{size:>6}{numpy_ms:>10.2f}{array_ms:>10.2f}{python_ms:>11.1f}"
+            f"{mean_pairwise_similarity(unit_pool, top_k):>11.3f}"
+            f"{mean_pairwise_similarity(unit_pool, selected):>9.3f}"
+        )
+
+    print("sim = mean pairwise cosine similarity of the selected chunks (lower is more distinct)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Benchmark: chat throughput against a TPM/RPM-limited deployment.
+
+Many clients send RAG completions back to back to a fake deployment that
+enforces its quota like Azure does (429 with retry-after once the window is
+full). Half the clients are interactive, half are batch.
+
+- sdk-retry: no scheduler; each rejected call sleeps for retry-after and
+  retries on its own (the SDK's behaviour, up to 2 retries)
+- scheduler: calls are admitted by OpenAIScheduler against the quota, in
+  priority order
+
+Usage:
+    python -m benchmarks.openai_quota --clients 30 --duration 30 --tpm 120000
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from benchmarks.fakes import FakeAsyncAzureOpenAI, FakeQuota, LatencyModel
+from app.services.openai_service import OpenAIService
+from app.services.openai_scheduler import OpenAIScheduler, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from app.services.tokenizer import count_message_tokens
+from app.core.config import settings
+from openai import RateLimitError
+import argparse
+import asyncio
+import statistics
+import time
+
+CONTEXT = [
+    {
+        "chunk_id": f"chunk{i}",
+        "title": f"10-K-{i}.pdf",
+        "content": "Net revenue increased due to higher volumes in the services segment. " * 40,
+        "score": 1.0 - i / 10
+    }
+    for i in range(4)
+]
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_scenario(name: str, args, use_scheduler: bool) -> dict:
+    quota = FakeQuota(args.tpm, args.rpm)
+    client = FakeAsyncAzureOpenAI(
+        chat_latency=LatencyModel(args.latency_ms, jitter_ms=args.latency_ms / 10),
+        completion_tokens=args.completion_tokens,
+        chat_quota=quota
+    )
+    scheduler = OpenAIScheduler(
+        {settings.AZURE_OPENAI_DEPLOYMENT: {"tpm": args.tpm, "rpm": args.rpm}},
+        enabled=use_scheduler
+    )
+    service = OpenAIService(client=client, scheduler=scheduler)
+
+    latencies = {PRIORITY_INTERACTIVE: [], PRIORITY_BATCH: []}
+    completions: list = []
+    failed = 0
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    async def request() -> None:
+        if use_scheduler:
+            await service.generate_response_with_usage("What drove revenue?", CONTEXT, max_tokens=args.max_tokens)
+            return
+
+        for attempt in range(3):
+            try:
+                await service.generate_response_with_usage("What drove revenue?", CONTEXT, max_tokens=args.max_tokens)
+                return
+            except RateLimitError as e:
+                if attempt == 2:
+                    raise
+                await asyncio.sleep(float(e.response.headers["retry-after-ms"]) / 1000)
+
+    async def client_loop(priority: int) -> None:
+        nonlocal failed
+        with scheduler.priority(priority):
+            while time.perf_counter() < deadline:
+                sent = time.perf_counter()
+                try:
+                    await request()
+                except RateLimitError:
+                    failed += 1
+                    continue
+                finished = time.perf_counter()
+                latencies[priority].append(finished - sent)
+                completions.append(finished - started)
+
+    await asyncio.gather(*(
+        client_loop(PRIORITY_INTERACTIVE if i % 2 == 0 else PRIORITY_BATCH)
+        for i in range(args.clients)
+    ))
+    elapsed = time.perf_counter() - started
+
+    # Completions per window, to show steady vs oscillating throughput
+    windows = [0] * (int(elapsed // args.window) + 1)
+    for finished in completions:
+        windows[int(finished // args.window)] += 1
+    windows = windows[:-1] or windows
+
+    stats = scheduler.get_deployment(settings.AZURE_OPENAI_DEPLOYMENT).stats() if use_scheduler else {}
+
+    return {
+        "name": name,
+        "completed": len(completions),
+        "failed": failed,
+        "rejected_429": quota.rejected,
+        "per_minute": len(completions) * 60 / elapsed,
+        "interactive_p95": percentile(latencies[PRIORITY_INTERACTIVE], 0.95),
+        "batch_p95": percentile(latencies[PRIORITY_BATCH], 0.95),
+        "window_min": min(windows),
+        "window_max": max(windows),
+        "window_stdev": statistics.pstdev(windows),
+        "queue_wait_p95_ms": stats.get("queue_wait_p95_ms", 0.0),
+        "utilization": stats.get("token_utilization")
+    }
+
+
+async def run(args) -> None:
+    results = [
+        await run_scenario("sdk-retry", args, use_scheduler=False),
+        await run_scenario("scheduler", args, use_scheduler=True),
+    ]
+
+    service = OpenAIService(client=FakeAsyncAzureOpenAI())
+    messages = service.build_messages("What drove revenue?", CONTEXT)
+    request_tokens = count_message_tokens(messages) + args.max_tokens
+
+    print(
+        f"clients={args.clients} duration={args.duration}s tpm={args.tpm} rpm={args.rpm} "
+        f"tokens/request={request_tokens} (quota allows ~{args.tpm / request_tokens:.0f} requests/min)"
+    )
+    print(
+        f"{'mode':<11}{'done':>6}{'failed':>8}{'429s':>7}{'req/min':>9}"
+        f"{'inter p95 s':>13}{'batch p95 s':>13}{f'per {args.window:g}s min/max':>18}{'stdev':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['name']:<11}{r['completed']:>6}{r['failed']:>8}{r['rejected_429']:>7}{r['per_minute']:>9.1f}"
+            f"{r['interactive_p95']:>13.2f}{r['batch_p95']:>13.2f}"
+            f"{str(r['window_min']) + '/' + str(r['window_max']):>18}{r['window_stdev']:>7.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=30, help="Concurrent clients (half batch)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run each mode")
+    parser.add_argument("--tpm", type=int, default=120000)
+    parser.add_argument("--rpm", type=int, default=720)
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Fake completion latency")
+    parser.add_argument("--window", type=float, default=5.0, help="Throughput window for min/max")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
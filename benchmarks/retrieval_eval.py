@@ -0,0 +1,302 @@
+"""
+Retrieval evaluation: recall@k, MRR and latency per retrieval configuration.
+
+The golden set is a JSONL file, one question per line:
+
+    {"folder_id": 3, "question": "What drove services revenue?",
+     "expected": [{"document_id": "41", "page": 2}, {"document_id": "44"}]}
+
+An expected entry without "page" matches any chunk of the document. Pages
+are read from SplitSkill chunk ids ("..._pages_<n>"). Each question is
+embedded once. Then every configuration runs RAGService.retrieve_with_metadata
+(the same path /chat uses) with that embedding. The latency column is
+therefore search, fusion, depth selection and re-ranking, without the
+embedding call.
+
+Configurations set RETRIEVAL_MODE, RERANK_ENABLED and ADAPTIVE_DEPTH_ENABLED,
+plus the fixed top used when adaptive depth is off. See CONFIGURATIONS. The
+tokens column is the average size of the kept chunks, i.e. the context the
+model would be sent. The synthetic golden set is all single-fact lookups, so
+adaptive configurations should keep fewer tokens than rrf-top5 there.
+
+Indexes:
+- local (default): FakeAsyncSearchClient over --corpus. The corpus is a JSONL
+  of chunk documents with chunk_id, chunk, title, document_id, parent_id and
+  folder_id. Without --corpus, a synthetic corpus and golden set are
+  generated. Embeddings are bag-of-words hashes (hashed_embedding), so
+  relative comparisons are meaningful but absolute recall is not.
+  Latencies include no network time.
+- azure: the configured index and embedding deployment. Run with
+  BENCHMARK_LIVE=1 so the real settings are used. This makes one embedding
+  call per question and one search call per question per configuration.
+
+Usage:
+    python -m benchmarks.retrieval_eval
+    python -m benchmarks.retrieval_eval --corpus chunks.jsonl --golden golden.jsonl
+    BENCHMARK_LIVE=1 python -m benchmarks.retrieval_eval --index azure --golden golden.jsonl --output eval.json
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from benchmarks.fakes import FakeAsyncAzureOpenAI, FakeAsyncSearchClient, LatencyModel, hashed_embedding
+from app.core.config import settings
+from app.services.indexer_service import indexer_service
+from app.services.openai_scheduler import OpenAIScheduler
+from app.services.openai_service import openai_service
+from app.services.rag_service import rag_service
+from app.services.tokenizer import count_tokens
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+
+KS = (1, 3, 5, 10)
+
+# name -> (settings overrides, top used when adaptive depth is off)
+CONFIGURATIONS: Dict[str, Tuple[Dict[str, Any], int]] = {
+    "service-top5": ({"RETRIEVAL_MODE": "service", "RERANK_ENABLED": False, "ADAPTIVE_DEPTH_ENABLED": False}, 5),
+    "rrf-top5": ({"RETRIEVAL_MODE": "rrf", "RERANK_ENABLED": False, "ADAPTIVE_DEPTH_ENABLED": False}, 5),
+    "rrf-top10": ({"RETRIEVAL_MODE": "rrf", "RERANK_ENABLED": False, "ADAPTIVE_DEPTH_ENABLED": False}, 10),
+    "rrf-mmr-top5": ({"RETRIEVAL_MODE": "rrf", "RERANK_ENABLED": True, "ADAPTIVE_DEPTH_ENABLED": False}, 5),
+    "rrf-adaptive": ({"RETRIEVAL_MODE": "rrf", "RERANK_ENABLED": False, "ADAPTIVE_DEPTH_ENABLED": True}, 5),
+    "rrf-mmr-adaptive": ({"RETRIEVAL_MODE": "rrf", "RERANK_ENABLED": True, "ADAPTIVE_DEPTH_ENABLED": True}, 5),
+}
+
+_PAGE = re.compile(r"_pages_(\d+)$")
+
+FILLER = (
+    "the company reported results for the fiscal year including revenue margin cash "
+    "flow segment operations guidance outlook risk liquidity capital expenditure"
+).split()
+METRICS = ["revenue", "margin", "backlog", "headcount", "impairment", "dividend", "capex", "inventory"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_jsonl(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synthetic_corpus(folders: int, documents: int, pages: int, seed: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Filings with one distinctive fact per page, plus questions about those facts.
+
+    Neighbouring pages share filler text (like SplitSkill's page overlap), and
+    every fact is asked about with different wording than the page uses.
+
+    Returns:
+        Tuple of (chunk documents, golden questions)
+    """
+    rng = random.Random(seed)
+    chunks, golden = [], []
+
+    def word() -> str:
+        return "".join(rng.choice("bdfgklmnprstvz") + rng.choice("aeiou") for _ in range(3))
+
+    for folder_id in range(1, folders + 1):
+        for document in range(documents):
+            document_id = f"{folder_id}{document:03d}"
+            parent_id = f"doc{document_id}"
+            entity = word()
+            filler = [rng.choice(FILLER) for _ in range(pages * 120 + 40)]
+            for page in range(pages):
+                metric = rng.choice(METRICS)
+                amount = rng.randint(2, 40)
+                fact = f"{entity} {metric} increased {amount} percent driven by {word()} demand"
+                # 40 filler words overlap with the next page
+                text = " ".join(filler[page * 120:page * 120 + 80]) + f" {fact} " + " ".join(filler[page * 120 + 80:page * 120 + 160])
+                chunks.append({
+                    "chunk_id": f"{parent_id}_pages_{page}",
+                    "chunk": text,
+                    "title": f"{entity}-10K.pdf",
+                    "document_id": document_id,
+                    "parent_id": parent_id,
+                    "folder_id": str(folder_id),
+                    "user_id": "1"
+                })
+                golden.append({
+                    "folder_id": folder_id,
+                    "question": f"How much did {entity} {metric} grow and why?",
+                    "expected": [{"document_id": document_id, "page": page}]
+                })
+
+    rng.shuffle(golden)
+    return chunks, golden
+
+
+def is_relevant(result: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    if str(result.get("document_id")) != str(expected["document_id"]):
+        return False
+    if expected.get("page") is None:
+        return True
+    match = _PAGE.search(result.get("chunk_id") or "")
+    return match is not None and int(match.group(1)) == int(expected["page"])
+
+
+def score_question(results: List[Dict[str, Any]], expected: List[Dict[str, Any]]) -> Dict[str, float]:
+    """recall@k (share of expected items found in the first k results) and reciprocal rank."""
+    first_hit: List[Optional[int]] = []
+    for item in expected:
+        rank = next((i for i, result in enumerate(results, 1) if is_relevant(result, item)), None)
+        first_hit.append(rank)
+
+    scores = {
+        f"recall@{k}": sum(1 for rank in first_hit if rank is not None and rank <= k) / len(expected)
+        for k in KS
+    }
+    found = [rank for rank in first_hit if rank is not None]
+    scores["rr"] = 1.0 / min(found) if found else 0.0
+    return scores
+
+
+@contextmanager
+def configuration(overrides: Dict[str, Any], top: int) -> Iterator[None]:
+    """Apply settings overrides and the fixed top for the duration of the block."""
+    previous = {name: getattr(settings, name) for name in overrides}
+    previous_top = rag_service.top
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    rag_service.top = top
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(settings, name, value)
+        rag_service.top = previous_top
+
+
+async def evaluate(name: str, golden: List[Dict[str, Any]], embeddings: List[List[float]], concurrency: int) -> Dict[str, Any]:
+    overrides, top = CONFIGURATIONS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    scores: List[Dict[str, float]] = []
+    latencies: List[float] = []
+    depths: List[int] = []
+    tokens: List[int] = []
+
+    async def run_one(item: Dict[str, Any], embedding: List[float]) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            results, metadata = await rag_service.retrieve_with_metadata(
+                item["question"], int(item["folder_id"]), query_embedding=embedding
+            )
+            latencies.append((time.perf_counter() - started) * 1000)
+            depths.append(metadata["retrieval_depth"])
+            tokens.append(sum(count_tokens(result.get("content") or "") for result in results))
+            scores.append(score_question(results, item["expected"]))
+
+    with configuration(overrides, top):
+        await asyncio.gather(*(run_one(item, embedding) for item, embedding in zip(golden, embeddings)))
+
+    row = {"config": name}
+    for key in [f"recall@{k}" for k in KS] + ["rr"]:
+        row["mrr" if key == "rr" else key] = round(sum(score[key] for score in scores) / len(scores), 4)
+    row.update({
+        "avg_depth": round(sum(depths) / len(depths), 2),
+        "avg_tokens": round(sum(tokens) / len(tokens), 1),
+        "latency_p50_ms": round(percentile(latencies, 0.50), 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95), 1),
+        "latency_p99_ms": round(percentile(latencies, 0.99), 1)
+    })
+    return row
+
+
+def install_local_index(chunks: List[Dict[str, Any]], args) -> None:
+    documents = [
+        {**chunk, "text_vector": chunk.get("text_vector") or hashed_embedding(chunk["chunk"], args.dimensions)}
+        for chunk in chunks
+    ]
+    indexer_service._search_client = FakeAsyncSearchClient(documents, latency=LatencyModel(args.search_ms))
+    openai_service.client = FakeAsyncAzureOpenAI(dimensions=args.dimensions, embedding_fn=hashed_embedding)
+    openai_service.scheduler = OpenAIScheduler({}, enabled=False)
+
+
+async def run(args) -> None:
+    if args.index == "local":
+        if args.corpus:
+            chunks = read_jsonl(args.corpus)
+            golden = read_jsonl(args.golden) if args.golden else None
+        else:
+            chunks, golden = synthetic_corpus(args.folders, args.documents, args.pages, args.seed)
+            golden = read_jsonl(args.golden) if args.golden else golden
+        if golden is None:
+            raise SystemExit("--golden is required with --corpus")
+        install_local_index(chunks, args)
+    else:
+        if not args.golden:
+            raise SystemExit("--golden is required with --index azure")
+        golden = read_jsonl(args.golden)
+
+    if args.limit:
+        golden = golden[:args.limit]
+
+    # Configurations repeat the same searches; measure the index, not the cache
+    settings.RETRIEVAL_CACHE_ENABLED = False
+
+    embeddings = await openai_service.generate_embeddings([item["question"] for item in golden])
+
+    names = args.configs.split(",") if args.configs else list(CONFIGURATIONS)
+    unknown = [name for name in names if name not in CONFIGURATIONS]
+    if unknown:
+        raise SystemExit(f"Unknown configurations: {', '.join(unknown)} (choose from {', '.join(CONFIGURATIONS)})")
+
+    rows = [await evaluate(name, golden, embeddings, args.concurrency) for name in names]
+
+    try:
+        await indexer_service.close()
+    except Exception:
+        pass
+
+    print(f"index={args.index} questions={len(golden)}")
+    print(
+        f"{'config':<18}" + "".join(f"{f'R@{k}':>7}" for k in KS)
+        + f"{'MRR':>7}{'depth':>7}{'tokens':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    for row in rows:
+        print(
+            f"{row['config']:<18}" + "".join(f"{row[f'recall@{k}']:>7.3f}" for k in KS)
+            + f"{row['mrr']:>7.3f}{row['avg_depth']:>7.1f}{row['avg_tokens']:>8.0f}"
+            f"{row['latency_p50_ms']:>9.1f}{row['latency_p95_ms']:>9.1f}{row['latency_p99_ms']:>9.1f}"
+        )
+    print("R@k with adaptive depth counts only the chunks actually kept (see depth)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"index": args.index, "questions": len(golden), "results": rows}, f, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", choices=["local", "azure"], default="local")
+    parser.add_argument("--golden", help="JSONL golden set of {folder_id, question, expected}")
+    parser.add_argument("--corpus", help="JSONL chunk documents for the local index")
+    parser.add_argument("--configs", help=f"Comma-separated subset of: {', '.join(CONFIGURATIONS)}")
+    parser.add_argument("--limit", type=int, help="Evaluate only the first N questions")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions in flight per configuration")
+    parser.add_argument("--output", help="Write the results as JSON")
+
+    local = parser.add_argument_group("local index")
+    local.add_argument("--search-ms", type=float, default=0.0, help="Simulated search latency")
+    local.add_argument("--dimensions", type=int, default=512)
+    local.add_argument("--folders", type=int, default=2, help="Synthetic corpus folders")
+    local.add_argument("--documents", type=int, default=10, help="Synthetic documents per folder")
+    local.add_argument("--pages", type=int, default=8, help="Synthetic pages per document")
+    local.add_argument("--seed", type=int, default=7)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
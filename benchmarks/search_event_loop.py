@@ -0,0 +1,102 @@
+"""
+Benchmark: event-loop responsiveness while searches are in flight.
+
+Compares the old pattern (a synchronous SearchClient called inside an async
+handler, which blocks the loop for the whole round trip) with IndexerService
+on the async client. A ticker task measures how late the loop wakes it up;
+with a blocking client the lag grows with search latency times concurrency.
+
+Usage:
+    python -m benchmarks.search_event_loop --searches 50 --latency-ms 80
+"""
+
+import benchmarks  # noqa: F401  (placeholder settings)
+
+from benchmarks.fakes import FakeAsyncSearchClient, LatencyModel, fake_embedding
+from app.services.indexer_service import IndexerService
+import argparse
+import asyncio
+import statistics
+import time
+
+
+class BlockingSearchClient:
+    """Synchronous client stand-in: sleeps on the calling thread like a blocking HTTP call."""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def search(self, **kwargs) -> list:
+        time.sleep(self.latency.sample())
+        return []
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float, lags: list) -> None:
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+async def run_scenario(name: str, search_fn, searches: int, tick_interval: float) -> dict:
+    stop = asyncio.Event()
+    lags: list = []
+    ticker = asyncio.create_task(measure_loop_lag(stop, tick_interval, lags))
+    await asyncio.sleep(tick_interval * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(search_fn(i) for i in range(searches)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+
+    lags.sort()
+    return {
+        "name": name,
+        "elapsed_s": elapsed,
+        "lag_p50_ms": statistics.median(lags) if lags else 0.0,
+        "lag_max_ms": lags[-1] if lags else 0.0
+    }
+
+
+async def run(args) -> None:
+    latency = LatencyModel(args.latency_ms, jitter_ms=args.jitter_ms)
+    vector = fake_embedding("benchmark query", 64)
+
+    blocking_client = BlockingSearchClient(latency)
+
+    async def blocking_search(i: int):
+        # What the old IndexerService did: sync call + iteration on the event loop
+        return list(blocking_client.search(search_text="revenue", filter="folder_id eq '1'", top=5))
+
+    service = IndexerService(search_client=FakeAsyncSearchClient(latency=latency))
+
+    async def async_search(i: int):
+        return await service.search_with_folder_filter("revenue", vector, folder_id=1, top=5)
+
+    results = [
+        await run_scenario("blocking", blocking_search, args.searches, args.tick_ms / 1000),
+        await run_scenario("async", async_search, args.searches, args.tick_ms / 1000),
+    ]
+
+    print(f"searches={args.searches} latency={args.latency_ms}ms tick={args.tick_ms}ms")
+    print(f"{'client':<10}{'wall s':>9}{'lag p50 ms':>12}{'lag max ms':>12}")
+    for result in results:
+        print(
+            f"{result['name']:<10}{result['elapsed_s']:>9.2f}"
+            f"{result['lag_p50_ms']:>12.1f}{result['lag_max_ms']:>12.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--searches", type=int, default=50, help="Concurrent searches")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="Fake search latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--tick-ms", type=float, default=5.0, help="Loop-lag probe interval")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
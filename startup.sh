@@ -11,7 +11,7 @@ alembic upgrade head
 # Start the application with Gunicorn
 echo "Starting Gunicorn server..."
 gunicorn app.main:app \
-    --workers 4 \
+    --workers ${WEB_CONCURRENCY:-4} \
     --worker-class uvicorn.workers.UvicornWorker \
     --bind 0.0.0.0:8000 \
     --timeout 120 \
@@ -16,6 +16,7 @@ Workflow:
 from azure.servicebus.aio import ServiceBusClient
 from azure.servicebus import ServiceBusMessage
 from app.services.indexer_service import indexer_service
+from app.services.folder_generations import folder_generations
 from app.core.database import AsyncSessionLocal
 from app.core.config import settings
 from app.models.document import Document, DocumentStatus
@@ -123,11 +124,13 @@ class DocumentIndexingWorker:
             success = await self.wait_for_indexing(document_id, blob_name)
 
             if success:
-                # Update status to INDEXED
+                # Update status to INDEXED; new chunks are searchable now,
+                # so folder-scoped caches are invalidated in the same commit
                 await self.update_document_status(
                     document_id,
                     DocumentStatus.INDEXED,
-                    error_message=None
+                    error_message=None,
+                    bump_folder_id=folder_id
                 )
 
                 # Complete message (delete from queue)
@@ -253,19 +256,7 @@ class DocumentIndexingWorker:
             True if chunks exist, False otherwise
         """
         try:
-            # Search for chunks with this document_id
-            results = indexer_service.search_client.search(
-                search_text="*",
-                filter=f"document_id eq '{document_id}'",
-                select=["chunk_id"],
-                top=1  # Just need to know if any exist
-            )
-
-            # Check if any results
-            for _ in results:
-                return True
-
-            return False
+            return await indexer_service.has_document_chunks(document_id)
 
         except Exception as e:
             logger.error(f"Error checking chunks for document {document_id}: {str(e)}")
@@ -275,7 +266,8 @@ class DocumentIndexingWorker:
         self,
         document_id: int,
         status: DocumentStatus,
-        error_message: str = None
+        error_message: str = None,
+        bump_folder_id: int = None
     ):
         """
         Update document status in PostgreSQL.
@@ -284,6 +276,7 @@ class DocumentIndexingWorker:
             document_id: Document ID to update
             status: New status
             error_message: Optional error message for FAILED status
+            bump_folder_id: Optional folder whose generation is bumped in the same commit
         """
         try:
             async with AsyncSessionLocal() as session:
@@ -303,7 +296,13 @@ class DocumentIndexingWorker:
                 if error_message:
                     document.error_message = error_message
 
+                generation = None
+                if bump_folder_id is not None:
+                    generation = await folder_generations.bump(session, bump_folder_id)
+
                 await session.commit()
+                if bump_folder_id is not None:
+                    folder_generations.observe(bump_folder_id, generation)
 
                 logger.info(
                     f"Updated document {document_id} status: {old_status} → {status}"